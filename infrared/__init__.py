@@ -3,7 +3,23 @@ import os
 from pbr import version as pbr_version
 import platform
 
-_v = pbr_version.VersionInfo("infrared").semantic_version()
+
+def _get_semantic_version():
+    """Gets infrared version.
+
+    The version is read from the installed package metadata when possible,
+    which is much faster than letting pbr search for it (pbr imports
+    pkg_resources and may end up parsing the git history).
+    """
+    try:
+        from importlib import metadata
+        return pbr_version.SemanticVersion.from_pip_string(
+            metadata.version("infrared"))
+    except Exception:
+        return pbr_version.VersionInfo("infrared").semantic_version()
+
+
+_v = _get_semantic_version()
 __version__ = _v.release_string()
 version_info = _v.version_tuple()
 
@@ -51,6 +67,12 @@ SHARED_GROUPS = [
                         'For example, '
                         '--ansible-args="tags=tagging,overcloud;forks=500"',
                 'type': 'AdditionalArgs'
+            },
+            'ssh-warmup': {
+                'action': 'store_true',
+                'help': 'Open the SSH connections to all the hosts '
+                        'targeted by the playbook plays in parallel before the playbook starts and fail if '
+                        'any host is unreachable'
             }
         }
     },
@@ -71,6 +93,27 @@ SHARED_GROUPS = [
                 'help': 'Only generate settings, '
                         'skip the playbook execution stage'
             },
+            'incremental': {
+                'action': 'store_true',
+                'help': 'Skip the playbook execution stage when the last '
+                        'run of the plugin in the workspace with the same '
+                        'settings, ansible-args, plugin files and '
+                        'inventory made with --incremental has passed (a '
+                        'resumed run is not taken for the full one)'
+            },
+            'force': {
+                'action': 'store_true',
+                'help': 'Execute the playbook even if the --incremental '
+                        'run would skip it'
+            },
+            'resume': {
+                'action': 'store_true',
+                'help': 'Resume the last failed (or interrupted) run of the '
+                        'plugin in the workspace from the failed task, with '
+                        'the facts set by the run restored on their hosts '
+                        '(the checkpoints are disabled by the '
+                        'IR_CHECKPOINT=no environment variable)'
+            },
             'extra-vars': {
                 'action': 'append',
                 'help': 'Extra variables to be merged last',
@@ -83,6 +126,14 @@ SHARED_GROUPS = [
                 'short': 'o',
                 'type': 'str'
             },
+            'explain-var': {
+                'action': 'append',
+                'help': 'Print the value of the variable (dot separated '
+                        'path in the generated settings) and the input it '
+                        'comes from (spec defaults, answers file, cli or '
+                        'extra-vars)',
+                'type': 'str'
+            },
         }
     },
     {
@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-from infrared.main import main
+from infrared.daemon import main
 import sys
 
 
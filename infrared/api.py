@@ -1,16 +1,23 @@
 # provides API to run plugins
 import abc
 import argparse
+import collections
 import logging
 import os
-import yaml
+import shlex
+import sys
+import time
+from six.moves import shlex_quote
 
 
 from infrared.core import execute
 from infrared.core.inspector.inspector import SpecParser
 from infrared.core.services import CoreServices
-from infrared.core.settings import VarsDictManager
+from infrared.core.settings import LayeredVars
+from infrared.core.utils import exceptions
 from infrared.core.utils import logger
+from infrared.core.utils import profiler
+from infrared.core.utils import yaml_io
 from infrared import SHARED_GROUPS
 from infrared import version_details
 
@@ -28,6 +35,9 @@ class SpecObject(object):
     def get_name(self):
         return self.name
 
+    def get_description(self):
+        return self.kwargs.get('description', '')
+
     @abc.abstractmethod
     def extend_cli(self, subparser):
         """Adds the spec cli options to to the main entry point.
@@ -35,6 +45,31 @@ class SpecObject(object):
         :param subparser: the subparser object to extend.
         """
 
+    def extend_cli_stub(self, subparser):
+        """Adds the spec to the main entry point without its cli options.
+
+        Used by the lazy spec manager for the specs which were not selected
+        from cli, so they are still listed in the help message.
+
+        :param subparser: the subparser object to extend.
+        """
+        description = self.get_description()
+        subparser.add_parser(self.name, help=description,
+                             description=description)
+
+    @staticmethod
+    def get_parsed_args(parser, args):
+        """Gets the cli arguments parsed.
+
+        :param parser: argparse object
+        :param args: argparse.Namespace if arguments were already parsed by
+            the spec manager, list of cli arguments otherwise.
+        :return: argparse.Namespace
+        """
+        if isinstance(args, argparse.Namespace):
+            return args
+        return parser.parse_args(args)
+
     @abc.abstractmethod
     def spec_handler(self, parser, args):
         """The main method for the spec.
@@ -42,7 +77,8 @@ class SpecObject(object):
         This method will be called by the spec managers once the subcommand
         with the spec name is called from cli.
         :param parser: argparse object
-        :param args: dict, input arguments as parsed by the parser.
+        :param args: argparse.Namespace, input arguments as parsed by the
+            parser (or list of cli arguments to parse).
         :return: exit code to be propagated out.
         """
 
@@ -59,19 +95,45 @@ class InfraredPluginsSpec(SpecObject):
         """
         self.plugin = plugin
         self.specification = None
+        # AnsibleRunner shared by several plugins runs
+        self.ansible_runner = None
         super(InfraredPluginsSpec, self).__init__(plugin.name, *args, **kwargs)
 
-    def extend_cli(self, root_subparsers):
-        """Extend CLI with plugin subparser. """
+    def get_description(self):
+        return self.plugin.description
 
-        user_dict = {}
+    def _get_base_groups(self):
+        """Gets the groups every plugin spec is extended with. """
         if self.add_base_groups:
-            user_dict = dict(shared_groups=SHARED_GROUPS)
+            return dict(shared_groups=SHARED_GROUPS)
+        return {}
+
+    def load_spec_dict(self):
+        """Loads the flattened plugin spec (using the spec cache if any). """
+        return SpecParser.load_spec_dict(self.plugin, self._get_base_groups())
+
+    def extend_cli(self, root_subparsers):
+        """Extend CLI with plugin subparser. """
 
         self.specification = SpecParser.from_plugin(
             subparser=root_subparsers,
             plugin=self.plugin,
-            base_groups=user_dict)
+            base_groups=self._get_base_groups())
+
+    @staticmethod
+    def _explain_var(layered_vars, var_path):
+        """Prints the value of the variable and the input it comes from.
+
+        :param layered_vars: the LayeredVars object with tracked sources
+        :param var_path: the dot separated path of the variable
+        """
+        try:
+            value, sources = layered_vars.explain(var_path)
+        except exceptions.IRKeyNotFoundException:
+            LOG.warning("Variable '{}' is not set".format(var_path))
+            return
+        print(yaml_io.dump({var_path: dict(value=value, sources=sources)},
+                           default_flow_style=False))
 
     def spec_handler(self, parser, args):
         """Execute plugin's main playbook.
@@ -86,9 +148,11 @@ class InfraredPluginsSpec(SpecObject):
             write vars dict to file
 
         :param parser: argparse object
-        :param args: dict, input arguments as parsed by the parser.
+        :param args: argparse.Namespace, input arguments as parsed by the
+            parser (or list of cli arguments to parse).
         :return:
             * Ansible exit code if ansible is executed.
+            * Exit code of the previous run if "--incremental" run is skipped
             * None if "--generate-answers-file" or "--dry-run" answers file is
               generated
         """
@@ -100,6 +164,8 @@ class InfraredPluginsSpec(SpecObject):
             workspace_manager.activate(active_workspace.name)
             LOG.warning("There are no workspaces. New workspace added: %s",
                         active_workspace.name)
+        else:
+            workspace_manager.index.touch(active_workspace.name)
 
         # TODO(yfried): when accepting inventory from CLI, need to update:
         # workspace.inventory = CLI[inventory]
@@ -109,7 +175,8 @@ class InfraredPluginsSpec(SpecObject):
             raise Exception("Unable to create specification "
                             "for '{}' plugin. Check plugin "
                             "config and settings folders".format(self.name))
-        parsed_args = self.specification.parse_args(parser, args)
+        with profiler.phase("arguments resolution"):
+            parsed_args = self.specification.parse_args(parser, args)
         if parsed_args is None:
             return None
 
@@ -119,35 +186,113 @@ class InfraredPluginsSpec(SpecObject):
         if control_args.get('debug', None):
             logger.LOG.setLevel(logging.DEBUG)
 
-        vars_dict = VarsDictManager.generate_settings(
-            # TODO(yfried): consider whether to use type (for legacy) or name
-            self.plugin.type,
-            nested_args,
-        )
+        with profiler.phase("settings generation"):
+            explain_vars = control_args.get('explain-var') or []
+            layered_vars = LayeredVars(track_sources=bool(explain_vars))
+            layered_vars.add_args(
+                # TODO(yfried): consider whether to use type (for legacy) or
+                # name
+                self.plugin.type,
+                nested_args,
+                args_sources=self.specification.args_sources,
+            )
+
+            # Update vars_dict with custom ansible variables (if needed)
+            layered_vars.add_vars(
+                custom_args, args_sources=self.specification.args_sources)
 
-        # Update vars_dict with custom ansible variables (if needed)
-        vars_dict.update(custom_args)
+            layered_vars.add_extra_vars(control_args.get('extra-vars'))
 
-        VarsDictManager.merge_extra_vars(vars_dict,
-                                         control_args.get('extra-vars'))
+        with profiler.phase("vars merge"):
+            vars_dict = layered_vars.materialize()
 
         LOG.debug("Dumping vars dict...")
-        vars_yaml = yaml.safe_dump(vars_dict,
-                                   default_flow_style=False)
-        output_filename = control_args.get("output")
-        if output_filename:
-            LOG.debug("Output file: {}".format(output_filename))
-            with open(output_filename, 'w') as output_file:
-                output_file.write(vars_yaml)
-        else:
-            print(vars_yaml)
+        with profiler.phase("vars dump"):
+            vars_yaml = yaml_io.dump(vars_dict, default_flow_style=False)
+            output_filename = control_args.get("output")
+            if output_filename:
+                LOG.debug("Output file: {}".format(output_filename))
+                with open(output_filename, 'w') as output_file:
+                    output_file.write(vars_yaml)
+            else:
+                print(vars_yaml)
+        for var_path in explain_vars:
+            self._explain_var(layered_vars, var_path)
         if control_args.get("dry-run"):
             return None
 
+        ansible_config = CoreServices.ansible_config_manager()
+        ansible_config.validate()
+
+        from infrared.core import history
+
+        run_history = active_workspace.history
+        with profiler.phase("run fingerprint"):
+            # the plugin git revision is recorded for every run, while
+            # hashing the plugin files is expensive, so it's done only for
+            # the incremental runs which are matched by it
+            plugin_revision = history.get_git_revision(self.plugin.path)
+            fingerprint = dict(
+                vars_hash=history.get_vars_hash(vars_dict),
+                playbook_hash=history.get_tree_hash(self.plugin.path)
+                if control_args.get('incremental') else None,
+                inventory_hash=history.get_file_hash(
+                    active_workspace.inventory),
+                args_hash=history.get_args_hash(
+                    control_args.get('ansible-args'),
+                    resume=control_args.get('resume')))
+
+        if control_args.get('incremental') and \
+                not control_args.get('force'):
+            previous_run = run_history.find_passed(
+                self.plugin.name, **fingerprint)
+            if previous_run is not None:
+                LOG.warning(
+                    "Skipping '{}' playbook: nothing changed since run #{} "
+                    "(started {}) has passed. Use --force to "
+                    "run it anyway".format(
+                        self.plugin.name, previous_run['id'],
+                        time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(
+                            previous_run['started']))))
+                for output_file in previous_run['output_files'].values():
+                    LOG.info("Output of run #{}: {}".format(
+                        previous_run['id'], output_file))
+                return previous_run['rc']
+
+        from distutils.util import strtobool
+        from infrared.core import checkpoint
+
+        ir_checkpoint = checkpoint.Checkpoint(
+            active_workspace, self.plugin.name)
+        resume = None
+        if control_args.get('resume'):
+            resume = dict(task=ir_checkpoint.get_resume_task(),
+                          facts=ir_checkpoint.load_facts())
+            LOG.warning("Resuming '{}' playbook from task '{}' (play '{}') "
+                        "with the saved facts of {} hosts".format(
+                            self.plugin.name, resume['task']['name'],
+                            resume['task']['play'], len(resume['facts'])))
+        else:
+            ir_checkpoint.reset()
+        if strtobool(os.environ.get('IR_CHECKPOINT', 'yes')):
+            ir_checkpoint.enable()
+
+        run_id = run_history.start(
+            self.plugin.name,
+            command=' '.join(shlex_quote(arg) for arg in sys.argv),
+            plugin_revision=plugin_revision, **fingerprint)
+
+        runner = self.ansible_runner or execute.AnsibleRunner(
+            active_workspace.inventory)
+        # the shared runner is refreshed once the stage arguments (which can
+        # switch the workspace inventory) are parsed
+        runner.refresh_changed_inventory()
+        result = None
+
         # register plugins_dir path otherwise roles introduced by the plugin
         # are not found during the plugin execution
         # save the current ANSIBLE_ROLES_PATH so that it can be restored later
-        ansible_roles_path = os.environ.get('ANSIBLE_ROLES_PATH', '')
+        ansible_roles_path = os.environ.get('ANSIBLE_ROLES_PATH')
         if self.plugin.roles_path:
             # check whether the path defined by user exists
             role_path = os.path.join(self.plugin.path, self.plugin.roles_path)
@@ -162,42 +307,138 @@ class InfraredPluginsSpec(SpecObject):
                 new_path = roles_path
             os.environ['ANSIBLE_ROLES_PATH'] = new_path
 
-        result = execute.ansible_playbook(
-            ir_workspace=active_workspace,
-            ir_plugin=self.plugin,
-            playbook_path=self.plugin.playbook,
-            verbose=control_args.get('verbose', None),
-            extra_vars=vars_dict,
-            ansible_args=control_args.get('ansible-args', None))
+        try:
+            with ansible_config.fact_cache(active_workspace), \
+                    ansible_config.autotune(runner.inventory):
+                result = execute.ansible_playbook(
+                    ir_workspace=active_workspace,
+                    ir_plugin=self.plugin,
+                    playbook_path=self.plugin.playbook,
+                    verbose=control_args.get('verbose', None),
+                    extra_vars=vars_dict,
+                    ansible_args=control_args.get('ansible-args', None),
+                    runner=runner,
+                    ssh_warmup=control_args.get('ssh-warmup', False),
+                    resume=resume)
+        finally:
+            ir_checkpoint.disable()
+            if result is None:
+                run_history.finish(run_id)
+            else:
+                run_history.finish(run_id, result.rc,
+                                   failed_hosts=result.failed_hosts,
+                                   output_files=result.output_files)
+            # restore original ANSIBLE_ROLES_PATH
+            if ansible_roles_path is None:
+                os.environ.pop('ANSIBLE_ROLES_PATH', None)
+            else:
+                os.environ['ANSIBLE_ROLES_PATH'] = ansible_roles_path
+        return result.rc
+
 
-        # restore original ANSIBLE_ROLES_PATH
-        os.environ['ANSIBLE_ROLES_PATH'] = ansible_roles_path
-        return result
+class VersionAction(argparse._VersionAction):
+    """Prints infrared version details.
+
+    The details are collected only when the action is called, since it
+    requires importing ansible.
+    """
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        self.version = version_details()
+        super(VersionAction, self).__call__(parser, namespace, values,
+                                            option_string=option_string)
 
 
 class SpecManager(object):
     """Manages all the available specifications (specs). """
 
-    def __init__(self):
+    def __init__(self, lazy=False):
+        """Constructor.
+
+        :param lazy: when True, the specs cli options are not added on
+            registration. Instead, the full subparser is built only for the
+            spec selected from cli and the other specs are added as stubs
+            (name & description only).
+        """
+        self.lazy = lazy
+        self._cli_extended = False
 
         # create entry point
         self.parser = argparse.ArgumentParser(
             description='infrared entry point',
             formatter_class=argparse.RawTextHelpFormatter)
-        self.parser.add_argument("--version", action='version',
-                                 version=version_details())
+        self.parser.add_argument("--version", action=VersionAction)
         self.parser.add_argument("--no-log-commands", action='store_true',
                                  help='disables logging of all commands')
+        self.parser.add_argument("--profile", action='store_true',
+                                 help='prints the time spent in every phase '
+                                      'of the run and saves it to the '
+                                      'active workspace')
         self.root_subparsers = self.parser.add_subparsers(dest="subcommand")
-        self.spec_objects = {}
+        self.spec_objects = collections.OrderedDict()
         self.execution_logger = None
 
     def register_spec(self, spec_object):
-        spec_object.extend_cli(self.root_subparsers)
+        if not self.lazy:
+            spec_object.extend_cli(self.root_subparsers)
         self.spec_objects[spec_object.get_name()] = spec_object
 
+    @staticmethod
+    def _get_cli_words(args=None):
+        """Gets the cli words relevant for the subcommand lookup.
+
+        When invoked by argcomplete, the words are taken from the command line
+        being completed, without the word which is currently completed.
+        """
+        if os.environ.get('_ARGCOMPLETE'):
+            comp_line = os.environ.get('COMP_LINE', '')
+            comp_point = int(os.environ.get('COMP_POINT', len(comp_line)))
+            comp_line = comp_line[:comp_point]
+            try:
+                words = shlex.split(comp_line)[1:]
+            except ValueError:
+                # unclosed quotes, the last word is being completed
+                return comp_line.split()[1:-1]
+            if words and not comp_line[-1:].isspace():
+                words = words[:-1]
+            return words
+        return sys.argv[1:] if args is None else args
+
+    def get_subcommand(self, args=None):
+        """Gets the name of the spec selected from cli.
+
+        :param args: list of cli arguments, sys.argv[1:] if None
+        :return: name of the registered spec, None if no spec selected
+        """
+        for word in self._get_cli_words(args):
+            if word.startswith('-'):
+                # the entry point options are flags, so skip them
+                continue
+            return word if word in self.spec_objects else None
+        return None
+
+    def build_parser(self, args=None):
+        """Builds the cli of lazily registered specs.
+
+        :param args: list of cli arguments, sys.argv[1:] if None
+        :return: the infrared parser object
+        """
+        if self.lazy and not self._cli_extended:
+            subcommand = self.get_subcommand(args)
+            with profiler.phase("argparse building"):
+                for name, spec_object in self.spec_objects.items():
+                    if name == subcommand:
+                        spec_object.extend_cli(self.root_subparsers)
+                    else:
+                        spec_object.extend_cli_stub(self.root_subparsers)
+            self._cli_extended = True
+        return self.parser
+
     def run_specs(self, args=None):
-        spec_args = vars(self.parser.parse_args(args))
+        parser = self.build_parser(args)
+        with profiler.phase("arguments parsing"):
+            parsed_args = parser.parse_args(args)
+        spec_args = vars(parsed_args)
         subcommand = spec_args.get('subcommand', '')
         if not spec_args.get('no_log_commands'):
             if self.execution_logger is None:
@@ -205,5 +446,6 @@ class SpecManager(object):
             self.execution_logger.command()
 
         if subcommand in self.spec_objects:
-            return self.spec_objects[subcommand].spec_handler(
-                self.parser, args=args)
+            with profiler.phase("{} handler".format(subcommand)):
+                return self.spec_objects[subcommand].spec_handler(
+                    self.parser, args=parsed_args)
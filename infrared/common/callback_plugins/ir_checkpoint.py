@@ -0,0 +1,199 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = '''
+    callback: ir_checkpoint
+    type: aggregate
+    short_description: saves the playbook progress to resume it after failure
+    description:
+      - This callback saves the last completed task of every play and the
+        failed task into the checkpoint file. The file is written only when
+        a task ends or the first task fails, so the playbook isn't slowed
+        down by the facts changes.
+      - The facts set by the 'set_fact' & 'include_vars' tasks and the
+        registered results are saved per host into the facts file next to
+        the checkpoint file ('<checkpoint name>_facts.json').
+      - The facts saved by the previous run are loaded at the start, so they
+        are kept over several resumed runs.
+    options:
+      checkpoint_file:
+        default: None, the callback is disabled
+        description: Path to the checkpoint file, set by infrared.
+        env:
+          - name: IR_CHECKPOINT_FILE
+'''
+
+# the facts of these modules are saved
+FACTS_ACTIONS = ('set_fact', 'include_vars')
+
+
+def get_facts_file(checkpoint_file):
+    """Gets the path of the facts file of the checkpoint. """
+    return os.path.splitext(checkpoint_file)[0] + '_facts.json'
+
+
+def _strip_internal_keys(result):
+    result = dict((key, value) for key, value in result.items()
+                  if not key.startswith('_ansible'))
+    if isinstance(result.get('results'), list):
+        result['results'] = [
+            _strip_internal_keys(item) if isinstance(item, dict) else item
+            for item in result['results']]
+    return result
+
+
+def _get_ds_path(obj):
+    """Gets the file and line number the play (or task) is defined at. """
+    ds = getattr(obj, '_ds', None)
+    if hasattr(ds, '_data_source') and hasattr(ds, '_line_number'):
+        return "%s:%s" % (ds._data_source, ds._line_number)
+    return None
+
+
+def _is_rescued(task):
+    """Checks whether the task failure is handled by a 'rescue' section. """
+    parent = task._parent
+    while parent is not None:
+        if getattr(parent, 'rescue', None):
+            return True
+        parent = getattr(parent, '_parent', None)
+    return False
+
+
+class CallbackModule(CallbackBase):
+    """Saves the playbook progress and facts to resume it later.
+
+    This plugin makes use of the following environment variables:
+        IR_CHECKPOINT_FILE (optional): Path to the checkpoint file, the plugin
+                                       is disabled if not set
+    """
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'ir_checkpoint'
+    CALLBACK_NEEDS_WHITELIST = False
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+
+        self._checkpoint_file = os.environ.get('IR_CHECKPOINT_FILE')
+        self.disabled = not self._checkpoint_file
+        self._facts_file = None
+        self._facts = {}
+        self._facts_changed = False
+        self._task = None
+        self._checkpoint = dict(playbook=None, status='running',
+                                started=time.time(), updated=None,
+                                plays=[], task=None, failed_task=None)
+        if not self.disabled:
+            self._facts_file = get_facts_file(self._checkpoint_file)
+            if os.path.isfile(self._facts_file):
+                with open(self._facts_file) as fp:
+                    self._facts = json.load(fp)
+
+    @staticmethod
+    def _write_json(path, data):
+        """Writes the file atomically, so it's never left half written. """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(data, fp, indent=4, default=str)
+        os.rename(tmp_path, path)
+
+    def _save(self):
+        self._checkpoint['updated'] = time.time()
+        self._write_json(self._checkpoint_file, self._checkpoint)
+        if self._facts_changed:
+            self._write_json(self._facts_file, self._facts)
+            self._facts_changed = False
+
+    def _complete_task(self):
+        """Marks the last started task completed in its play. """
+        if self._task is None:
+            return
+        if self._checkpoint['plays']:
+            self._checkpoint['plays'][-1]['completed_task'] = \
+                self._task['name']
+        # the interrupted run is resumed from the last completed task
+        self._checkpoint['task'] = self._task
+        self._task = None
+        self._save()
+
+    def _start_task(self, task):
+        self._complete_task()
+        play = self._checkpoint['plays'][-1] \
+            if self._checkpoint['plays'] else {}
+        self._task = dict(name=task.get_name().strip(),
+                          play=play.get('name'),
+                          play_path=play.get('path'),
+                          path=task.get_path())
+
+    def _save_facts(self, result):
+        task = result._task
+        host_facts = self._facts.setdefault(result._host.get_name(), {})
+        if task.action in FACTS_ACTIONS:
+            results = result._result.get('results') or [result._result]
+            for item in results:
+                if isinstance(item, dict) and item.get('ansible_facts'):
+                    host_facts.update(item['ansible_facts'])
+                    self._facts_changed = True
+        if task.register:
+            host_facts[task.register] = _strip_internal_keys(result._result)
+            self._facts_changed = True
+
+    def _fail_task(self, result):
+        first_failure = self._checkpoint['failed_task'] is None
+        if first_failure and self._task:
+            self._checkpoint['failed_task'] = dict(
+                self._task, host=result._host.get_name())
+        self._checkpoint['status'] = 'failed'
+        self._task = None
+        # the later failures don't change the resume point
+        if first_failure:
+            self._save()
+
+    def v2_playbook_on_start(self, playbook):
+        self._checkpoint['playbook'] = os.path.abspath(playbook._file_name)
+
+    def v2_playbook_on_play_start(self, play):
+        self._complete_task()
+        self._checkpoint['plays'].append(
+            dict(name=play.get_name().strip(), path=_get_ds_path(play),
+                 completed_task=None))
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._start_task(task)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self._start_task(task)
+
+    def v2_runner_on_ok(self, result):
+        self._save_facts(result)
+
+    def v2_runner_on_skipped(self, result):
+        if result._task.register:
+            self._save_facts(result)
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        if ignore_errors or _is_rescued(result._task):
+            self._save_facts(result)
+        else:
+            self._fail_task(result)
+
+    def v2_runner_on_unreachable(self, result):
+        self._fail_task(result)
+
+    def v2_playbook_on_stats(self, stats):
+        self._complete_task()
+        if self._checkpoint['failed_task'] is None and \
+                not stats.failures and not stats.dark:
+            self._checkpoint['status'] = 'passed'
+        else:
+            self._checkpoint['status'] = 'failed'
+        self._save()
@@ -0,0 +1,265 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import csv
+from datetime import datetime
+from distutils.util import strtobool
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+DOCUMENTATION = '''
+    callback: ir_profile_tasks
+    type: aggregate
+    short_description: records the duration of tasks on every host
+    description:
+      - This callback records the start and the end of every task on every
+        host and writes the reports once the playbook is over.
+      - The JSON report contains the tasks & hosts timings and the total
+        time of the roles and the task files.
+      - The CSV report contains a row per task per host.
+      - The collapsed stack report (playbook;play;role;file;task duration_ms)
+        can be turned into a flame graph with flamegraph.pl or speedscope.
+    options:
+      enabled:
+        default: False
+        description: Enables the callback
+        env:
+          - name: IR_PROFILE_TASKS
+      output_dir:
+        default: The 'ansible_outputs' dir of the infrared workspace
+        description: Directory to write the reports to.
+        env:
+          - name: IR_PROFILE_TASKS_DIR
+'''
+
+# number of the slowest tasks and roles to display
+SUMMARY_SIZE = 10
+
+
+def _public(record):
+    """Strips the internal keys of the record for the reports. """
+    return dict((key, value) for key, value in record.items()
+                if not key.startswith('_'))
+
+
+class CallbackModule(CallbackBase):
+    """Records the timing of the tasks per host, role and task file.
+
+    This plugin makes use of the following environment variables:
+        IR_PROFILE_TASKS (optional): Enables the plugin
+                                     Default: no
+        IR_PROFILE_TASKS_DIR (optional): Directory to write the reports to
+                                     Default: IR_ANSIBLE_OUTPUTS_DIR (set by
+                                     infrared) or the current directory
+    """
+
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'ir_profile_tasks'
+    CALLBACK_NEEDS_WHITELIST = False
+
+    def __init__(self):
+        super(CallbackModule, self).__init__()
+
+        self.disabled = not bool(strtobool(
+            os.environ.get('IR_PROFILE_TASKS', 'no')))
+        self._output_dir = os.environ.get(
+            'IR_PROFILE_TASKS_DIR',
+            os.environ.get('IR_ANSIBLE_OUTPUTS_DIR', os.getcwd()))
+        self._playbook = None
+        self._play = None
+        self._started = None
+        self._tasks = collections.OrderedDict()
+
+    def _start_task(self, task):
+        """Records the start of the task.
+
+        The task is started again for every serial batch (and every time its
+        file is included), so its host records are kept and the durations of
+        the runs are accumulated.
+        """
+        now = time.time()
+        task_record = self._tasks.get(task._uuid)
+        if task_record is None:
+            path = task.get_path() or ''
+            task_record = self._tasks[task._uuid] = dict(
+                play=self._play,
+                role=task._role.get_name() if task._role else None,
+                task=(task.name or task.action).strip(),
+                action=task.action,
+                path=path,
+                file=path.rsplit(':', 1)[0],
+                start=now,
+                end=None,
+                duration=0.0,
+                hosts=collections.OrderedDict())
+        else:
+            task_record['duration'] += self._get_run_duration(task_record)
+            for host_record in task_record['hosts'].values():
+                host_record['_run_start'] = None
+        task_record['_run_start'] = now
+        task_record['_run_end'] = None
+        return task_record
+
+    @staticmethod
+    def _get_run_duration(task_record):
+        """Gets the duration of the last run of the task. """
+        end = task_record['_run_end'] or task_record['_run_start']
+        return end - task_record['_run_start']
+
+    def _get_host_record(self, host, task):
+        task_record = self._tasks.get(task._uuid)
+        if task_record is None:
+            task_record = self._start_task(task)
+        record = task_record['hosts'].setdefault(
+            host.get_name(),
+            dict(start=task_record['_run_start'], end=None, status=None,
+                 duration=0.0, _run_start=None))
+        if record['_run_start'] is None:
+            record['_run_start'] = task_record['_run_start']
+        return record
+
+    def _finish_host_task(self, result, status):
+        """Records the end of the task on the host. """
+        record = self._get_host_record(result._host, result._task)
+        record['end'] = time.time()
+        record['status'] = status
+        record['duration'] += record['end'] - record['_run_start']
+        record['_run_start'] = None
+        task_record = self._tasks[result._task._uuid]
+        task_record['end'] = task_record['_run_end'] = record['end']
+
+    def v2_playbook_on_start(self, playbook):
+        self._playbook = playbook._file_name
+        self._started = time.time()
+
+    def v2_playbook_on_play_start(self, play):
+        self._play = play.get_name().strip()
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self._start_task(task)
+
+    def v2_playbook_on_handler_task_start(self, task):
+        self._start_task(task)
+
+    def v2_runner_on_start(self, host, task):
+        record = self._get_host_record(host, task)
+        record['_run_start'] = time.time()
+        if not record['duration']:
+            record['start'] = record['_run_start']
+
+    def v2_runner_on_ok(self, result):
+        self._finish_host_task(result, 'ok')
+
+    def v2_runner_on_failed(self, result, ignore_errors=False):
+        self._finish_host_task(
+            result, 'ignored' if ignore_errors else 'failed')
+
+    def v2_runner_on_skipped(self, result):
+        self._finish_host_task(result, 'skipped')
+
+    def v2_runner_on_unreachable(self, result):
+        self._finish_host_task(result, 'unreachable')
+
+    def _get_tasks(self):
+        """Gets the tasks records with their wall clock durations. """
+        tasks = []
+        for task in self._tasks.values():
+            hosts = collections.OrderedDict()
+            for host, record in task['hosts'].items():
+                duration = record['duration']
+                if record['_run_start'] is not None:
+                    # not finished, e.g. the playbook is interrupted
+                    end = task['_run_end'] or record['_run_start']
+                    duration += max(end - record['_run_start'], 0)
+                hosts[host] = _public(dict(record, duration=duration))
+            tasks.append(_public(dict(
+                task, hosts=hosts,
+                duration=task['duration'] + self._get_run_duration(task))))
+        return tasks
+
+    @staticmethod
+    def _get_totals(tasks, key):
+        totals = collections.defaultdict(float)
+        for task in tasks:
+            if task[key]:
+                totals[task[key]] += task['duration']
+        return collections.OrderedDict(
+            sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+    def _get_stack(self, task):
+        playbook_dir = os.path.dirname(os.path.abspath(self._playbook or ''))
+        task_file = task['file']
+        if task_file.startswith(playbook_dir + os.sep):
+            task_file = os.path.relpath(task_file, playbook_dir)
+        frames = [os.path.basename(self._playbook or 'playbook'),
+                  task['play'] or 'play', task['role'], task_file,
+                  task['task']]
+        return ';'.join(frame.replace(';', ':') for frame in frames if frame)
+
+    def _write_reports(self, tasks):
+        if not os.path.isdir(self._output_dir):
+            os.makedirs(self._output_dir)
+        playbook_dir = os.path.basename(
+            os.path.dirname(os.path.abspath(self._playbook or '')))
+        report_path = os.path.join(
+            self._output_dir, "ir_{timestamp}_{name}_tasks_profile".format(
+                timestamp=datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%S.%f"),
+                name=playbook_dir or 'playbook'))
+
+        with open(report_path + '.json', 'w') as fp:
+            json.dump(dict(playbook=self._playbook,
+                           started=self._started,
+                           duration=time.time() - self._started,
+                           tasks=tasks,
+                           roles=self._get_totals(tasks, 'role'),
+                           files=self._get_totals(tasks, 'file')),
+                      fp, indent=4)
+
+        with open(report_path + '.csv', 'w') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(('play', 'role', 'task', 'path', 'host',
+                             'status', 'start', 'duration'))
+            for task in tasks:
+                for host, record in task['hosts'].items():
+                    writer.writerow((task['play'], task['role'] or '',
+                                     task['task'], task['path'], host,
+                                     record['status'],
+                                     '{:.3f}'.format(record['start']),
+                                     '{:.3f}'.format(record['duration'])))
+
+        stacks = collections.OrderedDict()
+        for task in tasks:
+            stack = self._get_stack(task)
+            stacks[stack] = stacks.get(stack, 0) + task['duration']
+        with open(report_path + '.folded', 'w') as fp:
+            for stack, duration in stacks.items():
+                fp.write("{} {}\n".format(stack, int(duration * 1000)))
+
+        return report_path
+
+    def v2_playbook_on_stats(self, stats):
+        if self._started is None:
+            return
+        tasks = self._get_tasks()
+        report_path = self._write_reports(tasks)
+
+        self._display.banner("TASKS PROFILE")
+        for task in sorted(tasks, key=lambda task: task['duration'],
+                           reverse=True)[:SUMMARY_SIZE]:
+            self._display.display("{:<70} {:>10.2f}s".format(
+                (task['role'] + ' : ' if task['role'] else '') + task['task'],
+                task['duration']))
+        roles = self._get_totals(tasks, 'role')
+        if roles:
+            self._display.banner("ROLES PROFILE")
+            for role, duration in list(roles.items())[:SUMMARY_SIZE]:
+                self._display.display("{:<70} {:>10.2f}s".format(
+                    role, duration))
+        self._display.display("Tasks profile saved: {}.{{json,csv,folded}}"
+                              .format(report_path))
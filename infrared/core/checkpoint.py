@@ -0,0 +1,92 @@
+"""The plugins runs checkpoints to resume the failed playbooks.
+
+The ``ir_checkpoint`` callback saves the progress of the playbook and the
+facts set by it into the workspace. The failed (or interrupted) run is
+resumed from the failed (or the last completed) task with the saved facts
+set back on their hosts.
+"""
+import json
+import os
+
+from infrared.core.utils import exceptions
+
+CHECKPOINTS_DIR = 'checkpoints'
+
+
+class Checkpoint(object):
+    """The checkpoint of the plugin playbook in the workspace. """
+
+    def __init__(self, workspace, plugin_name):
+        """Initializes the checkpoint.
+
+        :param workspace: the Workspace object
+        :param plugin_name: the plugin name
+        """
+        self.plugin_name = plugin_name
+        self.path = os.path.join(
+            workspace.path, CHECKPOINTS_DIR, plugin_name + '.json')
+        # must match the ir_checkpoint callback facts file
+        self.facts_path = \
+            os.path.splitext(self.path)[0] + '_facts.json'
+
+    @staticmethod
+    def _load_json(path):
+        if not os.path.isfile(path):
+            return None
+        with open(path) as fp:
+            return json.load(fp)
+
+    def load(self):
+        """Loads the checkpoint saved by the callback.
+
+        :return: the checkpoint dict, None if there is no checkpoint
+        """
+        return self._load_json(self.path)
+
+    def load_facts(self):
+        """Loads the saved facts.
+
+        :return: dict of the hosts and their facts
+        """
+        return self._load_json(self.facts_path) or {}
+
+    def get_resume_task(self):
+        """Gets the task to resume the playbook from.
+
+        :return: dict with the task 'name', 'path' and the 'play' name and
+            'play_path' it's run in
+        """
+        checkpoint = self.load()
+        if checkpoint is None:
+            raise exceptions.IRCheckpointException(
+                "No checkpoint found for the '{}' plugin".format(
+                    self.plugin_name))
+        if checkpoint['status'] == 'passed':
+            raise exceptions.IRCheckpointException(
+                "The last run of the '{}' plugin has passed, nothing to "
+                "resume".format(self.plugin_name))
+
+        task = checkpoint.get('failed_task') or checkpoint.get('task')
+        if not task:
+            raise exceptions.IRCheckpointException(
+                "The last run of the '{}' plugin has failed before the "
+                "first task, nothing to resume".format(self.plugin_name))
+        return task
+
+    def reset(self):
+        """Removes the saved checkpoint and facts. """
+        for path in (self.path, self.facts_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def enable(self):
+        """Makes the callback save the checkpoint of the next playbook. """
+        checkpoints_dir = os.path.dirname(self.path)
+        if not os.path.isdir(checkpoints_dir):
+            os.makedirs(checkpoints_dir)
+        os.environ['IR_CHECKPOINT_FILE'] = self.path
+
+    @staticmethod
+    def disable():
+        """Stops the callback from saving the checkpoints. """
+        os.environ.pop('IR_CHECKPOINT_FILE', None)
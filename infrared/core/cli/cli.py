@@ -13,12 +13,12 @@ import re
 from six.moves import configparser
 from six import string_types
 import sys
-import yaml
 
 from infrared.core.services import CoreServices
 from infrared.core.utils import dict_utils
 from infrared.core.utils import exceptions
 from infrared.core.utils import logger
+from infrared.core.utils import yaml_io
 
 LOG = logger.LOG
 
@@ -73,15 +73,21 @@ class CliParser(object):
         return subparsers
 
     @classmethod
-    def parse_cli_input(cls, arg_parser, args=None):
+    def parse_cli_input(cls, arg_parser, args=None, save_args=True):
         """Parse CLI input.
 
         :param arg_parser: argparse object
-        :param args: replace sys.argv[1:]
+        :param args: replace sys.argv[1:] or argparse.Namespace when the
+            input was already parsed by the arg_parser
+        :param save_args: whether to save the arguments to the file in the
+            active workspace
         :return: dict. Parsed CLI input
         """
 
-        parse_args, unknown_args = arg_parser.parse_known_args(args)
+        if isinstance(args, argparse.Namespace):
+            parse_args, unknown_args = args, []
+        else:
+            parse_args, unknown_args = arg_parser.parse_known_args(args)
         # todo(obaranov) Pass all the unknown arguments to the ansible
         # For now just raise exception
         if unknown_args:
@@ -90,18 +96,8 @@ class CliParser(object):
         parse_args = parse_args.__dict__
 
         # Save all command line arguments to a file
-        all_argument_file = CoreServices.workspace_manager().get_active_workspace().path + '/' \
-            + parse_args['subcommand'] + '_all_argument_file.txt'
-        with open(all_argument_file, 'w') as file:
-            for arg in parse_args:
-                if 'subcommand' in arg:
-                    arg_name = arg[10:]
-                    if arg_name == '':
-                        data = 'plugin' + ': ' + str(parse_args[arg])
-                    else:
-                        data = arg_name + ': ' + str(parse_args[arg])
-                    file.write(data)
-                    file.write('\n')
+        if save_args:
+            cls._save_args(parse_args)
 
         # move sub commands to the nested dicts
         result = collections.defaultdict(dict)
@@ -124,6 +120,22 @@ class CliParser(object):
 
         return result
 
+    @staticmethod
+    def _save_args(parse_args):
+        """Saves the command line arguments to the active workspace. """
+        all_argument_file = CoreServices.workspace_manager().get_active_workspace().path + '/' \
+            + parse_args['subcommand'] + '_all_argument_file.txt'
+        with open(all_argument_file, 'w') as file:
+            for arg in parse_args:
+                if 'subcommand' in arg:
+                    arg_name = arg[10:]
+                    if arg_name == '':
+                        data = 'plugin' + ': ' + str(parse_args[arg])
+                    else:
+                        data = arg_name + ': ' + str(parse_args[arg])
+                    file.write(data)
+                    file.write('\n')
+
     @classmethod
     def _add_groups(cls, spec, arg_parser, parser_name, parser_data,
                     path_prefix=''):
@@ -321,6 +333,9 @@ class ComplexType(object):
     """
     # specifies if complex type should be nested to the settings
     is_nested = True
+    # specifies if resolving the type changes the workspace, such types are
+    # not resolved when the arguments are only validated
+    has_side_effects = False
 
     def __init__(self, arg_name,
                  settings_dirs,
@@ -360,7 +375,7 @@ class Bool(Value):
 
     def resolve(self, value=True):
         """Returns the YAML boolean value. """
-        value = yaml.safe_load(str(value))
+        value = yaml_io.load(str(value))
         if not isinstance(value, bool):
             raise exceptions.IRException("--{} expects boolean values".
                                          format(self.arg_name))
@@ -409,6 +424,7 @@ class Inventory(ComplexType):
     """Accepts an Ansible Inventory file as active workspace's inventory. """
 
     is_nested = False
+    has_side_effects = True
 
     def resolve(self, value):
         """Set active workspace's inventory
@@ -1,30 +1,89 @@
+import contextlib
 from datetime import datetime
-from distutils.util import strtobool
 import errno
+import fnmatch
 import json
 import os
 import re
 import sys
 import tempfile
+import time
 
+from infrared.core.utils import exceptions
 from infrared.core.utils import logger
-import yaml
+from infrared.core.utils import profiler
+from infrared.core.utils import yaml_io
 
 LOG = logger.LOG
 
 
+# Ansible output is written to the file sinks in batches, once the buffered
+# output reaches the size (in characters) or the interval (in seconds) passes
+OUTPUT_FLUSH_SIZE = 64 * 1024
+OUTPUT_FLUSH_INTERVAL = 0.5
+
+
+# the IRSTDFDManager objects of the running playbooks
+_STD_FD_MANAGERS = []
+
+
+def _flush_before_fork():
+    """Writes the buffered output before fork.
+
+    The sinks batches and the non-terminal std streams are flushed, so the
+    output of the forked process follows the output written before the fork
+    and the forked process doesn't print the output left in the buffers
+    again.
+    """
+    for manager in _STD_FD_MANAGERS:
+        manager.flush()
+    for stream in (sys.__stdout__, sys.__stderr__):
+        try:
+            stream.flush()
+        except (AttributeError, IOError, OSError, ValueError):
+            pass
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_flush_before_fork)
+
+
+# the ansible config options which can change between the runs in the same
+# infrared process
+RUN_CONFIG_OPTIONS = ('DEFAULT_ROLES_PATH', 'DEFAULT_GATHERING', 'CACHE_PLUGIN',
+                      'CACHE_PLUGIN_CONNECTION', 'CACHE_PLUGIN_PREFIX',
+                      'CACHE_PLUGIN_TIMEOUT', 'DEFAULT_FORKS',
+                      'DEFAULT_INTERNAL_POLL_INTERVAL', 'ANSIBLE_SSH_ARGS')
+
+
 class NoAnsiFile(object):
+    """Strips the ANSI escape sequences from the written data.
+
+    The escape sequence can be split between two writes, so the incomplete
+    sequence at the end of the data is written together with the next data.
+    """
 
     re_ansi = re.compile(r'\x1b[^m]*m')
+    # incomplete escape sequences longer than that are written as is
+    max_pending = 32
 
     def __init__(self, fd):
         self.fd = fd
+        self._pending = ''
 
     def write(self, data):
-        no_ansi_data = self.re_ansi.sub('', data)
-        self.fd.write(no_ansi_data)
+        data = self._pending + data
+        self._pending = ''
+        seq_start = data.rfind('\x1b')
+        if seq_start != -1 and 'm' not in data[seq_start:] and \
+                len(data) - seq_start <= self.max_pending:
+            data, self._pending = data[:seq_start], data[seq_start:]
+        self.fd.write(self.re_ansi.sub('', data))
 
     def close(self):
+        if self._pending:
+            self.fd.write(self._pending)
+            self._pending = ''
         self.fd.close()
 
     def flush(self):
@@ -32,77 +91,101 @@ class NoAnsiFile(object):
 
 
 class IRStdFd(object):
-    pass
 
+    def __init__(self, stream, print_output=True, manager=None):
+        """Initializes the std stream replacement.
+
+        :param stream: the original (terminal) stream
+        :param print_output: whether to print the output to the terminal
+        :param manager: IRSTDFDManager to pass the output to its file sinks
+        """
+        self.stream = stream
+        self.print_output = print_output
+        self.manager = manager
+        # keep the terminal interactive, otherwise flush with the sinks
+        try:
+            self.interactive = stream.isatty()
+        except (AttributeError, ValueError):
+            self.interactive = False
+        self.dirty = False
 
-class IRStdoutFd(IRStdFd):
+    def write(self, data):
+        if self.print_output:
+            self.stream.write(data)
+            self.flush()
+        if self.manager is not None:
+            self.manager.write_sinks(data)
 
-    def __init__(self, print_stdout=True):
-        self.print_stdout = print_stdout
-        self.org_stdout = sys.stdout
-        sys.stdout = self
+    def flush(self):
+        if self.interactive or (self.manager is not None and
+                                self.manager.is_forked()):
+            self.stream.flush()
+        else:
+            # flushed with the sinks batch
+            self.dirty = True
 
-    def write(self, data):
-        if self.print_stdout:
-            sys.__stdout__.write(data)
-            sys.__stdout__.flush()
-        for fd in IRSTDFDManager.fds:
-            if not isinstance(fd, IRStdFd):
-                fd.write(data)
-                fd.flush()
+    def sync(self):
+        """Flushes the terminal stream. """
+        self.dirty = False
+        self.stream.flush()
+
+    def fileno(self):
+        return self.stream.fileno()
 
-    @staticmethod
-    def flush():
-        sys.__stdout__.flush()
 
-    @staticmethod
-    def close():
-        sys.stdout = sys.__stdout__
+class IRStdoutFd(IRStdFd):
+
+    def __init__(self, print_stdout=True, manager=None):
+        super(IRStdoutFd, self).__init__(sys.__stdout__, print_stdout,
+                                         manager)
+        self.org_stdout = sys.stdout
+        sys.stdout = self
 
-    @staticmethod
-    def fileno():
-        return sys.__stdout__.fileno()
+    def close(self):
+        self.sync()
+        sys.stdout = self.org_stdout
 
 
 class IRStderrFd(IRStdFd):
 
-    def __init__(self, print_stderr=True):
-        self.print_stderr = print_stderr
+    def __init__(self, print_stderr=True, manager=None):
+        super(IRStderrFd, self).__init__(sys.__stderr__, print_stderr,
+                                         manager)
         self.org_stderr = sys.stderr
         sys.stderr = self
 
-    def write(self, data):
-        if self.print_stderr:
-            sys.__stderr__.write(data)
-            sys.__stderr__.flush()
-        for fd in IRSTDFDManager.fds:
-            if not isinstance(fd, IRStdFd):
-                fd.write(data)
-                fd.flush()
-
-    @staticmethod
-    def flush():
-        sys.__stderr__.flush()
-
-    @staticmethod
-    def close():
-        sys.stderr = sys.__stderr__
+    def close(self):
+        self.sync()
+        sys.stderr = self.org_stderr
 
 
 class IRSTDFDManager(object):
+    """Passes the std streams output to the file sinks of the run.
 
-    fds = set()
+    The output is written to the sinks in batches, once OUTPUT_FLUSH_SIZE is
+    buffered or OUTPUT_FLUSH_INTERVAL passed since the previous batch, so
+    Ansible isn't slowed down by writing and flushing every chunk. The
+    output of the processes forked by Ansible (the task workers) is written
+    and flushed right away, as they exit without flushing.
+    """
 
     def __init__(self, stdout=True, stderr=True, *fds):
 
         self.stdout = stdout
         self.stderr = stderr
+        self.fds = []
 
         for fd in fds:
             self.add(fd)
 
-        self.add(IRStdoutFd(print_stdout=self.stdout))
-        self.add(IRStderrFd(print_stderr=self.stderr))
+        self._pid = os.getpid()
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.time()
+        self._failed_sinks = []
+        self.std_fds = (IRStdoutFd(print_stdout=self.stdout, manager=self),
+                        IRStderrFd(print_stderr=self.stderr, manager=self))
+        _STD_FD_MANAGERS.append(self)
 
     def __enter__(self):
         return self
@@ -110,26 +193,514 @@ class IRSTDFDManager(object):
     def __exit__(self, exc_type, exc_value, traceback):
         self.close()
 
+    def is_forked(self):
+        """Checks whether the manager is used by a forked process. """
+        return os.getpid() != self._pid
+
+    def write_sinks(self, data):
+        """Writes the data to the file sinks (in batches). """
+        if not self.fds:
+            return
+        if self.is_forked():
+            # the output buffered by the parent is written by the parent
+            self._write(data)
+            return
+
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= OUTPUT_FLUSH_SIZE or \
+                time.time() - self._last_flush >= OUTPUT_FLUSH_INTERVAL:
+            self._flush_sinks()
+
+    def _flush_sinks(self):
+        data = ''.join(self._buffer)
+        self._buffer, self._buffered = [], 0
+        self._last_flush = time.time()
+        self._write(data)
+        for std_fd in self.std_fds:
+            if std_fd.dirty:
+                std_fd.sync()
+
+    def _write(self, data):
+        for sink in self.fds:
+            if sink in self._failed_sinks:
+                continue
+            try:
+                if data:
+                    sink.write(data)
+                sink.flush()
+            except (IOError, OSError, ValueError) as ex:
+                LOG.warning("Failed to write Ansible output to {}: {}".format(
+                    sink, ex))
+                self._failed_sinks.append(sink)
+
     def write(self, data):
-        for fd in self.fds:
-            fd.write(data)
-            fd.flush()
+        sys.stdout.write(data)
 
     def flush(self):
-        for fd in self.fds:
-            fd.flush()
+        self._flush_sinks()
+        for std_fd in self.std_fds:
+            std_fd.sync()
 
     def close(self):
+        if self in _STD_FD_MANAGERS:
+            _STD_FD_MANAGERS.remove(self)
+        self._flush_sinks()
+        for std_fd in self.std_fds:
+            std_fd.close()
         for fd in self.fds:
             fd.close()
+        del self.fds[:]
 
     def add(self, fd):
-        self.fds.add(fd)
+        self.fds.append(fd)
+
+
+class PlaybookResult(object):
+    """Results of the playbook run. """
+
+    def __init__(self, playbook, rc, hosts=None, failed_tasks=None):
+        """Initializes the playbook results.
+
+        :param playbook: the playbook path
+        :param rc: ansible exit code:
+            0: Success
+            1: "Error"
+            2: Host failed
+            3: Unreachable
+            4: Parser Error
+            5: Options error
+        :param hosts: dict of the hosts and their stats ('ok', 'changed',
+            'failures', 'unreachable', etc.)
+        :param failed_tasks: list of dicts with the 'host', 'task', 'status'
+            and 'msg' of the failed and unreachable tasks
+        """
+        self.playbook = playbook
+        self.rc = rc
+        self.hosts = hosts or {}
+        self.failed_tasks = failed_tasks or []
+        # the log & vars files of the run, set by ansible_playbook
+        self.output_files = {}
+
+    @property
+    def failed_hosts(self):
+        """Gets the sorted list of the failed & unreachable hosts. """
+        return sorted(host for host, stats in self.hosts.items()
+                      if stats.get('failures') or stats.get('unreachable'))
+
+    def to_dict(self):
+        return dict(playbook=self.playbook, rc=self.rc, hosts=self.hosts,
+                    failed_tasks=self.failed_tasks,
+                    output_files=self.output_files)
+
+
+def _create_results_collector():
+    """Creates the callback which collects the failed tasks. """
+    from ansible.plugins.callback import CallbackBase
+
+    class ResultsCollector(CallbackBase):
+        CALLBACK_VERSION = 2.0
+        CALLBACK_TYPE = 'aggregate'
+        CALLBACK_NAME = 'infrared_results'
+
+        def __init__(self):
+            super(ResultsCollector, self).__init__()
+            self.failed_tasks = []
+
+        def _add_failed_task(self, result, status):
+            self.failed_tasks.append(dict(
+                host=result._host.get_name(),
+                task=result._task.get_name(),
+                status=status,
+                msg=result._result.get('msg', '')))
+
+        def v2_runner_on_failed(self, result, ignore_errors=False):
+            if not ignore_errors:
+                self._add_failed_task(result, 'failed')
+
+        def v2_runner_on_unreachable(self, result):
+            self._add_failed_task(result, 'unreachable')
+
+    return ResultsCollector()
+
+
+class AnsibleRunner(object):
+    """Runs playbooks with the Ansible python API.
+
+    The data loader and the inventory are created once and shared by all the
+    playbooks run by the runner, so the inventory is parsed only once.
+    """
+
+    def __init__(self, inventory):
+        """Initializes the runner.
+
+        :param inventory: the inventory path (or list of paths)
+        """
+        if not isinstance(inventory, (list, tuple)):
+            inventory = [inventory]
+        self.sources = list(inventory)
+        self._loader = None
+        self._inventory = None
+        # the inventory files and their modification times when parsed
+        self._inventory_state = None
+
+    @property
+    def loader(self):
+        if self._loader is None:
+            from ansible.parsing.dataloader import DataLoader
+            self._loader = DataLoader()
+        return self._loader
+
+    @property
+    def inventory(self):
+        if self._inventory is None:
+            from ansible.inventory.manager import InventoryManager
+            self._inventory_state = self._get_inventory_state()
+            self._inventory = InventoryManager(loader=self.loader,
+                                               sources=self.sources)
+        return self._inventory
+
+    def _get_inventory_state(self):
+        """Gets the inventory files (symlinks resolved) and their mtimes. """
+        state = []
+        for source in self.sources:
+            path = os.path.realpath(source)
+            try:
+                state.append((path, os.path.getmtime(path)))
+            except OSError:
+                state.append((path, None))
+        return state
+
+    def refresh_inventory(self):
+        """Parses the inventory sources again on the next run. """
+        if self._inventory is not None:
+            self._inventory_state = self._get_inventory_state()
+            self._inventory.refresh_inventory()
+
+    def refresh_changed_inventory(self):
+        """Parses the inventory again if its files have been changed. """
+        if self._inventory is not None and \
+                self._get_inventory_state() != self._inventory_state:
+            LOG.debug("Inventory changed, refreshing it")
+            self.refresh_inventory()
+
+    def get_cli_args(self, playbook_path, verbose=None, ansible_args=None):
+        """Gets the ansible-playbook cli arguments for the playbook run. """
+        cli_args = ['ansible-playbook', playbook_path]
+        for source in self.sources:
+            cli_args.extend(['--inventory', source])
+
+        # infrared should not change ansible verbosity unless user specifies
+        # that
+        if verbose:
+            cli_args.append('-' + 'v' * int(verbose))
+
+        cli_args.extend(ansible_args or [])
+        return cli_args
+
+    def run(self, playbook_path, vars_dict=None, verbose=None,
+            ansible_args=None, ssh_warmup=False, resume=None):
+        """Runs the playbook.
+
+        :param playbook_path: the playbook to invoke
+        :param vars_dict: dict, passed to Ansible as extra-vars
+        :param verbose: Ansible verbosity level
+        :param ansible_args: list of ansible-playbook arguments to plumb down
+            directly to Ansible.
+        :param ssh_warmup: whether to open the SSH connections to the hosts
+            before the playbook starts and fail if any host is unreachable
+        :param resume: dict with the checkpoint 'task' to start the playbook
+            at and the saved 'facts' of the hosts
+        :return: PlaybookResult object
+        """
+        if resume:
+            ansible_args = list(ansible_args or []) + [
+                '--start-at-task', resume['task']['name']]
+        cli_args = self.get_cli_args(playbook_path, verbose, ansible_args)
+        try:
+            from ansible import context
+        except ImportError:
+            # older ansible has no global context to pass the options with
+            if ssh_warmup:
+                LOG.warning("SSH warm-up is not supported by the installed "
+                            "Ansible version")
+            if resume:
+                LOG.warning("The saved facts are not restored by the "
+                            "installed Ansible version")
+            return PlaybookResult(playbook_path, _run_playbook_cli(
+                cli_args, vars_dict or {}, verbose))
+
+        from ansible.cli import CLI
+        from ansible.cli.playbook import PlaybookCLI
+        from ansible import constants as C
+        from ansible.errors import AnsibleOptionsError
+        from ansible.errors import AnsibleParserError
+        from ansible.executor.playbook_executor import PlaybookExecutor
+        from ansible.playbook import Playbook
+        from ansible.playbook.play_context import PlayContext
+        from ansible.plugins.loader import add_all_plugin_dirs
+        from ansible.utils.collection_loader import \
+            set_collection_playbook_paths
+        from ansible.utils.context_objects import CLIArgs
+        from ansible.utils.vars import combine_vars
+        from ansible.vars.manager import VariableManager
+
+        if not os.path.isfile(playbook_path):
+            raise exceptions.IRFileNotFoundException(playbook_path)
+
+        # ansible reads its configuration once, while the roles path is
+        # extended for every plugin which is run and the facts cache is set
+        # for the workspace of the run
+        for name in RUN_CONFIG_OPTIONS:
+            setattr(C, name, C.config.get_config_value(name))
+        # the play context takes the ssh args default once it's imported
+        PlayContext._attr_defaults['ssh_args'] = C.ANSIBLE_SSH_ARGS
+
+        LOG.debug('Starting ansible with args: {}'.format(cli_args[1:]))
+        cli = PlaybookCLI(cli_args)
+        try:
+            with profiler.phase("PlaybookCLI.parse"):
+                # NOTE: CLI.parse() stores options in the GlobalCLIArgs
+                # singleton, which keeps the options of the first run only,
+                # so the global context is initialized directly.
+                cli.init_parser()
+                options = cli.post_process_args(
+                    cli.parser.parse_args(cli_args[1:]))
+                context.CLIARGS = CLIArgs.from_options(options)
+        except (AnsibleParserError, AnsibleOptionsError) as error:
+            LOG.error('{}: {}'.format(type(error), error))
+            raise error
+
+        if (context.CLIARGS['listhosts'] or context.CLIARGS['listtasks'] or
+                context.CLIARGS['listtags'] or context.CLIARGS['syntax']):
+            # nothing is executed, let the cli print the playbook details
+            return PlaybookResult(playbook_path, cli.run())
+
+        # load plugins adjacent to the playbook (callbacks, filters, etc)
+        playbook_dir = os.path.dirname(os.path.abspath(playbook_path))
+        add_all_plugin_dirs(playbook_dir)
+        set_collection_playbook_paths([playbook_dir])
+
+        sshpass, becomepass = cli.ask_passwords()
+        passwords = {'conn_pass': sshpass, 'become_pass': becomepass}
+
+        vault_secrets = CLI.setup_vault_secrets(
+            self.loader,
+            vault_ids=C.DEFAULT_VAULT_IDENTITY_LIST + list(
+                context.CLIARGS['vault_ids']),
+            vault_password_files=list(
+                context.CLIARGS['vault_password_files']),
+            ask_vault_pass=context.CLIARGS['ask_vault_pass'],
+            auto_prompt=False)
+        self.loader.set_vault_secrets(vault_secrets)
+
+        # restricts the inventory to the --limit hosts (and validates it)
+        CLI.get_host_list(self.inventory, context.CLIARGS['subset'])
+
+        variable_manager = VariableManager(
+            loader=self.loader, inventory=self.inventory,
+            version_info=CLI.version_info(gitinfo=False))
+        # infrared vars have precedence over the user's extra vars
+        variable_manager._extra_vars = combine_vars(
+            variable_manager.extra_vars, vars_dict or {})
+        variable_manager._extra_vars = combine_vars(
+            variable_manager.extra_vars, _get_ir_extras())
+
+        if context.CLIARGS['flush_cache']:
+            cli._flush_cache(self.inventory, variable_manager)
+
+        if ssh_warmup or resume:
+            playbook = Playbook.load(playbook_path,
+                                     variable_manager=variable_manager,
+                                     loader=self.loader)
+        if resume:
+            self._check_start_task(playbook, variable_manager,
+                                   resume['task'])
+            self._set_facts(variable_manager, resume['facts'])
+        if ssh_warmup:
+            self._warm_up(self._get_playbook_hosts(playbook, variable_manager),
+                          variable_manager, passwords)
+
+        pbex = PlaybookExecutor(playbooks=[playbook_path],
+                                inventory=self.inventory,
+                                variable_manager=variable_manager,
+                                loader=self.loader, passwords=passwords)
+        collector = _create_results_collector()
+        pbex._tqm._callback_plugins.append(collector)
+
+        with profiler.phase("playbook run"):
+            rc = pbex.run()
+
+        stats = pbex._tqm._stats
+        hosts = dict((host, stats.summarize(host))
+                     for host in sorted(stats.processed))
+        return PlaybookResult(playbook_path, rc, hosts=hosts,
+                              failed_tasks=collector.failed_tasks)
+
+    def _iter_plays(self, playbook):
+        """Iterates the plays of the playbook.
+
+        The vars files of the plays are relative to their playbooks, so the
+        loader base dir is switched for every play, as the playbook executor
+        does.
+        """
+        for play in playbook.get_plays():
+            self.loader.set_basedir(play._included_path or playbook._basedir)
+            yield play
+
+    def _get_play_hosts(self, play, variable_manager):
+        """Gets the hosts matched by the (templated) hosts pattern of the play.
+
+        :return: list of the inventory Host objects
+        """
+        from ansible.template import Templar
+
+        # a previous run leaves the inventory restricted to its last batch
+        self.inventory.remove_restriction()
+        templar = Templar(loader=self.loader,
+                          variables=variable_manager.get_vars(play=play))
+        return self.inventory.get_hosts(templar.template(play.hosts))
+
+    def _get_playbook_hosts(self, playbook, variable_manager):
+        """Gets the hosts targeted by the plays of the playbook.
+
+        The hosts are matched by the hosts patterns of the plays in the
+        inventory restricted by ``--limit``.
+
+        :return: list of the inventory Host objects
+        """
+        hosts = []
+        for play in self._iter_plays(playbook):
+            for host in self._get_play_hosts(play, variable_manager):
+                if host not in hosts:
+                    hosts.append(host)
+        return hosts
+
+    def _check_start_task(self, playbook, variable_manager, task):
+        """Checks the playbook is started at the checkpoint task.
+
+        ``--start-at-task`` starts the playbook at the first task matching
+        the name in the plays with hosts, so a task of the same name before
+        the checkpoint one would be taken instead.
+
+        :param task: the checkpoint task dict
+        :raise IRCheckpointException: if the run would be started at another
+            task
+        """
+        for play in self._iter_plays(playbook):
+            if not self._get_play_hosts(play, variable_manager):
+                continue
+            for name, full_name, path in _get_play_tasks(
+                    play, variable_manager.get_vars(play=play)):
+                if not any(task_name == task['name'] or
+                           fnmatch.fnmatch(task_name, task['name'])
+                           for task_name in (name, full_name)):
+                    continue
+                if path == task['path'] and task.get('play_path') in (
+                        None, _get_ds_path(play)):
+                    return
+                raise exceptions.IRCheckpointException(
+                    "Can't resume at task '{}' ({}) of play '{}': its name "
+                    "matches the earlier task at {} of play '{}'".format(
+                        task['name'], task['path'], task['play'], path,
+                        play.get_name()))
+        raise exceptions.IRCheckpointException(
+            "Can't resume at task '{}' ({}): no task of the playbook matches "
+            "it (the tasks of dynamically included files can't be "
+            "resumed at)".format(task['name'], task['path']))
+
+    def _set_facts(self, variable_manager, facts):
+        """Sets the saved facts on their hosts, as ``set_fact`` does.
+
+        :param facts: dict of the hosts names and their facts
+        """
+        for host_name, host_facts in facts.items():
+            if self.inventory.get_host(host_name) is None:
+                LOG.warning("The facts of host '{}' are not restored, it's "
+                            "not in the inventory".format(host_name))
+                continue
+            variable_manager.set_nonpersistent_facts(host_name, host_facts)
+
+    def _warm_up(self, hosts, variable_manager, passwords):
+        """Opens the SSH connections to the playbook hosts.
+
+        :raise IRSshException: if any host is unreachable
+        """
+        from ansible.playbook.play_context import PlayContext
+        from infrared.core import ssh_warmup
+
+        with profiler.phase("ssh warm-up"):
+            unreachable = ssh_warmup.warm_up(
+                hosts, variable_manager, self.loader,
+                PlayContext(passwords=passwords))
+        if unreachable:
+            for host, error in sorted(unreachable.items()):
+                LOG.error('Host "{}" is unreachable: {}'.format(host, error))
+            raise exceptions.IRSshException(
+                "Unreachable hosts: {}".format(
+                    ", ".join(sorted(unreachable))))
+
+
+def _get_ds_path(obj):
+    """Gets the file and line number the play (or task) is defined at. """
+    ds = getattr(obj, '_ds', None)
+    if hasattr(ds, '_data_source') and hasattr(ds, '_line_number'):
+        return "%s:%s" % (ds._data_source, ds._line_number)
+    return None
+
+
+def _get_play_tasks(play, all_vars):
+    """Gets the play tasks in the order ``--start-at-task`` matches them.
+
+    The tasks of the rescue sections are not matched, as they are run only
+    after a failure.
+
+    :param all_vars: the play vars to filter the tagged tasks with
+    :return: list of the tasks (name, full name, path) tuples
+    """
+    from ansible.playbook.block import Block
+
+    def get_block_tasks(block):
+        tasks = []
+        for task in block.block + block.always:
+            if isinstance(task, Block):
+                tasks.extend(get_block_tasks(task))
+            else:
+                tasks.append((task.name, task.get_name(), task.get_path()))
+        return tasks
+
+    # the facts gathering task of every play is defined at the play
+    tasks = [('Gathering Facts', 'Gathering Facts', _get_ds_path(play))]
+    for block in play.compile():
+        tasks.extend(get_block_tasks(block.filter_tagged_tasks(all_vars)))
+    return tasks
+
+
+def _get_ir_extras():
+    """Gets the infrared data passed to ansible as extra vars. """
+    from distutils.util import strtobool
+
+    if bool(strtobool(os.environ.get('IR_NO_EXTRAS', 'no'))):
+        return {}
+    return {
+        'infrared': {
+            'python': {
+                'executable': sys.executable,
+                'version': {
+                    'full': sys.version.split()[0],
+                    'major': sys.version_info.major,
+                    'minor': sys.version_info.minor,
+                    'micro': sys.version_info.micro,
+                }
+            }
+        }
+    }
 
 
 def ansible_playbook(ir_workspace, ir_plugin, playbook_path, verbose=None,
-                     extra_vars=None, ansible_args=None):
-    """Wraps the 'ansible-playbook' CLI.
+                     extra_vars=None, ansible_args=None, runner=None,
+                     ssh_warmup=False, resume=None):
+    """Runs the playbook with the given vars.
 
      :param ir_workspace: An Infrared Workspace object represents the active
      workspace
@@ -139,163 +710,154 @@ def ansible_playbook(ir_workspace, ir_plugin, playbook_path, verbose=None,
      :param extra_vars: dict. Passed to Ansible as extra-vars
      :param ansible_args: dict of ansible-playbook arguments to plumb down
          directly to Ansible.
+     :param runner: AnsibleRunner object to reuse its inventory, a new one
+         is created with the workspace inventory if not set.
+     :param ssh_warmup: whether to open the SSH connections to the hosts
+         before the playbook starts and fail if any host is unreachable
+     :param resume: dict with the checkpoint 'task' to start the playbook at
+         and the saved 'facts' of the hosts
+     :return: PlaybookResult object
     """
     ansible_args = ansible_args or []
     LOG.debug("Additional ansible args: {}".format(ansible_args))
 
-    # hack for verbosity
-    from ansible.utils.display import Display
-    display = Display(verbosity=verbose)
-    import __main__ as main
-    setattr(main, "display", display)
-
-    # TODO(yfried): Use proper ansible API instead of emulating CLI
-    cli_args = ['execute',
-                playbook_path,
-                '--inventory', ir_workspace.inventory]
+    if runner is None:
+        runner = AnsibleRunner(ir_workspace.inventory)
 
-    # infrared should not change ansible verbosity unless user specifies that
-    if verbose:
-        cli_args.append('-' + 'v' * int(verbose))
+    vars_dict = extra_vars or {}
+    with _ansible_outputs(ir_workspace, ir_plugin, vars_dict) as outputs:
+        result = runner.run(playbook_path, vars_dict=vars_dict,
+                            verbose=verbose, ansible_args=ansible_args,
+                            ssh_warmup=ssh_warmup, resume=resume)
+    result.output_files = outputs
 
-    cli_args.extend(ansible_args)
-
-    results = _run_playbook(cli_args, vars_dict=extra_vars or {},
-                            ir_workspace=ir_workspace, ir_plugin=ir_plugin)
-
-    if results:
+    if result.rc:
         LOG.error('Playbook "%s" failed!' % playbook_path)
-    return results
+        for task in result.failed_tasks:
+            LOG.error('{status} task "{task}" on "{host}": {msg}'.format(
+                **task))
+    return result
 
 
-def _run_playbook(cli_args, vars_dict, ir_workspace, ir_plugin):
-    """Runs ansible cli with vars dict
+@contextlib.contextmanager
+def _ansible_outputs(ir_workspace, ir_plugin, vars_dict):
+    """Redirects Ansible outputs as requested by the environment.
 
-    :param vars_dict: dict, Will be passed as Ansible extra-vars
-    :param cli_args: the list  of command line arguments
     :param ir_workspace: An Infrared Workspace object represents the active
      workspace
     :param ir_plugin: An InfraredPlugin object of the current plugin
-    :return: ansible results
+    :param vars_dict: dict, Ansible extra-vars to save if requested
+    :return: dict of the created files: 'vars_file', 'log_file' and
+        'log_file_no_ansi'
     """
+    from distutils.util import strtobool
+
+    stdout = not bool(
+        strtobool(os.environ.get('IR_ANSIBLE_NO_STDOUT', 'no')))
+    stderr = not bool(
+        strtobool(os.environ.get('IR_ANSIBLE_NO_STDERR', 'no')))
+
+    ansible_outputs_dir = \
+        os.path.join(ir_workspace.path, 'ansible_outputs')
+    ansible_vars_dir = \
+        os.path.join(ir_workspace.path, 'ansible_vars')
+
+    timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%S.%f")
+    filename_template = \
+        "ir_{timestamp}_{plugin_name}{postfix}.{file_ext}"
+
+    for _dir in (ansible_outputs_dir, ansible_vars_dir):
+        try:
+            os.makedirs(_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    # used by the callback plugins to store their reports
+    os.environ['IR_ANSIBLE_OUTPUTS_DIR'] = ansible_outputs_dir
+    output_files = {}
+
+    if bool(strtobool(os.environ.get('IR_GEN_VARS_JSON', 'no'))):
+        filename = filename_template.format(
+            timestamp=timestamp,
+            plugin_name=ir_plugin.name,
+            postfix='',
+            file_ext='json'
+        )
+        vars_file = os.path.join(ansible_vars_dir, filename)
+        with open(vars_file, 'w') as fp:
+            json.dump(vars_dict, fp, indent=4, sort_keys=True)
+        output_files['vars_file'] = vars_file
+
+    with IRSTDFDManager(stdout=stdout, stderr=stderr) as fd_manager:
+
+        if bool(strtobool(os.environ.get(
+                'IR_ANSIBLE_LOG_OUTPUT', 'no'))):
+            filename = filename_template.format(
+                timestamp=timestamp,
+                plugin_name=ir_plugin.name,
+                postfix='',
+                file_ext='log'
+            )
+            log_file = os.path.join(ansible_outputs_dir, filename)
+            fd_manager.add(open(log_file, 'w'))
+            output_files['log_file'] = log_file
+
+        if bool(strtobool(os.environ.get(
+                'IR_ANSIBLE_LOG_OUTPUT_NO_ANSI', 'no'))):
+            filename = filename_template.format(
+                timestamp=timestamp,
+                plugin_name=ir_plugin.name,
+                postfix='_no_ansi',
+                file_ext='log'
+            )
+            log_file = os.path.join(ansible_outputs_dir, filename)
+            fd_manager.add(NoAnsiFile(open(log_file, 'w')))
+            output_files['log_file_no_ansi'] = log_file
+
+        yield output_files
+
+
+def _run_playbook_cli(cli_args, vars_dict, verbose=None):
+    """Runs ansible cli with vars dict (ansible < 2.8)
+
+    :param cli_args: the list  of command line arguments
+    :param vars_dict: dict, Will be passed as Ansible extra-vars
+    :param verbose: Ansible verbosity level
+    :return: ansible exit code
+    """
+    # hack for verbosity
+    from ansible.utils.display import Display
+    display = Display(verbosity=verbose)
+    import __main__ as main
+    setattr(main, "display", display)
 
-    # TODO(yfried): use ansible vars object instead of tmpfile
     # NOTE(oanufrii): !!!this import should be exactly here!!!
     #                 Ansible uses 'display' singleton from '__main__' and
     #                 gets it on module level. While we monkeypatching our
-    #                 '__main__' in 'ansible_playbook' function import of
-    #                 PlaybookCLI shoul be after that, to get patched
-    #                 '__main__'. Otherwise ansible gets unpatched '__main__'
-    #                 and creates new 'display' object with default (0)
-    #                 verbosity.
-    # NOTE(afazekas): GlobalCLIArgs gets value only once per invocation, but
-    # since it has singleton decorator, so it would remember to old arguments in different tests
-    # removing the singleton decorator
-    try:
-        from ansible.utils import context_objects
-        context_objects.GlobalCLIArgs = context_objects.CLIArgs
-    except ImportError:
-        # older version
-        pass
-
+    #                 '__main__' above import of PlaybookCLI should be after
+    #                 that, to get patched '__main__'. Otherwise ansible gets
+    #                 unpatched '__main__' and creates new 'display' object
+    #                 with default (0) verbosity.
     from ansible.cli.playbook import PlaybookCLI
     from ansible.errors import AnsibleOptionsError
     from ansible.errors import AnsibleParserError
 
     with tempfile.NamedTemporaryFile(
             mode='w+', prefix="ir-settings-", delete=True) as tmp:
-        tmp.write(yaml.safe_dump(vars_dict, default_flow_style=False))
+        yaml_io.dump(vars_dict, tmp, default_flow_style=False)
         # make sure created file is readable.
         tmp.flush()
-        cli_args.extend(['--extra-vars', "@" + tmp.name])
-
-        if not bool(strtobool(os.environ.get('IR_NO_EXTRAS', 'no'))):
-            ir_extras = {
-                'infrared': {
-                    'python': {
-                        'executable': sys.executable,
-                        'version': {
-                            'full': sys.version.split()[0],
-                            'major': sys.version_info.major,
-                            'minor': sys.version_info.minor,
-                            'micro': sys.version_info.micro,
-                        }
-                    }
-                }
-            }
+        cli_args = cli_args + ['--extra-vars', "@" + tmp.name]
+
+        ir_extras = _get_ir_extras()
+        if ir_extras:
             cli_args.extend(['--extra-vars', str(ir_extras)])
 
         cli = PlaybookCLI(cli_args)
         LOG.debug('Starting ansible cli with args: {}'.format(cli_args[1:]))
         try:
             cli.parse()
-
-            stdout = not bool(
-                strtobool(os.environ.get('IR_ANSIBLE_NO_STDOUT', 'no')))
-            stderr = not bool(
-                strtobool(os.environ.get('IR_ANSIBLE_NO_STDERR', 'no')))
-
-            ansible_outputs_dir = \
-                os.path.join(ir_workspace.path, 'ansible_outputs')
-            ansible_vars_dir = \
-                os.path.join(ir_workspace.path, 'ansible_vars')
-
-            timestamp = datetime.utcnow().strftime("%Y-%m-%d_%H-%M-%S.%f")
-            filename_template = \
-                "ir_{timestamp}_{plugin_name}{postfix}.{file_ext}"
-
-            for _dir in (ansible_outputs_dir, ansible_vars_dir):
-                try:
-                    os.makedirs(_dir)
-                except OSError as e:
-                    if e.errno != errno.EEXIST:
-                        raise
-
-            if bool(strtobool(os.environ.get('IR_GEN_VARS_JSON', 'no'))):
-                filename = filename_template.format(
-                    timestamp=timestamp,
-                    plugin_name=ir_plugin.name,
-                    postfix='',
-                    file_ext='json'
-                )
-                vars_file = os.path.join(ansible_vars_dir, filename)
-                with open(vars_file, 'w') as fp:
-                    json.dump(vars_dict, fp, indent=4, sort_keys=True)
-
-            with IRSTDFDManager(stdout=stdout, stderr=stderr) as fd_manager:
-
-                if bool(strtobool(os.environ.get(
-                        'IR_ANSIBLE_LOG_OUTPUT', 'no'))):
-                    filename = filename_template.format(
-                        timestamp=timestamp,
-                        plugin_name=ir_plugin.name,
-                        postfix='',
-                        file_ext='log'
-                    )
-                    log_file = os.path.join(ansible_outputs_dir, filename)
-                    fd_manager.add(open(log_file, 'w'))
-
-                if bool(strtobool(os.environ.get(
-                        'IR_ANSIBLE_LOG_OUTPUT_NO_ANSI', 'no'))):
-                    filename = filename_template.format(
-                        timestamp=timestamp,
-                        plugin_name=ir_plugin.name,
-                        postfix='_no_ansi',
-                        file_ext='log'
-                    )
-                    log_file = os.path.join(ansible_outputs_dir, filename)
-                    fd_manager.add(NoAnsiFile(open(log_file, 'w')))
-
-                # Return the result:
-                # 0: Success
-                # 1: "Error"
-                # 2: Host failed
-                # 3: Unreachable
-                # 4: Parser Error
-                # 5: Options error
-
-                return cli.run()
-
+            return cli.run()
         except (AnsibleParserError, AnsibleOptionsError) as error:
             LOG.error('{}: {}'.format(type(error), error))
             raise error
@@ -0,0 +1,124 @@
+"""The Ansible facts cache of a workspace.
+
+The facts gathered by the plugins playbooks are stored (by the Ansible
+'jsonfile' cache plugin) in the workspace, so the next playbooks don't
+gather the facts of the same hosts again until the cache expires. The cache
+is dropped when the workspace inventory is switched to a different file.
+"""
+import json
+import os
+import shutil
+import time
+
+from infrared.core.utils import logger
+
+LOG = logger.LOG
+
+FACTS_DIR = '.facts'
+# the file with the path of the inventory the facts were gathered from
+INVENTORY_STAMP_FILE = '.inventory'
+DEFAULT_TIMEOUT = 7200
+
+
+def get_timeout():
+    """Gets the cache timeout set by the ``IR_FACT_CACHE_TIMEOUT`` variable.
+
+    :return: seconds the cached facts are valid for
+    """
+    return int(os.environ.get('IR_FACT_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+
+
+class FactCache(object):
+    """The facts cache of the workspace hosts. """
+
+    def __init__(self, workspace, timeout=DEFAULT_TIMEOUT):
+        """Initializes the cache.
+
+        :param workspace: the Workspace object
+        :param timeout: seconds the cached facts are valid for, 0 means the
+            facts never expire
+        """
+        self.workspace = workspace
+        self.path = os.path.join(workspace.path, FACTS_DIR)
+        self.timeout = timeout
+
+    @property
+    def _stamp_file(self):
+        return os.path.join(self.path, INVENTORY_STAMP_FILE)
+
+    def _get_inventory_target(self):
+        return os.path.realpath(self.workspace.inventory)
+
+    def prepare(self):
+        """Creates the cache and drops it if the inventory is switched. """
+        if os.path.isfile(self._stamp_file):
+            with open(self._stamp_file) as fp:
+                if fp.read() == self._get_inventory_target():
+                    return
+            LOG.debug("Inventory changed, dropping the facts cache")
+            self.purge()
+        self.stamp()
+
+    def stamp(self):
+        """Marks the cached facts as gathered from the current inventory. """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        with open(self._stamp_file, 'w') as fp:
+            fp.write(self._get_inventory_target())
+
+    def _get_host_file(self, host):
+        return os.path.join(self.path, host)
+
+    def list(self):
+        """Lists the cached hosts.
+
+        :return: list of dicts with the host name, the cache 'age' (seconds),
+            whether it's 'expired' and the number of 'facts'
+        """
+        if not os.path.isdir(self.path):
+            return []
+
+        hosts = []
+        now = time.time()
+        for host in sorted(os.listdir(self.path)):
+            host_file = self._get_host_file(host)
+            if host.startswith('.') or not os.path.isfile(host_file):
+                continue
+            age = now - os.path.getmtime(host_file)
+            hosts.append(dict(
+                host=host, age=age,
+                expired=bool(self.timeout) and age > self.timeout,
+                facts=len(self.get(host))))
+        return hosts
+
+    def get(self, host):
+        """Gets the cached facts of the host.
+
+        :param host: the host name
+        :return: dict of the host facts, empty if the host isn't cached
+        """
+        try:
+            with open(self._get_host_file(host)) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def purge(self, hosts=None):
+        """Removes the cached facts.
+
+        :param hosts: list of the hosts to remove, all the cache (including
+            the inventory stamp) is removed if not set
+        :return: list of the removed hosts
+        """
+        if hosts is None:
+            removed = [host['host'] for host in self.list()]
+            if os.path.isdir(self.path):
+                shutil.rmtree(self.path)
+            return removed
+
+        removed = []
+        for host in hosts:
+            if os.path.isfile(self._get_host_file(host)):
+                os.remove(self._get_host_file(host))
+                removed.append(host)
+        return removed
@@ -0,0 +1,359 @@
+"""The ledger of the plugins runs in a workspace.
+
+Every plugin run is recorded into the SQLite database in the workspace
+directory, so the runs can be queried (by plugin, status or time) without
+parsing the log files.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from infrared.core.utils import logger
+
+LOG = logger.LOG
+
+HISTORY_FILE_NAME = '.history.db'
+
+STATUS_RUNNING = 'running'
+STATUS_PASSED = 'passed'
+STATUS_FAILED = 'failed'
+STATUS_ERROR = 'error'
+STATUSES = (STATUS_RUNNING, STATUS_PASSED, STATUS_FAILED, STATUS_ERROR)
+
+SCHEMA_VERSION = 1
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    plugin TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    duration REAL,
+    rc INTEGER,
+    failed_hosts TEXT,
+    vars_hash TEXT,
+    playbook_hash TEXT,
+    plugin_revision TEXT,
+    command TEXT,
+    output_files TEXT,
+    inventory_hash TEXT,
+    args_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_plugin_started ON runs (plugin, started);
+CREATE INDEX IF NOT EXISTS runs_status_started ON runs (status, started);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+"""
+
+# the directories which are not part of the plugin playbooks tree
+EXCLUDED_DIRS = ('.git', '__pycache__', '.tox')
+
+
+def get_vars_hash(vars_dict):
+    """Gets the hash of the vars dict.
+
+    :param vars_dict: dict, the vars passed to the playbook
+    :return: sha256 hex digest of the vars dict
+    """
+    data = json.dumps(vars_dict, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def get_args_hash(ansible_args, resume=False):
+    """Gets the hash of the arguments which limit the playbook run.
+
+    :param ansible_args: list of the ansible-playbook arguments (tags,
+        limit, start-at-task, etc.)
+    :param resume: whether the run is resumed from the failed task
+    :return: sha256 hex digest of the sorted arguments and the resume flag
+    """
+    data = json.dumps(dict(ansible_args=sorted(ansible_args or []),
+                           resume=bool(resume)), sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def get_file_hash(path):
+    """Gets the hash of the file content.
+
+    :param path: path to the file
+    :return: sha256 hex digest of the file, None if the file is missing
+    """
+    file_hash = hashlib.sha256()
+    try:
+        with open(path, 'rb') as fd:
+            for chunk in iter(lambda: fd.read(1024 * 1024), b''):
+                file_hash.update(chunk)
+    except (IOError, OSError):
+        return None
+    return file_hash.hexdigest()
+
+
+def get_tree_hash(path):
+    """Gets the hash of all the files in the directory tree.
+
+    :param path: path to the directory
+    :return: sha256 hex digest of the files paths and their content
+    """
+    tree_hash = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if d not in EXCLUDED_DIRS)
+        for file_name in sorted(files):
+            file_path = os.path.join(root, file_name)
+            if not os.path.isfile(file_path):
+                continue
+            tree_hash.update(
+                os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+            with open(file_path, 'rb') as fd:
+                for chunk in iter(lambda: fd.read(1024 * 1024), b''):
+                    tree_hash.update(chunk)
+    return tree_hash.hexdigest()
+
+
+def get_git_revision(path):
+    """Gets the git revision of the directory.
+
+    Unlike the tree hash, it's cheap enough to be recorded for every run.
+
+    :param path: path to the directory in a git repository
+    :return: the HEAD commit sha with the '-dirty' suffix if the files in the
+        directory are changed, None if it's not in a git repository
+    """
+    try:
+        import git
+    except ImportError:
+        # no git executable
+        return None
+
+    try:
+        repo = git.Repo(path, search_parent_directories=True)
+        revision = repo.head.commit.hexsha
+        dirty = repo.is_dirty(untracked_files=True, path=path)
+    except (git.exc.GitError, ValueError):
+        # not a git repository or it has no commits
+        return None
+    return revision + ('-dirty' if dirty else '')
+
+
+class RunHistory(object):
+    """The plugins runs history of a workspace. """
+
+    def __init__(self, path):
+        """Initializes the history.
+
+        :param path: path to the history database file
+        """
+        self.path = path
+        self._schema_ready = False
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        if not self._schema_ready:
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                connection.executescript(SCHEMA)
+                connection.execute(
+                    "PRAGMA user_version = {}".format(SCHEMA_VERSION))
+                connection.commit()
+            self._schema_ready = True
+        return connection
+
+    def start(self, plugin, vars_hash=None, playbook_hash=None,
+              inventory_hash=None, args_hash=None, command=None,
+              plugin_revision=None):
+        """Records the start of the plugin run.
+
+        :param plugin: the plugin name
+        :param vars_hash: hash of the vars passed to the playbook
+        :param playbook_hash: hash of the plugin playbooks tree
+        :param inventory_hash: hash of the inventory file content
+        :param args_hash: hash of the ansible-playbook arguments
+        :param command: the infrared command line
+        :param plugin_revision: the git revision of the plugin
+        :return: the run id, None if the run could not be recorded
+        """
+        try:
+            connection = self._connect()
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO runs (plugin, status, started, vars_hash, "
+                    "playbook_hash, plugin_revision, inventory_hash, "
+                    "args_hash, command) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (plugin, STATUS_RUNNING, time.time(), vars_hash,
+                     playbook_hash, plugin_revision, inventory_hash,
+                     args_hash, command))
+            connection.close()
+            return cursor.lastrowid
+        except sqlite3.Error as ex:
+            LOG.warning("Failed to record the run in {}: {}".format(
+                self.path, ex))
+
+    def finish(self, run_id, rc=None, failed_hosts=None, output_files=None):
+        """Records the end of the plugin run.
+
+        :param run_id: the run id returned by ``start``
+        :param rc: the playbook exit code, None if the run has crashed
+        :param failed_hosts: list of the failed & unreachable hosts
+        :param output_files: dict of the run output files (logs, vars)
+        """
+        if run_id is None:
+            return
+        if rc is None:
+            status = STATUS_ERROR
+        else:
+            status = STATUS_FAILED if rc else STATUS_PASSED
+        finished = time.time()
+        try:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "UPDATE runs SET status = ?, finished = ?, "
+                    "duration = ? - started, rc = ?, failed_hosts = ?, "
+                    "output_files = ? WHERE id = ?",
+                    (status, finished, finished, rc,
+                     json.dumps(failed_hosts or []),
+                     json.dumps(output_files or {}), run_id))
+            connection.close()
+        except sqlite3.Error as ex:
+            LOG.warning("Failed to record the run in {}: {}".format(
+                self.path, ex))
+
+    @staticmethod
+    def _get_run(row):
+        """Converts the database row to the run dict. """
+        run = dict(zip(row.keys(), row))
+        run['failed_hosts'] = json.loads(run['failed_hosts'] or '[]')
+        run['output_files'] = json.loads(run['output_files'] or '{}')
+        return run
+
+    @staticmethod
+    def _get_filters(plugin=None, status=None, since=None, until=None):
+        conditions, params = [], []
+        if plugin:
+            conditions.append("plugin = ?")
+            params.append(plugin)
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if since is not None:
+            conditions.append("started >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("started < ?")
+            params.append(until)
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        return where, params
+
+    def list(self, plugin=None, status=None, since=None, until=None,
+             limit=None):
+        """Lists the recorded runs, the latest first.
+
+        :param plugin: the plugin name to filter by
+        :param status: the run status to filter by
+        :param since: timestamp, only the runs started since then
+        :param until: timestamp, only the runs started before then
+        :param limit: max number of the runs to return
+        :return: list of the runs dicts
+        """
+        if not os.path.exists(self.path):
+            return []
+        where, params = self._get_filters(plugin, status, since, until)
+        query = "SELECT * FROM runs" + where + " ORDER BY started DESC, id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        connection = self._connect()
+        runs = [self._get_run(row)
+                for row in connection.execute(query, params)]
+        connection.close()
+        return runs
+
+    def find_passed(self, plugin, vars_hash, playbook_hash, inventory_hash,
+                    args_hash=None):
+        """Finds the passed run of the plugin with the same fingerprint.
+
+        Only the latest run with the same vars, plugin files, inventory and
+        ansible-playbook arguments is checked, so the run which has failed
+        after passing is not found and the partial run (e.g. with tags or
+        resumed) doesn't stand for the full one.
+
+        :param plugin: the plugin name
+        :param vars_hash: hash of the vars passed to the playbook
+        :param playbook_hash: hash of the plugin playbooks tree
+        :param inventory_hash: hash of the inventory file content
+        :param args_hash: hash of the ansible-playbook arguments
+        :return: the run dict, None if there is no such run
+        """
+        if not os.path.exists(self.path):
+            return None
+        try:
+            connection = self._connect()
+            row = connection.execute(
+                "SELECT * FROM runs WHERE plugin = ? AND vars_hash = ? AND "
+                "playbook_hash = ? AND inventory_hash IS ? AND "
+                "args_hash IS ? AND status != ? "
+                "ORDER BY started DESC, id DESC LIMIT 1",
+                (plugin, vars_hash, playbook_hash, inventory_hash, args_hash,
+                 STATUS_RUNNING)).fetchone()
+            connection.close()
+        except sqlite3.Error as ex:
+            LOG.warning("Failed to read the runs from {}: {}".format(
+                self.path, ex))
+            return None
+        if row is None or row['status'] != STATUS_PASSED:
+            return None
+        return self._get_run(row)
+
+    def summary(self, plugin=None, since=None, until=None):
+        """Gets the runs statistics of every plugin.
+
+        :param plugin: the plugin name to filter by
+        :param since: timestamp, only the runs started since then
+        :param until: timestamp, only the runs started before then
+        :return: list of dicts with the plugin name, number of all, passed
+            and failed runs and average, min & max duration of passed runs
+        """
+        if not os.path.exists(self.path):
+            return []
+        where, params = self._get_filters(plugin, since=since, until=until)
+        query = (
+            "SELECT plugin, COUNT(*) AS runs, "
+            "SUM(status = '{passed}') AS passed, "
+            "SUM(status IN ('{failed}', '{error}')) AS failed, "
+            "AVG(CASE WHEN status = '{passed}' THEN duration END) AS average, "
+            "MIN(CASE WHEN status = '{passed}' THEN duration END) AS minimum, "
+            "MAX(CASE WHEN status = '{passed}' THEN duration END) AS maximum "
+            "FROM runs{where} GROUP BY plugin ORDER BY plugin").format(
+                passed=STATUS_PASSED, failed=STATUS_FAILED,
+                error=STATUS_ERROR, where=where)
+
+        connection = self._connect()
+        stats = [dict(zip(row.keys(), row))
+                 for row in connection.execute(query, params)]
+        connection.close()
+        return stats
+
+
+def parse_time(value):
+    """Parses the time given on the command line.
+
+    :param value: the date ('2020-01-31'), the date and time
+        ('2020-01-31 13:30', '2020-01-31T13:30:00') or the time ago with the
+        unit suffix: m(inutes), h(ours), d(ays) or w(eeks), for example '12h'
+    :return: the timestamp
+    """
+    units = dict(m=60, h=60 * 60, d=24 * 60 * 60, w=7 * 24 * 60 * 60)
+    value = value.strip()
+    if value[-1:] in units and value[:-1].isdigit():
+        return time.time() - int(value[:-1]) * units[value[-1]]
+
+    for time_format in ("%Y-%m-%d", "%Y-%m-%d %H:%M", "%Y-%m-%d %H:%M:%S",
+                        "%Y-%m-%dT%H:%M", "%Y-%m-%dT%H:%M:%S"):
+        try:
+            return time.mktime(time.strptime(value, time_format))
+        except ValueError:
+            pass
+    raise ValueError("Unsupported time format: '{}'".format(value))
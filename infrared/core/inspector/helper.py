@@ -1,4 +1,5 @@
 from copy import deepcopy
+from infrared.core.inspector.validator import ArgsValidator
 from infrared.core.utils.exceptions import SpecParserException
 
 OptionState = dict(
@@ -21,21 +22,80 @@ class SpecDictHelper(object):
         for subparser_name, subparser_dict in parser_dict.get(
                 'subparsers', {}).items():
             self._include_groups(subparser_dict)
+        # the options index & the validator, built on the first use
+        self._parsers = None
+        self._validator = None
+
+    def spec_changed(self):
+        """Drops the options index & the validator of the changed spec. """
+        self._parsers = None
+        self._validator = None
+
+    def _index_options(self):
+        """Indexes the options of all the parsers.
+
+        The options are looked up for every received argument, so the
+        option specs are collected once per spec and the lookups don't walk
+        the spec dict again. The indexed specs are shared by all the lookups
+        and must not be modified.
+        """
+        if self._parsers is not None:
+            return
+        self._parsers = tuple(
+            dict(name=subparser_name, **subparser_dict)
+            for subparser_name, subparser_dict in self.spec_dict.get(
+                'subparsers', {}).items())
+        # parser name -> tuple of the option specs
+        self._parser_options = {}
+        # parser name -> {option name -> option spec}
+        self._option_specs = {}
+        # parser name -> {option type -> tuple of the option specs}
+        self._type_options = {}
+        # option name -> frozenset of the parsers names
+        option_parsers = {}
+
+        for parser in self._parsers:
+            options = tuple(self._get_all_options_spec(parser))
+            specs = {}
+            types = {}
+            for option in options:
+                # the first option is used when the name is duplicated
+                specs.setdefault(option['name'], option)
+                types.setdefault(option.get('type'), []).append(option)
+                option_parsers.setdefault(option['name'], set()).add(
+                    parser['name'])
+            self._parser_options[parser['name']] = options
+            self._option_specs[parser['name']] = specs
+            self._type_options[parser['name']] = dict(
+                (type_name, tuple(type_options))
+                for type_name, type_options in types.items())
+
+        self._option_parsers = dict(
+            (option_name, frozenset(parsers))
+            for option_name, parsers in option_parsers.items())
+
+    @property
+    def validator(self):
+        """The ArgsValidator compiled once per spec. """
+        if self._validator is None:
+            self._validator = ArgsValidator(self)
+        return self._validator
 
     def iterate_parsers(self):
         """Iterates over the main parsers and subparsers. """
+        self._index_options()
 
-        for subparser_name, subparser_dict in self.spec_dict.get(
-                'subparsers', {}).items():
-            yield dict(name=subparser_name, **subparser_dict)
+        for parser in self._parsers:
+            yield parser
 
     def iterate_option_specs(self):
         """Iterates over all the option specs.
 
         Returns pair of parser and option on every iteration.
         """
-        for parser in self.iterate_parsers():
-            for spec_option in self._get_all_options_spec(parser):
+        self._index_options()
+        for parser in self._parsers:
+            for spec_option in self._parser_options[parser['name']]:
                 yield parser, spec_option
 
     @staticmethod
@@ -55,21 +115,37 @@ class SpecDictHelper(object):
         """Gets all the options for the specified command
 
         :param command_name: the command name (main, virsh, ospd, etc...)
-        :return: the list of all command options
+        :return: the tuple of all command options
         """
-        options = []
-        for parser in self.iterate_parsers():
-            if parser['name'] == command_name:
-                options = self._get_all_options_spec(parser)
-                break
-        return options
+        self._index_options()
+        return self._parser_options.get(command_name, ())
 
     def get_option_spec(self, command_name, argument_name):
         """Gets the specification for the specified option name. """
+        self._index_options()
+        return self._option_specs.get(command_name, {}).get(
+            argument_name, {})
+
+    def get_option_specs_by_type(self, command_name, type_names):
+        """Gets the command options of the specified types.
+
+        :param command_name: the command name (main, virsh, ospd, etc...)
+        :param type_names: the option types names
+        :return: the list of the command options with one of the types
+        """
+        self._index_options()
+        type_options = self._type_options.get(command_name, {})
+        return [option for type_name in type_names
+                for option in type_options.get(type_name, ())]
+
+    def get_option_parsers(self, option_name):
+        """Gets the commands which have the specified option.
 
-        options = self.get_parser_option_specs(command_name)
-        return next((opt for opt in options
-                     if opt['name'] == argument_name), {})
+        :param option_name: the option name
+        :return: frozenset of the commands names
+        """
+        self._index_options()
+        return self._option_parsers.get(option_name, frozenset())
 
     def get_option_state(self, command_name, option_name, args):
         """Gets the option state.
@@ -96,8 +172,12 @@ class SpecDictHelper(object):
         return res
 
     def _include_groups(self, parser_dict):
-        """Resolves the include dict directive in the spec files. """
-        for group in parser_dict.get('include_groups', []):
+        """Resolves the include dict directive in the spec files.
+
+        The directive is removed once resolved, so an already flattened
+        spec dict (e.g. loaded from the spec cache) is left untouched.
+        """
+        for group in parser_dict.pop('include_groups', []):
             # ensure we have that group
             grp_dict = next(
                 (grp for grp in self.spec_dict.get('shared_groups', [])
@@ -2,14 +2,16 @@ import collections
 import os
 from six.moves import configparser
 from string import Template
-import yaml
 
 from infrared.core.cli.cli import CliParser
 from infrared.core.cli.cli import COMPLEX_TYPES
 from infrared.core.inspector import helper
+from infrared.core.settings import LayeredVars
 from infrared.core.utils import dict_utils
 from infrared.core.utils import exceptions
 from infrared.core.utils import logger
+from infrared.core.utils import profiler
+from infrared.core.utils import yaml_io
 
 LOG = logger.LOG
 
@@ -27,23 +29,49 @@ class SpecParser(object):
         :return: SpecParser object based on given plugin spec & vars
         """
 
-        spec_dict = base_groups or {}
-        with open(plugin.spec) as stream:
-            spec = yaml.safe_load(stream) or {}
-            dict_utils.dict_merge(
-                base_groups,
-                spec,
-                dict_utils.ConflictResolver.unique_append_list_resolver)
+        with profiler.phase("spec parsing: {}".format(plugin.name)):
+            spec_dict = cls.load_spec_dict(plugin, base_groups)
 
         # The "try-excpet" block here is for adding spec file path if it
         # includes an unsupported option type
         try:
-            return SpecParser(subparser, spec_dict, plugin.vars_dir,
-                              plugin.defaults_dir, plugin.path)
+            with profiler.phase("parser creation: {}".format(plugin.name)):
+                return SpecParser(subparser, spec_dict, plugin.vars_dir,
+                                  plugin.defaults_dir, plugin.path)
         except exceptions.IRUnsupportedSpecOptionType as ex:
             ex.message += ' in file: {}'.format(plugin.spec)
             raise ex
 
+    @staticmethod
+    def load_spec_dict(plugin, base_groups):
+        """Reads plugin spec, merges it with base groups and flattens it
+
+        When the plugin has a spec cache, the flattened dict is loaded from
+        it, so the spec file isn't parsed again until it's changed.
+
+        :param plugin: InfraredPlugin object
+        :param base_groups: dict, included groups
+        :return: dict, flattened spec dict (``include_groups`` resolved)
+        """
+        spec_cache = getattr(plugin, 'spec_cache', None)
+        cache_section = 'spec_dict' if base_groups else 'bare_spec_dict'
+        if spec_cache is not None:
+            spec_dict = spec_cache.get(plugin.spec, cache_section)
+            if spec_dict is not None:
+                return spec_dict
+
+        spec_dict = base_groups or {}
+        spec = yaml_io.load_file(plugin.spec) or {}
+        dict_utils.dict_merge(
+            spec_dict,
+            spec,
+            dict_utils.ConflictResolver.unique_append_list_resolver)
+        helper.SpecDictHelper(spec_dict)
+
+        if spec_cache is not None:
+            spec_cache.put(plugin.spec, cache_section, spec_dict)
+        return spec_dict
+
     def __init__(self, subparser, spec_dict, vars_dir, defaults_dir,
                  plugin_path):
         """Constructor.
@@ -57,6 +85,8 @@ class SpecParser(object):
         self.defaults = defaults_dir
         self.plugin_path = plugin_path
         self.spec_helper = helper.SpecDictHelper(spec_dict)
+        # the sources of the last parsed arguments (see get_args_sources)
+        self.args_sources = {}
 
         # create parser
         self.parser = CliParser.create_parser(self, subparser)
@@ -69,6 +99,7 @@ class SpecParser(object):
         shared_groups = self.spec_helper.spec_dict.get('shared_groups', [])
         shared_groups.expand(list_of_groups)
         self.spec_helper.spec_dict['shared_groups'] = shared_groups
+        self.spec_helper.spec_changed()
 
     def _get_defaults(self, default_getter_func):
         """Resolve arguments' values from cli or answers file.
@@ -248,16 +279,16 @@ class SpecParser(object):
 
         return file_generated
 
-    def resolve_custom_types(self, args):
+    def resolve_custom_types(self, args, validate_only=False):
         """Transforms the arguments with custom types
 
         :param args: the list of received arguments.
+        :param validate_only: whether to skip the types which change the
+            workspace (e.g. the inventory) when resolved
         """
         for parser_name, parser_dict in args.items():
-            spec_complex_options = [opt for opt in
-                                    self.spec_helper.get_parser_option_specs(
-                                        parser_name) if
-                                    opt.get('type', None) in COMPLEX_TYPES]
+            spec_complex_options = self.spec_helper.get_option_specs_by_type(
+                parser_name, COMPLEX_TYPES)
             for spec_option in spec_complex_options:
                 option_name = spec_option['name']
                 if option_name in parser_dict:
@@ -269,6 +300,8 @@ class SpecParser(object):
                         type_name,
                         option_name,
                         spec_option)
+                    if validate_only and action.has_side_effects:
+                        continue
 
                     # resolving value
                     parser_dict[option_name] = action.resolve(option_value)
@@ -294,9 +327,12 @@ class SpecParser(object):
             subcommand,
             spec_option)
 
-    def parse_args(self, arg_parser, args=None):
+    def parse_args(self, arg_parser, args=None, validate_only=False):
         """Parses all the arguments (cli, answers file)
 
+        :param validate_only: whether only to validate the arguments, with no
+            side effects: the arguments file and the answers file are not
+            written and the workspace inventory is not changed
         :return: None, if ``--generate-answers-file`` in arg_arg_parser
         :return: (dict, dict):
             * command arguments dict (arguments to control the IR logic)
@@ -304,12 +340,15 @@ class SpecParser(object):
         """
 
         spec_defaults = self.get_spec_defaults()
-        cli_args = CliParser.parse_cli_input(arg_parser, args)
+        cli_args = CliParser.parse_cli_input(arg_parser, args,
+                                             save_args=not validate_only)
 
-        file_args = self.get_answers_file_args(cli_args)
+        with profiler.phase("answers file resolution"):
+            file_args = self.get_answers_file_args(cli_args)
 
         # generate answers file and exit
-        if self.generate_answers_file(cli_args, spec_defaults):
+        if not validate_only and \
+                self.generate_answers_file(cli_args, spec_defaults):
             LOG.warning("Answers file generated. Exiting.")
 
         # print warnings when something was overridden from non-cli source.
@@ -330,17 +369,38 @@ class SpecParser(object):
 
         dict_utils.dict_merge(defaults, file_args)
         dict_utils.dict_merge(defaults, cli_args)
-        self.validate_requires_args(defaults)
-        self.validate_length_args(defaults)
-        self.validate_choices_args(defaults)
-        self.validate_min_max_args(defaults)
+        self.spec_helper.validator.validate(defaults)
 
         # now resolve complex types.
-        self.resolve_custom_types(defaults)
+        self.resolve_custom_types(defaults, validate_only=validate_only)
         nested, control, custom = \
             self.get_nested_custom_and_control_args(defaults)
+        self.args_sources = self.get_args_sources(defaults, cli_args,
+                                                  file_args)
         return nested, control, custom
 
+    def get_args_sources(self, args, cli_args, file_args):
+        """Gets the sources of the arguments values.
+
+        :param args: the dict of the resolved arguments
+        :param cli_args: the dict of arguments from cli
+        :param file_args: the dict of arguments from the answers file
+        :return: dict of the arguments names (or their ansible variables
+            names) and their sources (cli, answers file or spec defaults)
+        """
+        sources = {}
+        for (parser_name, parser_dict, arg_name, arg_value,
+             arg_spec) in self._iterate_received_arguments(args):
+            if arg_name in cli_args.get(parser_name, {}):
+                source = LayeredVars.SOURCE_CLI
+            elif arg_name in file_args.get(parser_name, {}):
+                source = LayeredVars.SOURCE_ANSWERS_FILE
+            else:
+                source = LayeredVars.SOURCE_SPEC_DEFAULTS
+            sources.setdefault(
+                (arg_spec or {}).get('ansible_variable', arg_name), source)
+        return sources
+
     def validate_arg_deprecation(self, cli_args, answer_file_args):
         """Validates and prints the deprecated arguments.
 
@@ -399,237 +459,6 @@ class SpecParser(object):
                 command_dict.keys()) - file_diff
             show_diff(default_diff, command, def_dict, 'spec defaults')
 
-    def _get_conditionally_required_args(self, command_name, options_spec,
-                                         args):
-        """List arguments with ``required_when`` condition matched.
-
-        :param command_name: the command name.
-        :param options_spec:  the list of command spec options.
-        :param args: the received input arguments
-        :return: list, list of argument names with matched ``required_when``
-            condition
-        """
-        opts_names = [option_spec['name'] for option_spec in options_spec]
-        missing_args = []
-        for option_spec in options_spec:
-            option_results = []
-            if option_spec and 'required_when' in option_spec:
-                req_when_args = [option_spec['required_when']] \
-                    if not type(option_spec['required_when']) is list \
-                    else option_spec['required_when']
-
-                # validate conditions
-                for req_when_arg in req_when_args:
-                    splited_args_list = req_when_arg.split()
-                    for idx, req_arg in enumerate(splited_args_list):
-                        if req_arg in opts_names:
-                            splited_args_list[idx] = \
-                                args.get(command_name, {}).get(req_arg.strip())
-                        if splited_args_list[idx] is None:
-                            option_results.append(False)
-                            break
-                        splited_args_list[idx] = str(splited_args_list[idx])
-                        if (splited_args_list[idx] not in ['and', 'or'] and
-                            not any(
-                                (c in '<>=') for c in splited_args_list[idx])):
-                            splited_args_list[idx] = "'{0}'".format(
-                                yaml.safe_load(splited_args_list[idx]))
-                    else:
-                        option_results.append(
-                            eval(' '.join(splited_args_list)))
-                if all(option_results) and \
-                        self.spec_helper.get_option_state(
-                            command_name,
-                            option_spec['name'],
-                            args) == helper.OptionState['NOT_SET']:
-                    missing_args.append(option_spec['name'])
-        return missing_args
-
-    def validate_requires_args(self, args):
-        """Check if all the required arguments have been provided. """
-
-        silent_args = self.get_silent_args(args)
-
-        def validate_parser(parser_name, expected_options, parser_args):
-            """Helper method to resolve dict_merge. """
-
-            result = collections.defaultdict(list)
-            condition_req_args = self._get_conditionally_required_args(
-                parser_name, expected_options, args)
-
-            for option in expected_options:
-                name = option['name']
-
-                # check required options.
-                if (option.get('required', False) and
-                    name not in parser_args or
-                    option['name'] in condition_req_args) and \
-                        name not in silent_args:
-                    result[parser_name].append(name)
-
-            return result
-
-        res = {}
-        for command_data in self.spec_helper.iterate_parsers():
-            cmd_name = command_data['name']
-            if cmd_name in args:
-                dict_utils.dict_merge(
-                    res,
-                    validate_parser(
-                        cmd_name,
-                        self.spec_helper.get_parser_option_specs(cmd_name),
-                        args[cmd_name]))
-
-        missing_args = dict((cmd_name, args)
-                            for cmd_name, args in res.items() if len(args) > 0)
-        if missing_args:
-            raise exceptions.IRRequiredArgsMissingException(missing_args)
-
-    def validate_length_args(self, args):
-        """Check if value of arguments is not longer than length specified.
-
-        :param args: The received arguments.
-        """
-        invalid_options = []
-        for parser_name, parser_dict in args.items():
-            for spec_option in \
-                    self.spec_helper.get_parser_option_specs(parser_name):
-                if 'length' not in spec_option:
-                    # skip options that does not contain length
-                    continue
-                option_name = spec_option['name']
-                if option_name in parser_dict:
-                    # resolve length
-                    length = spec_option['length']
-                    option_value = parser_dict[option_name]
-                    if len(option_value) > int(length):
-                        # found invalid option, append to list of invalid opts
-                        invalid_options.append((
-                            option_name,
-                            option_value,
-                            length
-                        ))
-        if invalid_options:
-            # raise exception with all arguments that exceed length
-            raise exceptions.IRInvalidLengthException(invalid_options)
-
-    def validate_choices_args(self, args):
-        """Check if value of choice arguments is one of the available choices.
-
-        :param args: The received arguments.
-        """
-        invalid_options = []
-        for parser_name, parser_dict in args.items():
-            for spec_option in \
-                    self.spec_helper.get_parser_option_specs(parser_name):
-                if 'choices' not in spec_option:
-                    # skip options that does not contain choices
-                    continue
-                option_name = spec_option['name']
-                if option_name in parser_dict:
-                    # resolve choices
-                    choices = spec_option['choices']
-                    option_value = parser_dict[option_name]
-                    if option_value not in choices:
-                        # found invalid option, append to list of invalid opts
-                        invalid_options.append((
-                            option_name,
-                            option_value,
-                            choices
-                        ))
-        if invalid_options:
-            # raise exception with all arguments that contains invalid choices
-            raise exceptions.IRInvalidChoiceException(invalid_options)
-
-    def validate_min_max_args(self, args):
-        """Check if value of arguments is between minimum and maximum values.
-
-        :param args: The received arguments.
-        """
-        invalid_options = []
-        for parser_name, parser_dict in args.items():
-            for spec_option in \
-                    self.spec_helper.get_parser_option_specs(parser_name):
-                if all([key not in spec_option
-                        for key in ('maximum', 'minimum')]):
-                    # skip options that does not contain minimum or maximum
-                    continue
-                option_name = spec_option['name']
-
-                if option_name in parser_dict:
-                    option_value = parser_dict[option_name]
-                    min_value = spec_option.get('minimum')
-                    max_value = spec_option.get('maximum')
-                    # handle empty values in spec files which load as None
-                    min_value = '' if 'minimum' in spec_option \
-                                      and min_value is None else min_value
-                    max_value = '' if 'maximum' in spec_option \
-                                      and max_value is None else max_value
-
-                    values = {
-                        "value": option_value,
-                        "maximum": max_value,
-                        "minimum": min_value
-                    }
-
-                    # make sure that values are numbers
-                    is_all_values_numbers = True
-                    for name, num in values.items():
-                        if num is not None \
-                                and (isinstance(num, bool) or
-                                     not isinstance(num, (int, float))):
-                            invalid_options.append((
-                                option_name,
-                                name,
-                                "number",
-                                type(num).__name__
-                            ))
-                            is_all_values_numbers = False
-
-                    if not is_all_values_numbers:
-                        # don't continue to min max checks since some of the
-                        # values are not numbers
-                        continue
-
-                    # check bigger than minimum
-                    if min_value is not None and option_value < min_value:
-                        invalid_options.append((
-                            option_name,
-                            "minimum",
-                            min_value,
-                            option_value
-                        ))
-                    # check smaller than maximum
-                    if max_value is not None and option_value > max_value:
-                        invalid_options.append((
-                            option_name,
-                            "maximum",
-                            max_value,
-                            option_value
-                        ))
-
-        if invalid_options:
-            # raise exception with all arguments that contains invalid choices
-            raise exceptions.IRInvalidMinMaxRangeException(invalid_options)
-
-    def get_silent_args(self, args):
-        """list of silenced argument
-
-        :param args: The received arguments.
-        :return: list, slienced argument names
-        """
-        silent_args_names = []
-        for (parser_name, parser_dict, arg_name, arg_value,
-             arg_spec) in self._iterate_received_arguments(args):
-            if arg_spec and 'silent' in arg_spec and \
-                    self.spec_helper.get_option_state(
-                        parser_name,
-                        arg_name,
-                        args) == helper.OptionState['IS_SET']:
-                silent_args_names.extend(arg_spec['silent'])
-
-        return list(set(silent_args_names))
-
     def get_nested_custom_and_control_args(self, args):
         """Split input arguments to control nested and custom.
 
@@ -647,12 +476,12 @@ class SpecParser(object):
         nested = {}
         control_args = {}
         custom_args = {}
+        nested_types = [ctype_name for ctype_name, klass in
+                        COMPLEX_TYPES.items() if klass.is_nested]
         for (parser_name, parser_dict, arg_name, arg_value,
              arg_spec) in self._iterate_received_arguments(args):
             if all([arg_spec, arg_spec.get('type', None),
-                    arg_spec.get('type', None) in
-                    [ctype_name for ctype_name, klass in
-                     COMPLEX_TYPES.items() if klass.is_nested]
+                    arg_spec.get('type', None) in nested_types
                     ]) or ('is_shared_group_option' not in arg_spec):
                 if arg_name in nested:
                     LOG.warning(
@@ -719,9 +548,9 @@ class SpecParser(object):
         """
         for (parser_name, parser_dict, arg_name, arg_value,
              arg_spec) in self._iterate_received_arguments(cli_args):
+            option_parsers = self.spec_helper.get_option_parsers(arg_name)
             for parser_name2, parser_dict2 in cli_args.items():
                 if all([parser_name2, parser_name != parser_name2,
                         arg_name not in parser_dict2]):
-                    if self.spec_helper.get_option_spec(parser_name2,
-                                                        arg_name):
+                    if parser_name2 in option_parsers:
                         parser_dict2[arg_name] = arg_value
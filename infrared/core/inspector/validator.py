@@ -0,0 +1,283 @@
+"""Validation of the resolved arguments against the spec.
+
+The spec options are compiled into the validation rules once, so the
+resolved arguments are validated in a single pass without looking up the
+option specs or parsing the ``required_when`` conditions again.
+"""
+from infrared.core.utils import exceptions
+from infrared.core.utils import yaml_io
+
+# the words of the 'required_when' conditions and the options values
+# converted to the compared strings, cleared when grown to the max size (the
+# options values are arbitrary and the daemon process is long-lived)
+_LOADED_WORDS = {}
+_LOADED_WORDS_MAX_SIZE = 1024
+
+
+def _load_word(word):
+    """Converts the condition word to the compared string.
+
+    :param word: the word of the condition or the option value
+    :return: the string of the YAML value of the word (e.g. 'yes' -> 'True')
+    """
+    loaded = _LOADED_WORDS.get(word)
+    if loaded is None:
+        if len(_LOADED_WORDS) >= _LOADED_WORDS_MAX_SIZE:
+            _LOADED_WORDS.clear()
+        loaded = _LOADED_WORDS[word] = str(yaml_io.load(word))
+    return loaded
+
+
+def _is_operator(word):
+    return word in ('and', 'or') or any((c in '<>=') for c in word)
+
+
+class RequiredWhenCondition(object):
+    """The compiled ``required_when`` condition.
+
+    The condition is a space separated expression, e.g.
+    ``"option-a == yes and option-b != no"``, where the options names are
+    replaced by the options values and all the operands are compared as the
+    strings of their YAML values.
+    """
+
+    def __init__(self, condition, options_names):
+        """Compiles the condition.
+
+        :param condition: the condition string
+        :param options_names: the names of the command options
+        """
+        self.condition = condition
+        # list of the (word, option name, constant) tuples, the option name
+        # or the constant is None for the operators
+        self.words = []
+        for word in condition.split():
+            if word in options_names:
+                self.words.append((word, word.strip(), None))
+            elif _is_operator(word):
+                self.words.append((word, None, None))
+            else:
+                self.words.append((word, None, _load_word(word)))
+        self.expression = ' '.join(
+            word if option is None and constant is None else '_w{}'.format(
+                idx)
+            for idx, (word, option, constant) in enumerate(self.words))
+        self.code = compile(self.expression, '<required_when>', 'eval')
+
+    def evaluate(self, command_args):
+        """Evaluates the condition.
+
+        :param command_args: dict of the command arguments
+        :return: whether the condition is matched, False if any of the
+            options in the condition isn't set
+        """
+        names = {}
+        for idx, (word, option, constant) in enumerate(self.words):
+            if option is not None:
+                value = command_args.get(option)
+                if value is None:
+                    return False
+                names['_w{}'.format(idx)] = _load_word(str(value))
+            elif constant is not None:
+                names['_w{}'.format(idx)] = constant
+        return eval(self.code, {}, names)
+
+
+class OptionRule(object):
+    """The validation rule of the spec option. """
+
+    def __init__(self, option, options_names):
+        """Compiles the rule of the option.
+
+        :param option: the option spec
+        :param options_names: the names of the command options
+        """
+        self.name = option['name']
+        self.required = option.get('required', False)
+        self.store_true = option.get('action', '') in ['store_true']
+
+        self.required_when = None
+        if 'required_when' in option:
+            conditions = option['required_when']
+            if not type(conditions) is list:
+                conditions = [conditions]
+            self.required_when = [
+                RequiredWhenCondition(condition, options_names)
+                for condition in conditions]
+
+        self.has_length = 'length' in option
+        self.length = option.get('length')
+
+        self.has_choices = 'choices' in option
+        self.choices = option.get('choices')
+        try:
+            self.choices_set = frozenset(self.choices)
+        except TypeError:
+            self.choices_set = None
+
+        self.has_range = 'minimum' in option or 'maximum' in option
+        # handle empty values in spec files which load as None
+        self.minimum = '' if 'minimum' in option and \
+            option['minimum'] is None else option.get('minimum')
+        self.maximum = '' if 'maximum' in option and \
+            option['maximum'] is None else option.get('maximum')
+        self.range_errors = [
+            (self.name, name, "number", type(num).__name__)
+            for name, num in (('maximum', self.maximum),
+                              ('minimum', self.minimum))
+            if not self._is_number(num)]
+
+    @property
+    def is_empty(self):
+        """Whether the rule has nothing to validate. """
+        return not any([self.required, self.required_when is not None,
+                        self.has_length, self.has_choices, self.has_range])
+
+    @staticmethod
+    def _is_number(value):
+        return value is None or (not isinstance(value, bool) and
+                                 isinstance(value, (int, float)))
+
+    def is_set(self, command_args):
+        """Checks whether the option is set in the command arguments. """
+        if self.name not in command_args:
+            return False
+        return not (self.store_true and command_args[self.name] is False)
+
+    def is_missing(self, command_args, silent_args):
+        """Checks whether the required option is missing.
+
+        :param command_args: dict of the command arguments
+        :param silent_args: the options which are not required
+        """
+        if self.name in silent_args:
+            return False
+        if self.required and self.name not in command_args:
+            return True
+        return self.required_when is not None and \
+            all(condition.evaluate(command_args)
+                for condition in self.required_when) and \
+            not self.is_set(command_args)
+
+    def is_invalid_choice(self, value):
+        try:
+            if self.choices_set is not None:
+                return value not in self.choices_set
+        except TypeError:
+            pass
+        return value not in self.choices
+
+    def get_range_errors(self, value):
+        """Gets the minimum & maximum violations of the option value.
+
+        :return: list of (name, expected, expected value, value) tuples
+        """
+        if not self._is_number(value):
+            return [(self.name, 'value', "number",
+                     type(value).__name__)] + self.range_errors
+        if self.range_errors:
+            return self.range_errors
+
+        errors = []
+        if self.minimum is not None and value < self.minimum:
+            errors.append((self.name, "minimum", self.minimum, value))
+        if self.maximum is not None and value > self.maximum:
+            errors.append((self.name, "maximum", self.maximum, value))
+        return errors
+
+
+class ArgsValidator(object):
+    """Validates the resolved arguments of the spec commands. """
+
+    def __init__(self, spec_helper):
+        """Compiles the validation rules of all the spec options.
+
+        :param spec_helper: the SpecDictHelper object
+        """
+        self.rules = {}
+        # the rules of the options which silence other options
+        self.silencers = {}
+        for parser in spec_helper.iterate_parsers():
+            options = spec_helper.get_parser_option_specs(parser['name'])
+            options_names = set(option['name'] for option in options)
+            rules = []
+            silencers = []
+            for option in options:
+                rule = OptionRule(option, options_names)
+                if not rule.is_empty:
+                    rules.append(rule)
+                if option.get('silent'):
+                    silencers.append((rule, option['silent']))
+            self.rules[parser['name']] = rules
+            self.silencers[parser['name']] = silencers
+
+    def get_silent_args(self, args):
+        """Gets the options silenced by the options set in the arguments.
+
+        :param args: dict of the commands arguments
+        :return: set of the silenced options names
+        """
+        silent_args = set()
+        for command_name, command_args in args.items():
+            for rule, silent in self.silencers.get(command_name, ()):
+                if rule.is_set(command_args):
+                    silent_args.update(silent)
+        return silent_args
+
+    def get_errors(self, args):
+        """Validates the arguments.
+
+        :param args: dict of the commands arguments
+        :return: list of the validation exceptions, one for every kind of
+            the violations (required, length, choices, min/max)
+        """
+        silent_args = self.get_silent_args(args)
+        missing_args = {}
+        invalid_length = []
+        invalid_choices = []
+        invalid_range = []
+
+        for command_name, command_args in args.items():
+            for rule in self.rules.get(command_name, ()):
+                if (rule.required or rule.required_when is not None) and \
+                        rule.is_missing(command_args, silent_args):
+                    missing_args.setdefault(command_name, []).append(
+                        rule.name)
+                if rule.name not in command_args:
+                    continue
+
+                value = command_args[rule.name]
+                if rule.has_length and len(value) > int(rule.length):
+                    invalid_length.append((rule.name, value, rule.length))
+                if rule.has_choices and rule.is_invalid_choice(value):
+                    invalid_choices.append((rule.name, value, rule.choices))
+                if rule.has_range:
+                    invalid_range.extend(rule.get_range_errors(value))
+
+        errors = []
+        if missing_args:
+            errors.append(
+                exceptions.IRRequiredArgsMissingException(missing_args))
+        if invalid_length:
+            errors.append(
+                exceptions.IRInvalidLengthException(invalid_length))
+        if invalid_choices:
+            errors.append(
+                exceptions.IRInvalidChoiceException(invalid_choices))
+        if invalid_range:
+            errors.append(
+                exceptions.IRInvalidMinMaxRangeException(invalid_range))
+        return errors
+
+    def validate(self, args):
+        """Validates the arguments and reports all the violations.
+
+        :param args: dict of the commands arguments
+        :raise IRException: the exception of the violations when they are of
+            a single kind, IRArgsValidationException otherwise
+        """
+        errors = self.get_errors(args)
+        if len(errors) == 1:
+            raise errors[0]
+        if errors:
+            raise exceptions.IRArgsValidationException(errors)
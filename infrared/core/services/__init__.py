@@ -4,10 +4,12 @@ Stores and resolves all the dependencies for the services.
 """
 import os
 import sys
+import time
 
 from infrared.core.services import ansible_config
 from infrared.core.services import execution_logger
 from infrared.core.services import plugins
+from infrared.core.services import spec_cache
 from infrared.core.services import workspaces
 from infrared.core.utils import logger
 
@@ -20,6 +22,7 @@ class ServiceName(object):
     PLUGINS_MANAGER = "plugins_manager"
     ANSIBLE_CONFIG_MANAGER = "ansible_config_manager"
     EXECUTION_LOGGER_MANAGER = "execution_logger_manager"
+    SPEC_CACHE_MANAGER = "spec_cache_manager"
 
 
 class CoreSettings(object):
@@ -28,7 +31,8 @@ class CoreSettings(object):
     def __init__(self, workspaces_base_folder=None,
                  plugins_conf_file=None,
                  install_plugin_at_start=True,
-                 plugins_base_folder=None):
+                 plugins_base_folder=None,
+                 spec_cache_folder=None):
         """Constructor.
 
         :param workspaces_base_folder: folder where the
@@ -38,6 +42,8 @@ class CoreSettings(object):
         :param install_plugin_at_start: specifies whether all the plugins
                should be installed on ir start. Skip installation may be
                required for unit tests, for example.
+        :param spec_cache_folder: folder where the parsed plugin specs
+               will be cached
         """
 
         self.infrared_home = os.path.abspath(os.environ.get(
@@ -52,12 +58,20 @@ class CoreSettings(object):
         self.install_plugin_at_start = install_plugin_at_start
         self.plugins_base_folder = plugins_base_folder or os.path.join(
             self.infrared_home, 'plugins')
+        self.spec_cache_folder = spec_cache_folder or os.path.join(
+            self.infrared_home, '.spec_cache')
 
 
 class CoreServices(object):
-    """Holds and configures all the required for core services. """
+    """Holds and configures all the required for core services.
+
+    The services are created on the first access only, so every command
+    pays just for the services it actually uses. Each service is created by
+    its own ``_create_<service name>`` factory.
+    """
 
     _SERVICES = {}
+    _SETTINGS = None
 
     @classmethod
     def setup(cls, core_settings=None):
@@ -70,44 +84,57 @@ class CoreServices(object):
 
         if core_settings is None:
             core_settings = CoreSettings()
+        cls._SETTINGS = core_settings
 
-        # create workspace manager
-        if ServiceName.WORKSPACE_MANAGER not in cls._SERVICES:
-            cls.register_service(ServiceName.WORKSPACE_MANAGER,
-                                 workspaces.WorkspaceManager(
-                                     core_settings.workspaces_base_folder))
-
-        # create plugins manager
-        if ServiceName.PLUGINS_MANAGER not in cls._SERVICES:
-            # A temporary WH to skip all plugins installation on first InfraRed
-            # command if the command is 'infrared plugin add'.
-            # Should be removed together with auto plugins installation
-            # mechanism.
-            skip_plugins_install = {'plugin', 'add'}.issubset(sys.argv)
-            cls.register_service(
-                ServiceName.PLUGINS_MANAGER, plugins.InfraredPluginManager(
-                    plugins_conf=core_settings.plugins_conf_file,
-                    install_plugins=(core_settings.install_plugin_at_start and
-                                     not skip_plugins_install),
-                    plugins_dir=core_settings.plugins_base_folder))
-
-        # create ansible config manager
-        if ServiceName.ANSIBLE_CONFIG_MANAGER not in cls._SERVICES:
-            cls.register_service(ServiceName.ANSIBLE_CONFIG_MANAGER,
-                                 ansible_config.AnsibleConfigManager(
-                                     core_settings.infrared_home))
-
-        # create execution logger manager
-        if ServiceName.EXECUTION_LOGGER_MANAGER not in cls._SERVICES:
-            # get ansible manager
-            ansible_manager = CoreServices.ansible_config_manager()
-            # build log file path
-            log_file = \
-                os.path.join(core_settings.infrared_home, 'ir-commands.log')
-            cls.register_service(ServiceName.EXECUTION_LOGGER_MANAGER,
-                                 execution_logger.ExecutionLoggerManager(
-                                     ansible_manager.ansible_config_path,
-                                     log_file=log_file))
+    @classmethod
+    def _create_workspace_manager(cls, core_settings):
+        return workspaces.WorkspaceManager(
+            core_settings.workspaces_base_folder)
+
+    @classmethod
+    def _create_spec_cache_manager(cls, core_settings):
+        return spec_cache.SpecCacheManager(core_settings.spec_cache_folder)
+
+    @classmethod
+    def _create_plugins_manager(cls, core_settings):
+        # A temporary WH to skip all plugins installation on first InfraRed
+        # command if the command is 'infrared plugin add'.
+        # Should be removed together with auto plugins installation
+        # mechanism.
+        skip_plugins_install = {'plugin', 'add'}.issubset(sys.argv)
+        return plugins.InfraredPluginManager(
+            plugins_conf=core_settings.plugins_conf_file,
+            install_plugins=(core_settings.install_plugin_at_start and
+                             not skip_plugins_install),
+            plugins_dir=core_settings.plugins_base_folder,
+            spec_cache=cls.spec_cache_manager())
+
+    @classmethod
+    def _create_ansible_config_manager(cls, core_settings):
+        return ansible_config.AnsibleConfigManager(
+            core_settings.infrared_home)
+
+    @classmethod
+    def _create_execution_logger_manager(cls, core_settings):
+        # build log file path
+        log_file = \
+            os.path.join(core_settings.infrared_home, 'ir-commands.log')
+        return execution_logger.ExecutionLoggerManager(
+            ansible_config.AnsibleConfigManager.get_ansible_conf_path(
+                core_settings.infrared_home),
+            log_file=log_file)
+
+    @classmethod
+    def reset(cls, *service_names):
+        """Drops the created services.
+
+        The dropped services are created again on the next access.
+
+        :param service_names: the names of services to drop. All the
+            services are dropped if no names are given.
+        """
+        for service_name in service_names or list(cls._SERVICES):
+            cls._SERVICES.pop(service_name, None)
 
     @classmethod
     def register_service(cls, service_name, service):
@@ -117,7 +144,13 @@ class CoreServices(object):
     @classmethod
     def _get_service(cls, name):
         if name not in cls._SERVICES:
-            cls.setup()
+            if cls._SETTINGS is None:
+                cls.setup()
+            factory = getattr(cls, '_create_' + name)
+            start_time = time.time()
+            cls.register_service(name, factory(cls._SETTINGS))
+            LOG.debug("Service '{}' created in {:.3f}s".format(
+                name, time.time() - start_time))
         return cls._SERVICES[name]
 
     @classmethod
@@ -139,3 +172,8 @@ class CoreServices(object):
     def execution_logger_manager(cls):
         """Gets the execution logger manager. """
         return cls._get_service(ServiceName.EXECUTION_LOGGER_MANAGER)
+
+    @classmethod
+    def spec_cache_manager(cls):
+        """Gets the plugins spec cache manager. """
+        return cls._get_service(ServiceName.SPEC_CACHE_MANAGER)
@@ -1,5 +1,8 @@
 from collections import OrderedDict
+import contextlib
+import multiprocessing
 import os
+import re
 from six.moves import configparser
 
 from infrared.core.utils import logger
@@ -7,24 +10,88 @@ from infrared.core.utils.validators import AnsibleConfigValidator
 
 LOG = logger.LOG
 
+# the auto-tuned forks are kept within these bounds
+AUTOTUNE_MIN_FORKS = 5
+AUTOTUNE_MAX_FORKS = 500
+# the forks mostly wait for the ssh I/O, so several forks share a CPU
+AUTOTUNE_FORKS_PER_CPU = 8
+# controller memory (MB) taken by a fork
+AUTOTUNE_FORK_MEMORY = 100
+# part of the controller memory the forks may take
+AUTOTUNE_MEMORY_SHARE = 0.5
+# seconds to keep the idle ssh connection for each batch of the hosts
+AUTOTUNE_PERSIST_PER_BATCH = 60
+AUTOTUNE_MAX_PERSIST = 1800
+# the connections through a bastion are costly to open, keep them longer
+AUTOTUNE_BASTION_PERSIST = 600
+# inventories with more hosts don't display the skipped hosts
+AUTOTUNE_LARGE_INVENTORY = 50
+
+BASTION_ARGS = re.compile(r'ProxyCommand|ProxyJump|(^|\s)-J\s')
+
+
+def get_controller_resources():
+    """Gets the number of the CPUs and the memory of the controller.
+
+    :return: tuple of the CPUs and the memory in MB (None if unknown)
+    """
+    try:
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf(
+            'SC_PHYS_PAGES') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        memory = None
+    return multiprocessing.cpu_count(), memory
+
+
+def is_behind_bastion(hosts):
+    """Checks whether any host is connected through a jump host.
+
+    :param hosts: list of the Ansible Host objects
+    """
+    from ansible.inventory.helpers import get_group_vars
+    from ansible.utils.vars import combine_vars
+
+    for host in hosts:
+        host_vars = combine_vars(get_group_vars(host.get_groups()),
+                                 host.get_vars())
+        for name in ('ansible_ssh_common_args', 'ansible_ssh_extra_args'):
+            if BASTION_ARGS.search(str(host_vars.get(name) or '')):
+                return True
+    return False
+
+
+@contextlib.contextmanager
+def _environment(env):
+    """Sets the environment variables for the code run inside. """
+    saved_env = dict((name, os.environ.get(name)) for name in env)
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
 
 class AnsibleConfigManager(object):
 
     def __init__(self, infrared_home):
         """Constructor.
 
-        :param ansible_config: A path to the ansible config
+        Creates the ansible config with the default data if it doesn't exist.
+        The existing config isn't validated until ``validate`` is called.
+
+        :param infrared_home: infrared's home directory
         """
-        self.ansible_config_path = self._get_ansible_conf_path(infrared_home)
-        config_validator = AnsibleConfigValidator()
+        self.ansible_config_path = self.get_ansible_conf_path(infrared_home)
 
         if not os.path.isfile(self.ansible_config_path):
             self._create_ansible_config(infrared_home)
-        else:
-            config_validator.validate_from_file(self.ansible_config_path)
 
     @staticmethod
-    def _get_ansible_conf_path(infrared_home):
+    def get_ansible_conf_path(infrared_home):
         """Get path to Ansible config.
 
         Check for Ansible config in specific locations and return the first
@@ -91,7 +158,171 @@ class AnsibleConfigManager(object):
 
             config.write(fp)
 
+    def validate(self):
+        """Validates the ansible config options required by infrared. """
+        AnsibleConfigValidator.validate_from_file(self.ansible_config_path)
+
     def inject_config(self):
         """Set the environment variable for config path, if it is undefined."""
         if os.environ.get('ANSIBLE_CONFIG', '') == '':
             os.environ['ANSIBLE_CONFIG'] = self.ansible_config_path
+
+    def _is_configured(self, option, env_name):
+        """Checks whether the ansible option is set by the user.
+
+        :param option: the option name in the ansible config 'defaults'
+        :param env_name: the environment variable of the option
+        """
+        if os.environ.get(env_name):
+            return True
+        config = configparser.ConfigParser()
+        config.read(self.ansible_config_path)
+        return config.has_option('defaults', option)
+
+    def get_fact_cache_env(self, workspace):
+        """Gets the environment which enables the workspace facts cache.
+
+        The facts cache isn't used when it's disabled with the
+        ``IR_FACT_CACHE`` environment variable or when the user has
+        configured the ansible facts caching.
+
+        :param workspace: the Workspace object
+        :return: dict of the environment variables, empty if the cache
+            should not be used
+        """
+        from distutils.util import strtobool
+        from infrared.core import fact_cache
+
+        if not strtobool(os.environ.get('IR_FACT_CACHE', 'yes')) or \
+                self._is_configured('fact_caching', 'ANSIBLE_CACHE_PLUGIN'):
+            return {}
+
+        cache = fact_cache.FactCache(workspace, fact_cache.get_timeout())
+        env = dict(ANSIBLE_CACHE_PLUGIN='jsonfile',
+                   ANSIBLE_CACHE_PLUGIN_CONNECTION=cache.path,
+                   ANSIBLE_CACHE_PLUGIN_PREFIX='',
+                   ANSIBLE_CACHE_PLUGIN_TIMEOUT=str(cache.timeout))
+        # gather the facts only for the hosts which are not cached
+        if not self._is_configured('gathering', 'ANSIBLE_GATHERING'):
+            env['ANSIBLE_GATHERING'] = 'smart'
+        return env
+
+    @contextlib.contextmanager
+    def fact_cache(self, workspace):
+        """Enables the workspace facts cache for the playbooks run inside.
+
+        :param workspace: the Workspace object
+        """
+        from infrared.core import fact_cache
+
+        env = self.get_fact_cache_env(workspace)
+        if not env:
+            yield
+            return
+
+        cache = fact_cache.FactCache(workspace)
+        cache.prepare()
+        try:
+            with _environment(env):
+                yield
+        finally:
+            # the facts are valid for the inventory the playbook has ended
+            # with (the provisioning playbooks switch the inventory)
+            cache.stamp()
+
+    @staticmethod
+    def get_tuned_env(hosts_count, behind_bastion=False, cpus=None,
+                      memory=None, ssh_args=None):
+        """Gets the ansible settings tuned for the inventory & controller.
+
+        The settings set by the user with the environment variables are not
+        tuned.
+
+        :param hosts_count: number of the inventory hosts
+        :param behind_bastion: whether the hosts are connected through a jump
+            host
+        :param cpus: number of the controller CPUs
+        :param memory: the controller memory in MB, None if unknown
+        :param ssh_args: the configured ssh args to set the ControlPersist in
+        :return: OrderedDict of the environment variables
+        """
+        hosts_count = max(hosts_count, 1)
+        cpus = cpus or 1
+        forks_per_cpu = AUTOTUNE_FORKS_PER_CPU
+        if behind_bastion:
+            # every connection runs the ProxyCommand ssh on the controller
+            forks_per_cpu //= 2
+        forks = min(hosts_count, cpus * forks_per_cpu, AUTOTUNE_MAX_FORKS)
+        if memory:
+            forks = min(forks, int(memory * AUTOTUNE_MEMORY_SHARE //
+                                   AUTOTUNE_FORK_MEMORY))
+        forks = max(forks, min(hosts_count, AUTOTUNE_MIN_FORKS))
+
+        # the connections of a batch wait until the other batches are done
+        batches = -(-hosts_count // forks)
+        persist = min(AUTOTUNE_PERSIST_PER_BATCH * batches,
+                      AUTOTUNE_MAX_PERSIST)
+        if behind_bastion:
+            persist = max(persist, AUTOTUNE_BASTION_PERSIST)
+
+        # the main process polls the results less often when there are many
+        # forks per CPU, leaving the CPU time to the forks
+        forks_ratio = float(forks) / cpus
+        if forks_ratio <= 4:
+            poll_interval = 0.001
+        elif forks_ratio <= 16:
+            poll_interval = 0.005
+        else:
+            poll_interval = 0.01
+
+        ssh_args = ssh_args or '-C -o ControlMaster=auto -o ControlPersist=60s'
+        if 'ControlPersist' in ssh_args:
+            ssh_args = re.sub(r'ControlPersist=\S+',
+                              'ControlPersist={}s'.format(persist), ssh_args)
+        elif not re.search(r'ControlMaster=no\b', ssh_args):
+            if 'ControlMaster' not in ssh_args:
+                ssh_args += ' -o ControlMaster=auto'
+            ssh_args += ' -o ControlPersist={}s'.format(persist)
+        env = OrderedDict([
+            ('ANSIBLE_FORKS', str(forks)),
+            ('ANSIBLE_SSH_ARGS', ssh_args),
+            ('ANSIBLE_INTERNAL_POLL_INTERVAL', str(poll_interval)),
+        ])
+        # the only callback setting tuned, the stdout and the whitelisted
+        # callbacks are left as configured
+        if hosts_count > AUTOTUNE_LARGE_INVENTORY:
+            env['ANSIBLE_DISPLAY_SKIPPED_HOSTS'] = 'False'
+        return OrderedDict((name, value) for name, value in env.items()
+                           if not os.environ.get(name))
+
+    @contextlib.contextmanager
+    def autotune(self, inventory):
+        """Tunes the ansible settings for the playbooks run inside.
+
+        The settings are tuned only when the ``IR_ANSIBLE_AUTOTUNE``
+        environment variable is set.
+
+        :param inventory: the Ansible InventoryManager object
+        """
+        from distutils.util import strtobool
+
+        if not strtobool(os.environ.get('IR_ANSIBLE_AUTOTUNE', 'no')):
+            yield
+            return
+
+        from ansible import constants as C
+
+        hosts = inventory.get_hosts()
+        behind_bastion = is_behind_bastion(hosts)
+        cpus, memory = get_controller_resources()
+        env = self.get_tuned_env(
+            len(hosts), behind_bastion, cpus, memory,
+            ssh_args=C.config.get_config_value('ANSIBLE_SSH_ARGS'))
+        LOG.info("Ansible settings tuned for {} hosts{} on {} CPUs and {} "
+                 "memory: {}".format(
+                     len(hosts), ' behind a bastion' if behind_bastion else '',
+                     cpus, '{}MB'.format(memory) if memory else 'unknown',
+                     ', '.join('{}={}'.format(name, value)
+                               for name, value in env.items())))
+        with _environment(env):
+            yield
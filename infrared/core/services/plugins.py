@@ -1,22 +1,14 @@
 import datetime
-import git
-import github
+import functools
 import os
 import shutil
 import sys
 import tempfile
-import tenacity
 import time
 
 from collections import OrderedDict
-from distutils.util import strtobool
 from six.moves import configparser
 
-
-from pip._internal.main import main as pip_main
-import urllib3
-import yaml
-
 from infrared.core.utils.exceptions import IRException
 from infrared.core.utils.exceptions import IRFailedToAddPlugin
 from infrared.core.utils.exceptions import IRFailedToImportPlugins
@@ -28,6 +20,7 @@ from infrared.core.utils.exceptions import IRUnsupportedPluginType
 from infrared.core.utils import logger
 from infrared.core.utils.validators import RegistryValidator
 from infrared.core.utils.validators import SpecValidator
+from infrared.core.utils import yaml_io
 from infrared import PLUGINS_REGISTRY
 
 DEFAULT_PLUGIN_INI = dict(
@@ -46,21 +39,45 @@ DEFAULT_PLUGIN_INI = dict(
 LOG = logger.LOG
 
 
+def retry(attempts):
+    """Retries the decorated function with an exponential wait.
+
+    tenacity is imported only once the decorated function is called, so it
+    is not loaded by the infrared commands which don't need it.
+
+    :param attempts: the maximum number of attempts
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            import tenacity
+            retrying = tenacity.retry(
+                reraise=True, wait=tenacity.wait_exponential(),
+                stop=tenacity.stop_after_attempt(attempts))
+            return retrying(func)(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 class InfraredPluginManager(object):
     PLUGINS_DICT = OrderedDict()
     SUPPORTED_TYPES_SECTION = 'supported_types'
     GIT_PLUGINS_ORGS_SECTION = "git_orgs"
 
-    def __init__(self, plugins_conf, plugins_dir, install_plugins=True):
+    def __init__(self, plugins_conf, plugins_dir, install_plugins=True,
+                 spec_cache=None):
         """Constructor.
 
         :param plugins_conf: A path to the main plugins configuration file
         :param plugins_dir: the plugins directory location
         :param install_plugins: Specifies if core plugins should be installed
         at start.
+        :param spec_cache: SpecCacheManager object to cache the plugins
+        specs with. Specs are parsed on every load if not given.
         """
         # create plugins directory
         self.plugins_dir = plugins_dir
+        self.spec_cache = spec_cache
         if not os.path.exists(self.plugins_dir):
             os.makedirs(self.plugins_dir)
 
@@ -76,7 +93,8 @@ class InfraredPluginManager(object):
             if self.config.has_section(plugin_type_section):
                 for plugin_name, plugin_path in self.config.items(
                         plugin_type_section):
-                    plugin = InfraredPlugin(plugin_path)
+                    plugin = InfraredPlugin(plugin_path,
+                                            spec_cache=self.spec_cache)
                     self.__class__.PLUGINS_DICT[plugin_name] = plugin
 
     def get_installed_plugins(self, plugins_type=None):
@@ -168,6 +186,8 @@ class InfraredPluginManager(object):
         :param organization: GitHub organization name
         :param no_forks: include / not include forks
         """
+        import github
+
         plugins_dict = OrderedDict()
 
         try:
@@ -258,6 +278,8 @@ class InfraredPluginManager(object):
         return cls.PLUGINS_DICT[plugin_name]
 
     def get_plugin_version(self, plugin_name):
+        import git
+
         try:
             repo = git.Repo(os.path.join(self.plugins_dir, plugin_name))
             return str(repo.active_branch) + " / " + str(
@@ -272,8 +294,7 @@ class InfraredPluginManager(object):
             raise StopIteration
 
     @staticmethod
-    @tenacity.retry(reraise=True, wait=tenacity.wait_exponential(),
-                    stop=tenacity.stop_after_attempt(3))
+    @retry(3)
     def _clone_git_plugin(git_url, rev=None):
         """Clone a plugin into a given destination directory
 
@@ -281,6 +302,8 @@ class InfraredPluginManager(object):
         :param rev: git branch/tag/revision
         :return: Path to plugin cloned directory (str)
         """
+        import git
+
         plugin_git_name = os.path.split(git_url)[-1].split('.')[0]
 
         tmpdir = tempfile.mkdtemp(prefix="ir-")
@@ -310,6 +333,8 @@ class InfraredPluginManager(object):
         :param update_string: name of the backup branch
         :return:
         """
+        import git
+
         LOG.warning("Create a branch '{}' that will point "
                     "to the current HEAD".format(update_string))
         repo.git.branch(update_string)
@@ -334,6 +359,8 @@ class InfraredPluginManager(object):
         :param repo: Repo object that points to plugin local repo
         :return:
         """
+        import git
+
         try:
             # only pull if not detached
             if not repo.head.is_detached:
@@ -366,6 +393,8 @@ class InfraredPluginManager(object):
             raise IRFailedToUpdatePlugin(
                 "Plugin '{}' isn't installed".format(plugin_name))
 
+        import git
+
         plugin = self.get_plugin(plugin_name)
 
         try:
@@ -415,6 +444,7 @@ class InfraredPluginManager(object):
         if not skip_reqs:
             reqs_file = os.path.join(plugin.path, 'requirements.txt')
             if os.path.isfile(reqs_file):
+                from pip._internal.main import main as pip_main
                 pip_main(['install', '-r', reqs_file])
 
     def add_plugin(self, plugin_source, rev=None, plugins_registry=None,
@@ -445,6 +475,7 @@ class InfraredPluginManager(object):
         if plugin_src_path is None:
             plugin_src_path = plugin_data.get('src_path', '')
 
+        from distutils.util import strtobool
         _link_roles = link_roles or bool(strtobool(
             plugin_data.get('link_roles', 'false')))
 
@@ -568,6 +599,13 @@ class InfraredPluginManager(object):
             LOG.warning(
                 "Plugin '{}' has been successfully removed".format(plugin))
 
+    def rebuild_spec_cache(self):
+        """Drops the cached specs and caches the installed plugins again. """
+        if self.spec_cache is None:
+            raise IRException("Plugins spec cache is not configured")
+        self.spec_cache.clear()
+        self._load_plugins()
+
     @property
     def supported_plugin_types(self):
         return self.config.options(self.SUPPORTED_TYPES_SECTION)
@@ -578,12 +616,12 @@ class InfraredPluginManager(object):
         if os.path.isfile(requirement_file):
             LOG.info(
                 "Installing requirements from: {}".format(requirement_file))
+            from pip._internal.main import main as pip_main
             pip_args = ['install', '-r', requirement_file]
             pip_main(args=pip_args)
 
     @staticmethod
-    @tenacity.retry(reraise=True, wait=tenacity.wait_exponential(),
-                    stop=tenacity.stop_after_attempt(5))
+    @retry(5)
     def _install_roles_from_file(plugin_path):
         # Ansible Galaxy - install roles from file
         for req_file in ['requirements.yml', 'requirements.yaml']:
@@ -618,20 +656,20 @@ class InfraredPluginManager(object):
 
     @staticmethod
     def _is_collection_requirements(requirements_path):
-        reqs_yaml = {}
-        with open(requirements_path) as content:
-            reqs_yaml = yaml.load(content, Loader=yaml.FullLoader)
+        reqs_yaml = yaml_io.load_file(requirements_path) or {}
         return ('collections' in reqs_yaml)
 
     def freeze(self):
+        import git
+
         registry = {}
         for section in self.config.sections():
             if section in ["supported_types", "git_orgs"]:
                 continue
             for name, path in self.config.items(section):
                 if name not in registry:
-                    with open(os.path.join(path, "plugin.spec"), "r") as pls:
-                        plugin_spec = yaml.safe_load(pls)
+                    plugin_spec = yaml_io.load_file(
+                        os.path.join(path, "plugin.spec"))
                     # support two types of possible plugin spec files
                     plugin_type = plugin_spec["config"]["plugin_type"] \
                         if "config" in plugin_spec \
@@ -650,15 +688,17 @@ class InfraredPluginManager(object):
                     registry[name]["src"] = path
 
         for plugin_name, plugin_dict in registry.items():
-            print(yaml.dump({plugin_name: plugin_dict},
-                            default_flow_style=False,
-                            explicit_start=False, allow_unicode=True))
+            print(yaml_io.dump({plugin_name: plugin_dict},
+                               default_flow_style=False,
+                               explicit_start=False, allow_unicode=True))
 
     def import_plugins(self, plugins_registry):
         """Import and install plugins from registry yml file.
 
         :param plugins_registry: Path/URL to plugin registry yml file
         """
+        import urllib3
+
         try:
             if not os.path.exists(plugins_registry):
                 # if path was not found locally attempt to download it
@@ -704,11 +744,14 @@ class InfraredPlugin(object):
     #     playbooks='playbooks'
     # )
 
-    def __init__(self, plugin_dir):
+    def __init__(self, plugin_dir, spec_cache=None):
         """InfraredPlugin initializer
 
         :param plugin_dir: A path to the plugin's root dir
+        :param spec_cache: SpecCacheManager object to load the validated
+        plugin spec from
         """
+        self.spec_cache = spec_cache
         self.path = plugin_dir
         self.config = os.path.join(self.path, self.PLUGIN_SPEC_FILE)
 
@@ -749,7 +792,14 @@ class InfraredPlugin(object):
 
     @config.setter
     def config(self, plugin_spec):
-        self._config = SpecValidator.validate_from_file(plugin_spec)
+        config = None
+        if self.spec_cache is not None:
+            config = self.spec_cache.get(plugin_spec, 'config')
+        if config is None:
+            config = SpecValidator.validate_from_file(plugin_spec)
+            if self.spec_cache is not None:
+                self.spec_cache.put(plugin_spec, 'config', config)
+        self._config = config
 
     @property
     def name(self):
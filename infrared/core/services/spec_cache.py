@@ -0,0 +1,170 @@
+import errno
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+from infrared import __version__
+from infrared import SHARED_GROUPS
+from infrared.core.utils import logger
+
+LOG = logger.LOG
+
+# the shared groups are merged into the cached spec dicts, so the cache is
+# invalidated when they are changed (even without the infrared version bump)
+SHARED_GROUPS_HASH = hashlib.sha1(json.dumps(
+    SHARED_GROUPS, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class SpecCacheManager(object):
+    """Stores the parsed plugin specs on disk.
+
+    Every plugin spec has a single cache file which holds several sections
+    (e.g. validated plugin config, flattened spec dict). The cache file is
+    keyed by the spec path, its modification time & size, by the
+    infrared version and the shared groups, so any change to one of them
+    invalidates all the cached sections of that spec.
+    """
+
+    CACHE_FILE_EXT = '.pickle'
+
+    def __init__(self, cache_dir):
+        """Constructor.
+
+        :param cache_dir: the directory to store the cached specs in
+        """
+        self.cache_dir = cache_dir
+        # the loaded entries kept in memory:
+        # spec path -> (stamp, pickled sections)
+        self._resident = None
+
+    def keep_resident(self):
+        """Keeps the loaded specs in memory.
+
+        The resident specs are checked against the spec files stamps only,
+        so they are not read from disk again. They are kept pickled, so
+        every caller gets its own copy and the changes to it don't leak into
+        the cache. It's used by the long-lived daemon, whose forked workers
+        inherit the loaded specs.
+        """
+        if self._resident is None:
+            self._resident = {}
+
+    def _keep_resident(self, stamp, sections):
+        """Stores the pickled sections of the spec file in memory. """
+        resident = self._resident.get(stamp[0])
+        if resident is None or resident[0] != stamp:
+            resident = self._resident[stamp[0]] = (stamp, {})
+        for section, data in sections.items():
+            resident[1][section] = pickle.dumps(
+                data, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _get_cache_file(self, spec_file):
+        """Gets the path of the cache file for the given spec file. """
+        spec_hash = hashlib.sha1(
+            os.path.abspath(spec_file).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, spec_hash + self.CACHE_FILE_EXT)
+
+    @staticmethod
+    def _get_spec_stamp(spec_file):
+        """Gets the stamp which identifies the current state of spec file.
+
+        :raise OSError: when spec file doesn't exist
+        """
+        spec_stat = os.stat(spec_file)
+        return (os.path.abspath(spec_file), spec_stat.st_mtime,
+                spec_stat.st_size, __version__, SHARED_GROUPS_HASH)
+
+    def _load_entry(self, spec_file):
+        """Loads cache entry of the spec file.
+
+        :return: the cached sections dict, None if entry is missing or stale
+        """
+        try:
+            stamp = self._get_spec_stamp(spec_file)
+            with open(self._get_cache_file(spec_file), 'rb') as stream:
+                entry = pickle.load(stream)
+        except (IOError, OSError):
+            return None
+        except Exception as ex:
+            LOG.debug("Ignoring corrupted spec cache of '{}': {}".format(
+                spec_file, ex))
+            return None
+
+        if not isinstance(entry, dict) or entry.get('stamp') != stamp:
+            return None
+        return entry.get('sections')
+
+    def get(self, spec_file, section):
+        """Gets the cached data of the spec file.
+
+        :param spec_file: path to the plugin spec file
+        :param section: the name of the cached data
+        :return: the cached data or None if it is missing or stale
+        """
+        if self._resident is not None:
+            try:
+                stamp = self._get_spec_stamp(spec_file)
+            except (IOError, OSError):
+                return None
+            resident = self._resident.get(stamp[0])
+            if resident is not None and resident[0] == stamp and \
+                    section in resident[1]:
+                return pickle.loads(resident[1][section])
+
+        sections = self._load_entry(spec_file)
+        if sections is None:
+            return None
+        if self._resident is not None:
+            self._keep_resident(stamp, sections)
+        return sections.get(section)
+
+    def put(self, spec_file, section, data):
+        """Stores data of the spec file in the cache.
+
+        The data is serialized immediately, so the later changes to it are
+        not reflected in the cache.
+
+        :param spec_file: path to the plugin spec file
+        :param section: the name of the cached data
+        :param data: the data to store, should be picklable
+        """
+        try:
+            stamp = self._get_spec_stamp(spec_file)
+        except (IOError, OSError):
+            return
+
+        sections = self._load_entry(spec_file) or {}
+        sections[section] = data
+
+        try:
+            os.makedirs(self.cache_dir)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        # write to temporary file & rename it to avoid partially written
+        # cache files when several infrared processes run at the same time
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir,
+                                        suffix=self.CACHE_FILE_EXT + '.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                pickle.dump(dict(stamp=stamp, sections=sections), stream,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, self._get_cache_file(spec_file))
+            if self._resident is not None:
+                self._keep_resident(stamp, {section: data})
+        except (IOError, OSError, pickle.PicklingError) as ex:
+            LOG.debug("Unable to cache spec '{}': {}".format(spec_file, ex))
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def clear(self):
+        """Removes all the cached specs. """
+        if self._resident is not None:
+            self._resident.clear()
+        if os.path.isdir(self.cache_dir):
+            LOG.debug("Removing spec cache dir: {}".format(self.cache_dir))
+            shutil.rmtree(self.cache_dir)
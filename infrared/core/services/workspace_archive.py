@@ -0,0 +1,687 @@
+"""The workspaces archives.
+
+The workspace is exported by streaming its files straight into the
+compressed tar archive, nothing is copied aside. The inventory files are
+added with the workspace path replaced by the path placeholder (and with
+the SSH keys paths replaced when the keys are copied), the rest of the files
+are added as they are.
+
+The archive is compressed with gzip by default, the gzip archive is made of
+the gzip members of the blocks compressed in parallel by several threads
+(the same as ``pigz`` does), so it is read by any gzip decompressor and by
+``tarfile``. The zstd compression needs the ``zstd`` command.
+
+The workspace is imported by extracting the archive while it is read, the
+remote archive is downloaded in chunks (the broken download is resumed) and
+the inventory files are extracted with the path placeholder replaced.
+"""
+import fnmatch
+import os
+import re
+import tarfile
+import tempfile
+import time
+import zlib
+
+from infrared.core.utils import exceptions
+from infrared.core.utils import logger
+
+LOG = logger.LOG
+
+COMPRESSIONS = ('gz', 'zst', 'none')
+ARCHIVE_EXTENSIONS = {'gz': '.tgz', 'zst': '.tar.zst', 'none': '.tar'}
+DEFAULT_LEVELS = {'gz': 6, 'zst': 3}
+# the size of the blocks compressed by the gzip threads
+GZIP_BLOCK_SIZE = 1024 * 1024
+# the size of the chunks read from the workspace files
+READ_CHUNK_SIZE = 1024 * 1024
+# seconds between the progress reports
+PROGRESS_INTERVAL = 1.0
+
+
+def _gzip_member(data, level):
+    """Compresses the block as a standalone gzip member. """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ParallelGzipWriter(object):
+    """The file object writing the data compressed by several threads.
+
+    The data is split into blocks and every block is written as a gzip
+    member, the concatenated members are a valid gzip stream. The zlib
+    compression releases the GIL, so the blocks are compressed in parallel.
+    """
+
+    def __init__(self, fileobj, level=None, threads=None, block_size=None):
+        """Initializes the writer.
+
+        :param fileobj: the file object to write the compressed data into
+        :param level: the compression level (1-9)
+        :param threads: number of the compressing threads, the number of the
+            CPUs by default
+        :param block_size: size of the compressed blocks, GZIP_BLOCK_SIZE by
+            default
+        """
+        import multiprocessing
+        from multiprocessing.pool import ThreadPool
+
+        self.fileobj = fileobj
+        self.level = DEFAULT_LEVELS['gz'] if level is None else level
+        self.threads = threads or multiprocessing.cpu_count()
+        self.block_size = block_size or GZIP_BLOCK_SIZE
+        self.pool = ThreadPool(self.threads) if self.threads > 1 else None
+        self._buffer = []
+        self._buffered = 0
+        # the compressed blocks in the order of writing
+        self._pending = []
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.block_size:
+            self._submit()
+
+    def _submit(self):
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if self.pool is None:
+            self.fileobj.write(_gzip_member(data, self.level))
+            return
+
+        self._pending.append(
+            self.pool.apply_async(_gzip_member, (data, self.level)))
+        # the memory is bound by the number of the blocks in the flight
+        while len(self._pending) > self.threads * 2:
+            self.fileobj.write(self._pending.pop(0).get())
+
+    def close(self):
+        try:
+            if self._buffered:
+                self._submit()
+            while self._pending:
+                self.fileobj.write(self._pending.pop(0).get())
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+
+
+class ZstdWriter(object):
+    """The file object writing the data compressed by the zstd command. """
+
+    def __init__(self, fileobj, level=None, threads=None):
+        """Starts the zstd command.
+
+        :param fileobj: the file object to write the compressed data into
+        :param level: the compression level (1-19)
+        :param threads: number of the compressing threads, the number of the
+            CPUs by default
+        """
+        import subprocess
+
+        level = DEFAULT_LEVELS['zst'] if level is None else level
+        try:
+            self.process = subprocess.Popen(
+                ['zstd', '-q', '-c', '-{}'.format(level),
+                 '-T{}'.format(threads or 0)],
+                stdin=subprocess.PIPE, stdout=fileobj)
+        except OSError as ex:
+            raise exceptions.IRException(
+                "The zstd compression requires the 'zstd' command: "
+                "{}".format(ex))
+
+    def write(self, data):
+        self.process.stdin.write(data)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait():
+            raise exceptions.IRException(
+                "zstd failed with the exit code {}".format(
+                    self.process.returncode))
+
+
+class _ProgressReader(object):
+    """Reports the progress of the file reading. """
+
+    def __init__(self, fileobj, progress):
+        self.fileobj = fileobj
+        self.progress = progress
+
+    def read(self, size=-1):
+        data = self.fileobj.read(
+            READ_CHUNK_SIZE if size is None or size < 0 else size)
+        self.progress.update(len(data))
+        return data
+
+
+class Progress(object):
+    """Collects the number of the archived bytes and reports it. """
+
+    def __init__(self, total, callback=None):
+        """Initializes the progress.
+
+        :param total: the number of the bytes to archive
+        :param callback: function called with the archived and the total
+            bytes once per PROGRESS_INTERVAL and at the end
+        """
+        self.total = total
+        self.done = 0
+        self.callback = callback
+        self._reported = 0
+
+    def update(self, size):
+        self.done += size
+        if self.callback is not None and \
+                time.time() - self._reported >= PROGRESS_INTERVAL:
+            self._reported = time.time()
+            self.callback(self.done, self.total)
+
+    def finish(self):
+        # the files could be changed while archived
+        self.done = self.total
+        if self.callback is not None:
+            self.callback(self.done, self.total)
+
+
+def is_excluded(rel_path, is_dir, excludes):
+    """Checks whether the workspace file is excluded.
+
+    :param rel_path: the file path relative to the workspace
+    :param is_dir: whether the file is a directory
+    :param excludes: list of the glob patterns, the patterns ending with
+        '/' match only the directories, the patterns without '/' match the
+        files names, the rest match the relative paths
+    """
+    name = os.path.basename(rel_path)
+    for pattern in excludes:
+        if pattern.endswith('/'):
+            if not is_dir:
+                continue
+            pattern = pattern.rstrip('/')
+        target = rel_path if '/' in pattern else name
+        if fnmatch.fnmatchcase(target, pattern):
+            return True
+    return False
+
+
+class WorkspaceExporter(object):
+    """Exports the workspace into the archive. """
+
+    def __init__(self, workspace, excludes=None, compression='gz',
+                 level=None, threads=None, copykeys=False,
+                 progress_callback=None):
+        """Initializes the exporter.
+
+        :param workspace: the Workspace object to export
+        :param excludes: list of the glob patterns of the files to skip (see
+            is_excluded)
+        :param compression: one of the COMPRESSIONS
+        :param level: the compression level, the DEFAULT_LEVELS by default
+        :param threads: number of the compressing threads, the number of the
+            CPUs by default
+        :param copykeys: whether to add the SSH keys from outside of the
+            workspace referred by the inventory files
+        :param progress_callback: function called with the archived and the
+            total bytes
+        """
+        if compression not in COMPRESSIONS:
+            raise exceptions.IRException(
+                "Unsupported compression '{}', choose from {}".format(
+                    compression, ", ".join(COMPRESSIONS)))
+        self.workspace = workspace
+        self.excludes = excludes or []
+        self.compression = compression
+        self.level = level
+        self.threads = threads
+        self.copykeys = copykeys
+        self.progress_callback = progress_callback
+
+    def _get_inventory_files(self):
+        """Gets the real paths of the workspace inventory files.
+
+        Unlike Workspace.inventory_files, the default inventory isn't created
+        when missing, the exported workspace is never modified.
+        """
+        from infrared.core.services.workspaces import INVENTORY_FILES_PATTERN
+        from infrared.core.services.workspaces import INVENTORY_LINK
+        import glob
+
+        files = glob.glob(os.path.join(
+            self.workspace.path, INVENTORY_FILES_PATTERN))
+        files.append(os.path.join(self.workspace.path, INVENTORY_LINK))
+        return set(os.path.realpath(inv) for inv in files
+                   if os.path.isfile(inv))
+
+    def _get_inventories(self):
+        """Gets the inventory files contents with the paths replaced.
+
+        :return: tuple of the dict of the inventory files real paths and the
+            new contents, and the dict of the SSH keys to add and their names
+            in the archive
+        """
+        path = self.workspace.path
+        placeholder = self.workspace.path_placeholder
+        contents = {}
+        for inv in self._get_inventory_files():
+            with open(inv) as stream:
+                contents[inv] = ''.join(
+                    re.sub(path, placeholder, line.rstrip()) + '\n'
+                    for line in stream)
+
+        keys = {}
+        if not self.copykeys:
+            return contents, keys
+
+        for inv in sorted(contents):
+            ssh_keys = set(re.findall(
+                r"ansible_ssh_private_key_file=(\/\S+)", contents[inv]))
+            LOG.debug("SSH keys to copy:\n  {}".format(ssh_keys))
+            for ssh_key in sorted(ssh_keys, reverse=True):
+                # Skip SSH keys that already in the workspace
+                if ssh_key.startswith(path) or \
+                        ssh_key.startswith(placeholder):
+                    continue
+                if ssh_key not in keys:
+                    keys[ssh_key] = "{}-{}".format(
+                        os.path.basename(ssh_key),
+                        next(tempfile._get_candidate_names()))
+                    LOG.debug("Adding SSH key '{}' as '{}'".format(
+                        ssh_key, keys[ssh_key]))
+                contents[inv] = contents[inv].replace(
+                    ssh_key, os.path.join(placeholder, keys[ssh_key]))
+        return contents, keys
+
+    def _iter_files(self):
+        """Iterates over the workspace files to archive.
+
+        :return: generator of the (path, relative path, size) tuples, the
+            directories are listed before their content
+        """
+        yield self.workspace.path, '', 0
+        for root, dirs, files in os.walk(self.workspace.path):
+            rel_root = os.path.relpath(root, self.workspace.path)
+            rel_root = '' if rel_root == os.curdir else rel_root
+            for names, is_dir in ((dirs, True), (files, False)):
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    rel_path = os.path.join(rel_root, name).replace(
+                        os.sep, '/')
+                    is_link = os.path.islink(path)
+                    excluded = is_excluded(rel_path, is_dir, self.excludes)
+                    if is_dir and (excluded or is_link):
+                        # the links are added, but not followed
+                        dirs.remove(name)
+                    if excluded:
+                        LOG.debug("Excluding '{}'".format(rel_path))
+                        continue
+                    yield path, rel_path, 0 if is_dir or is_link else \
+                        os.lstat(path).st_size
+            dirs.sort()
+
+    def _open_writer(self, fileobj):
+        if self.compression == 'gz':
+            return ParallelGzipWriter(fileobj, self.level, self.threads)
+        if self.compression == 'zst':
+            return ZstdWriter(fileobj, self.level, self.threads)
+        return None
+
+    def export(self, file_name):
+        """Writes the archive.
+
+        :param file_name: the archive file path, replaced if exists
+        """
+        contents, keys = self._get_inventories()
+        files = list(self._iter_files())
+        progress = Progress(
+            sum(size for _, _, size in files) +
+            sum(os.path.getsize(key) for key in keys),
+            self.progress_callback)
+
+        # the archive is written next to the target and renamed when
+        # complete, so the existing archive isn't broken by a failure
+        fd, tmp_name = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(file_name)),
+            prefix='.' + os.path.basename(file_name))
+        try:
+            with os.fdopen(fd, 'wb') as archive:
+                writer = self._open_writer(archive)
+                try:
+                    with tarfile.open(fileobj=writer or archive,
+                                      mode='w|',
+                                      bufsize=READ_CHUNK_SIZE) as tar:
+                        tar.copybufsize = READ_CHUNK_SIZE
+                        for path, rel_path, _ in files:
+                            self._add(tar, path, './' + rel_path, contents,
+                                      progress)
+                        for key, name in sorted(keys.items()):
+                            self._add(tar, key, './' + name, {}, progress)
+                finally:
+                    if writer is not None:
+                        writer.close()
+            # mkstemp creates the file readable by the owner only
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_name, 0o666 & ~umask)
+            os.rename(tmp_name, file_name)
+        except BaseException:
+            os.remove(tmp_name)
+            raise
+        progress.finish()
+
+    @staticmethod
+    def _add(tar, path, arcname, contents, progress):
+        """Adds the file to the archive.
+
+        :param contents: dict of the real paths of the files added with the
+            different content and the contents
+        """
+        import io
+
+        tarinfo = tar.gettarinfo(path, arcname)
+        if tarinfo is None:
+            LOG.warning("Skipping the unsupported file '{}'".format(path))
+            return
+        if not tarinfo.isreg():
+            tar.addfile(tarinfo)
+            return
+
+        content = contents.get(os.path.realpath(path))
+        if content is not None:
+            data = content.encode('utf-8')
+            tarinfo.size = len(data)
+            tar.addfile(tarinfo, io.BytesIO(data))
+            progress.update(os.lstat(path).st_size)
+            return
+        with open(path, 'rb') as stream:
+            tar.addfile(tarinfo, _ProgressReader(stream, progress))
+
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+# the size of the chunks read from the archive
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# number of the attempts to resume the broken download without progress
+DOWNLOAD_RETRIES = 5
+# seconds to wait before the resume attempt (multiplied by the attempt)
+DOWNLOAD_RETRY_DELAY = 1.0
+
+
+class ResumableDownload(object):
+    """The file object reading the archive from the URL.
+
+    The archive is streamed in chunks. When the connection is broken, the
+    download is resumed from the last read byte with the HTTP Range request
+    (the read bytes are skipped when the server doesn't support the ranges).
+    """
+
+    def __init__(self, url, retries=None):
+        """Sends the request.
+
+        :param url: the archive URL
+        :param retries: number of the attempts to resume the download
+            without any progress, DOWNLOAD_RETRIES by default
+        """
+        import urllib3
+
+        self.url = url
+        self.retries = DOWNLOAD_RETRIES if retries is None else retries
+        self.http = urllib3.PoolManager()
+        self.offset = 0
+        self.total = None
+        self.response = None
+        self._open()
+
+    def _open(self):
+        headers = {}
+        if self.offset:
+            headers['Range'] = 'bytes={}-'.format(self.offset)
+        response = self.http.request('GET', self.url, headers=headers,
+                                     preload_content=False)
+        if self.offset and response.status == 206:
+            match = re.match(r'bytes (\d+)-\d+/(\d+|\*)',
+                             response.headers.get('Content-Range', ''))
+            if match is None or int(match.group(1)) != self.offset:
+                response.release_conn()
+                raise exceptions.IRFailedToImportWorkspace(
+                    "Unexpected Content-Range '{}' from workspace URL "
+                    "({})".format(response.headers.get('Content-Range'),
+                                  self.url))
+            if match.group(2) != '*':
+                self.total = int(match.group(2))
+        elif response.status == 200:
+            length = response.headers.get('Content-Length')
+            self.total = int(length) if length else None
+            if self.offset:
+                LOG.warning("The server doesn't support the ranges, "
+                            "skipping {} downloaded bytes".format(
+                                self.offset))
+            skip = self.offset
+            while skip:
+                data = response.read(min(skip, DOWNLOAD_CHUNK_SIZE),
+                                     decode_content=False)
+                if not data:
+                    break
+                skip -= len(data)
+        else:
+            response.release_conn()
+            raise exceptions.IRFailedToImportWorkspace(
+                'Got unexpected returned code ({}) from workspace '
+                'URL ({})'.format(response.status, self.url))
+        self.response = response
+
+    def read(self, size=-1):
+        import socket
+        import urllib3
+
+        size = DOWNLOAD_CHUNK_SIZE if size is None or size < 0 else size
+        failures = 0
+        while True:
+            try:
+                if self.response is None:
+                    self._open()
+                data = self.response.read(size, decode_content=False)
+                if data or self.total is None or self.offset >= self.total:
+                    self.offset += len(data)
+                    return data
+                error = "connection closed"
+            except (urllib3.exceptions.HTTPError, socket.error) as ex:
+                error = ex
+
+            failures += 1
+            if failures > self.retries:
+                raise exceptions.IRFailedToImportWorkspace(
+                    "Download of {} failed at byte {}: {}".format(
+                        self.url, self.offset, error))
+            LOG.warning("Download of {} is broken at byte {} ({}), "
+                        "resuming".format(self.url, self.offset, error))
+            self.close()
+            time.sleep(DOWNLOAD_RETRY_DELAY * failures)
+
+    def close(self):
+        if self.response is not None:
+            self.response.release_conn()
+            self.response = None
+
+
+class HashingReader(object):
+    """Computes the hash of the data read from the file object. """
+
+    def __init__(self, fileobj, algorithm='sha256'):
+        import hashlib
+
+        self.fileobj = fileobj
+        self.hash = hashlib.new(algorithm)
+
+    def read(self, size=-1):
+        data = self.fileobj.read(
+            DOWNLOAD_CHUNK_SIZE if size is None or size < 0 else size)
+        self.hash.update(data)
+        return data
+
+    def drain(self):
+        """Reads the rest of the data (after the end of the archive). """
+        while self.read(DOWNLOAD_CHUNK_SIZE):
+            pass
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+class _PrefixedReader(object):
+    """Returns the already read prefix before the rest of the file. """
+
+    def __init__(self, prefix, fileobj):
+        self.prefix = prefix
+        self.fileobj = fileobj
+
+    def read(self, size=-1):
+        if not self.prefix:
+            return self.fileobj.read(size)
+        if size is None or size < 0:
+            data, self.prefix = self.prefix + self.fileobj.read(), b''
+            return data
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        if len(data) < size:
+            data += self.fileobj.read(size - len(data))
+        return data
+
+
+class _ZstdReader(object):
+    """The file object reading the data decompressed by the zstd command.
+
+    The compressed data is fed to the command by a thread.
+    """
+
+    def __init__(self, fileobj):
+        import subprocess
+        import threading
+
+        try:
+            self.process = subprocess.Popen(
+                ['zstd', '-q', '-d', '-c'],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        except OSError as ex:
+            raise exceptions.IRException(
+                "The zstd archive requires the 'zstd' command: {}".format(ex))
+        self.fileobj = fileobj
+        self.error = None
+        self.thread = threading.Thread(target=self._feed)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _feed(self):
+        try:
+            while True:
+                data = self.fileobj.read(DOWNLOAD_CHUNK_SIZE)
+                if not data:
+                    break
+                self.process.stdin.write(data)
+        except Exception as ex:
+            self.error = ex
+        finally:
+            try:
+                self.process.stdin.close()
+            except (IOError, OSError):
+                pass
+
+    def read(self, size=-1):
+        return self.process.stdout.read(size)
+
+    def close(self, complete=True):
+        """Stops the decompression.
+
+        :param complete: whether the archive is fully read, the rest of the
+            decompressed data is read and the errors are raised then
+        """
+        if complete:
+            while self.process.stdout.read(DOWNLOAD_CHUNK_SIZE):
+                pass
+        else:
+            self.process.kill()
+        self.process.stdout.close()
+        self.thread.join()
+        self.process.wait()
+        if not complete:
+            return
+        if self.error is not None:
+            raise self.error
+        if self.process.returncode:
+            raise tarfile.ReadError(
+                "zstd failed with the exit code {}".format(
+                    self.process.returncode))
+
+
+def _rewrite_inventory(tar, member, target, placeholder, replace):
+    """Extracts the inventory file with the placeholder replaced. """
+    import io
+
+    content = tar.extractfile(member).read().decode('utf-8')
+    data = ''.join(re.sub(placeholder, replace, line.rstrip()) + '\n'
+                   for line in io.StringIO(content)).encode('utf-8')
+    if os.path.lexists(target):
+        os.remove(target)
+    with open(target, 'wb') as stream:
+        stream.write(data)
+    os.chmod(target, member.mode)
+    os.utime(target, (member.mtime, member.mtime))
+
+
+def extract(fileobj, path, placeholder=None, replace=None):
+    """Extracts the workspace archive while it is read.
+
+    The inventory files (the files matched by the inventory files pattern
+    and the target of the inventory link, if it precedes the target in the
+    archive) are extracted with the placeholder replaced.
+
+    :param fileobj: the file object of the archive (compressed with gzip,
+        zstd, bzip2, xz or not compressed), read sequentially
+    :param path: the directory to extract the archive into
+    :param placeholder: the workspace path placeholder to replace
+    :param replace: the path replacing the placeholder
+    :return: list of the paths of the inventory files with the placeholder
+        replaced
+    """
+    from infrared.core.services.workspaces import INVENTORY_FILES_PATTERN
+    from infrared.core.services.workspaces import INVENTORY_LINK
+
+    prefix = fileobj.read(len(ZSTD_MAGIC))
+    stream = _PrefixedReader(prefix, fileobj)
+    zstd_reader = _ZstdReader(stream) if prefix == ZSTD_MAGIC else None
+
+    rewritten = []
+    link_targets = set()
+    try:
+        with tarfile.open(fileobj=zstd_reader or stream, mode='r|*') as tar:
+            for member in tar:
+                name = os.path.normpath(member.name)
+                if placeholder is not None and member.issym() and \
+                        name == INVENTORY_LINK:
+                    link_targets.add(os.path.normpath(member.linkname))
+                if placeholder is not None and member.isreg() and \
+                        os.path.dirname(name) == '' and (
+                        name in link_targets or fnmatch.fnmatchcase(
+                            name, INVENTORY_FILES_PATTERN)):
+                    target = os.path.join(path, name)
+                    _rewrite_inventory(tar, member, target, placeholder,
+                                       replace)
+                    rewritten.append(target)
+                else:
+                    tar.extract(member, path)
+    except BaseException:
+        if zstd_reader is not None:
+            zstd_reader.close(complete=False)
+        raise
+    if zstd_reader is not None:
+        zstd_reader.close()
+    return rewritten
+
+
+def get_archive_name(file_name):
+    """Gets the archive file name without the archive extension. """
+    basename = os.path.basename(file_name)
+    for extension in ('.tar.gz', '.tar.zst', '.tgz', '.tar'):
+        if basename.endswith(extension):
+            return basename[:-len(extension)]
+    return ".".join(basename.split(".")[:-1])
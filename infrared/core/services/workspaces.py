@@ -3,13 +3,13 @@ from __future__ import print_function
 import datetime
 import fileinput
 import glob
+import json
 import os
 import re
 import shutil
 import tarfile
 import tempfile
 import time
-import urllib3
 
 from infrared.core.utils import exceptions
 from infrared.core.utils import logger
@@ -25,6 +25,129 @@ LOCAL_HOSTS = """[local]
 localhost ansible_connection=local
 """
 EXCLUDED_GROUPS = ['all', 'local', 'ungrouped']
+INDEX_FILE_NAME = ".index.json"
+
+
+def _iter_dir_names(path):
+    """Iterates over the names of the directories in the path (not nested).
+
+    :param path: the directory to list
+    """
+    if hasattr(os, 'scandir'):
+        for entry in list(os.scandir(path)):
+            if entry.is_dir():
+                yield entry.name
+    else:
+        for name in os.listdir(path):
+            if os.path.isdir(os.path.join(path, name)):
+                yield name
+
+
+def get_tree_size(path):
+    """Gets the size of all the files in the directory tree.
+
+    The symlinks are not followed.
+
+    :param path: the directory path
+    :return: the size in bytes
+    """
+    size = 0
+    dirs = [path]
+    while dirs:
+        current = dirs.pop()
+        if hasattr(os, 'scandir'):
+            entries = [(entry.path, entry.is_dir(follow_symlinks=False),
+                        entry) for entry in os.scandir(current)]
+        else:
+            entries = [(os.path.join(current, name), None, None)
+                       for name in os.listdir(current)]
+        for entry_path, is_dir, entry in entries:
+            if is_dir is None:
+                is_dir = os.path.isdir(entry_path) and \
+                    not os.path.islink(entry_path)
+            if is_dir:
+                dirs.append(entry_path)
+                continue
+            try:
+                size += entry.stat(follow_symlinks=False).st_size \
+                    if entry is not None else os.lstat(entry_path).st_size
+            except OSError:
+                # the file is removed meanwhile
+                pass
+    return size
+
+
+class WorkspaceIndex(object):
+    """The cached details of the workspaces.
+
+    The index is kept in the workspaces directory and is updated by the
+    workspaces manager when a workspace is created, deleted, imported,
+    cleaned up or used, so the details are shown without walking the
+    workspaces. The workspaces directories are still the source of truth,
+    the index entries are added and dropped to match them when listed.
+
+    The index is disabled by setting the ``IR_WORKSPACE_INDEX`` environment
+    variable to 'false', the details are gathered from the workspaces
+    directories every time then.
+    """
+
+    def __init__(self, workspaces_dir):
+        self.path = os.path.join(workspaces_dir, INDEX_FILE_NAME)
+
+    @property
+    def enabled(self):
+        from distutils.util import strtobool
+
+        return strtobool(os.environ.get('IR_WORKSPACE_INDEX', 'yes'))
+
+    @staticmethod
+    def new_entry(created=None):
+        """Gets the details of the workspace which isn't measured yet. """
+        return dict(created=created or time.time(), last_used=None,
+                    size=None, size_updated=None)
+
+    def load(self):
+        """Loads the index.
+
+        :return: dict of the workspaces names and their details dicts
+            ('created', 'last_used', 'size' & 'size_updated' timestamps)
+        """
+        if not self.enabled:
+            return {}
+        try:
+            with open(self.path) as fp:
+                return json.load(fp).get('workspaces', {})
+        except (IOError, OSError, ValueError, AttributeError):
+            return {}
+
+    def save(self, workspaces):
+        """Writes the index atomically. """
+        if not self.enabled:
+            return
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, 'w') as fp:
+            json.dump(dict(workspaces=workspaces), fp, indent=4,
+                      sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+    def add(self, name):
+        """Adds the new workspace to the index. """
+        workspaces = self.load()
+        workspaces[name] = self.new_entry()
+        self.save(workspaces)
+
+    def remove(self, name):
+        """Removes the workspace from the index. """
+        workspaces = self.load()
+        if workspaces.pop(name, None) is not None:
+            self.save(workspaces)
+
+    def touch(self, name):
+        """Marks the workspace used, so its size is measured again. """
+        workspaces = self.load()
+        workspaces.setdefault(name, self.new_entry())['last_used'] = \
+            time.time()
+        self.save(workspaces)
 
 
 class WorkspaceRegistry(object):
@@ -72,6 +195,13 @@ class Workspace(object):
         self.path = path
         self.registy = WorkspaceRegistry(self.path)
 
+    @property
+    def history(self):
+        """The plugins runs history of the workspace. """
+        from infrared.core.history import HISTORY_FILE_NAME
+        from infrared.core.history import RunHistory
+        return RunHistory(os.path.join(self.path, HISTORY_FILE_NAME))
+
     @property
     def inventory_files(self):
         """Workspace all inventory files
@@ -145,13 +275,16 @@ class Workspace(object):
                 os.unlink(first)
             first = self.registy.pop()
 
-    def _update_paths(self, pattern, replace):
+    def _update_paths(self, pattern, replace, exclude=None):
         """Update inventory with new workspace directory path.
 
         :param pattern: Pattern to replace in inventory file.
         :param replace: Replacement for patterns found.
+        :param exclude: list of the inventory files already updated
         """
-        inventories = self.inventory_files
+        exclude = set(os.path.normpath(inv) for inv in exclude or [])
+        inventories = [inv for inv in self.inventory_files
+                       if os.path.normpath(inv) not in exclude]
 
         # iterate over all inventory files and purge / populate paths
         for inv in inventories:
@@ -278,6 +411,7 @@ class WorkspaceManager(object):
         self.active_basename = 'active'
         self.active_path = os.path.join(workspaces_base_dir,
                                         self.active_basename)
+        self.index = WorkspaceIndex(self.workspace_dir)
 
     def has_workspace(self, name):
         """Checks if workspace is present."""
@@ -301,6 +435,7 @@ class WorkspaceManager(object):
         os.makedirs(path)
         LOG.debug("Workspace {} created in {}".format(name, path))
         workspace = Workspace(name, path)
+        self.index.add(name)
         return workspace
 
     def activate(self, name):
@@ -320,6 +455,7 @@ class WorkspaceManager(object):
 
         if self.has_workspace(name):
             self._create_active_path(name)
+            self.index.touch(name)
             LOG.debug("Activating workspace %s in %s",
                       name,
                       os.path.join(self.workspace_dir, name))
@@ -343,27 +479,53 @@ class WorkspaceManager(object):
                 os.remove(self.active_path)
 
         shutil.rmtree(os.path.join(self.workspace_dir, name))
+        self.index.remove(name)
 
     def list(self):
         """Lists all the existing workspaces.
 
-        walk returns the basedir as well. need to remove it and avoid listing
-        subfolders
+        Only the workspaces directory itself is scanned, the workspaces
+        content isn't walked.
         """
-        dirlist = list(os.walk(self.workspace_dir))
-        if dirlist:
-            return [Workspace(os.path.basename(d),
-                              os.path.join(self.workspace_dir, d))
-                    for d in dirlist[0][1]
-                    if d != self.active_basename]
-        else:
-            return []
+        return [Workspace(name, os.path.join(self.workspace_dir, name))
+                for name in _iter_dir_names(self.workspace_dir)
+                if name != self.active_basename]
 
     def get(self, name):
         """Gets an existing workspace."""
 
-        return next((workspace for workspace in self.list()
-                     if workspace.name == name), None)
+        if not name or name == self.active_basename or \
+                os.sep in name or name in (os.curdir, os.pardir):
+            return None
+        path = os.path.join(self.workspace_dir, name)
+        return Workspace(name, path) if os.path.isdir(path) else None
+
+    def get_details(self):
+        """Gets the details of all the workspaces from the index.
+
+        The index is synchronized with the workspaces directories and the
+        sizes of the workspaces used since they were measured are updated.
+
+        :return: dict of the workspaces names and their details dicts
+            ('created', 'last_used', 'size' & 'size_updated' timestamps)
+        """
+        indexed = self.index.load()
+        workspaces = {}
+        for workspace in self.list():
+            entry = indexed.get(workspace.name)
+            if entry is None:
+                # created before the index or by another tool
+                entry = self.index.new_entry(
+                    created=os.path.getmtime(workspace.path))
+            if entry['size'] is None or \
+                    (entry['last_used'] or 0) >= entry['size_updated']:
+                entry['size'] = get_tree_size(workspace.path)
+                entry['size_updated'] = time.time()
+            workspaces[workspace.name] = entry
+
+        if workspaces != indexed:
+            self.index.save(workspaces)
+        return workspaces
 
     def get_active_workspace(self):
         """Gets the active workspace.
@@ -399,11 +561,31 @@ class WorkspaceManager(object):
 
         return self.get(active_name)
 
-    def export_workspace(self, workspace_name, file_name=None, copykeys=False):
-        """Export content of workspace folder as gzipped tar file
-
-        Replaces existing .tgz file
+    def export_workspace(self, workspace_name, file_name=None, copykeys=False,
+                         excludes=None, compression='gz', level=None,
+                         threads=None, progress_callback=None):
+        """Export content of workspace folder as compressed tar file
+
+        The files are streamed into the archive, the inventory files are
+        added with the workspace paths replaced by the placeholder.
+        Replaces existing archive file
+
+        :param workspace_name: the workspace to export, the active workspace
+            by default
+        :param file_name: the archive name without the extension (added
+            according to the compression), the workspace name by default
+        :param copykeys: whether to add the SSH keys from outside of the
+            workspace to the archive
+        :param excludes: list of the glob patterns of the files to skip,
+            e.g. 'ansible_outputs/' or '*.qcow2'
+        :param compression: 'gz' (default), 'zst' or 'none'
+        :param level: the compression level
+        :param threads: number of the compressing threads, the number of the
+            CPUs by default
+        :param progress_callback: function called with the archived and the
+            total bytes
         """
+        from infrared.core.services import workspace_archive
 
         if workspace_name:
             workspace = self.get(workspace_name)
@@ -414,85 +596,89 @@ class WorkspaceManager(object):
             if workspace is None:
                 raise exceptions.IRNoActiveWorkspaceFound()
 
-        fname = file_name or workspace.name
+        fname = (file_name or workspace.name) + \
+            workspace_archive.ARCHIVE_EXTENSIONS.get(compression, '')
+        workspace_archive.WorkspaceExporter(
+            workspace, excludes=excludes, compression=compression,
+            level=level, threads=threads, copykeys=copykeys,
+            progress_callback=progress_callback).export(fname)
 
-        # Copy workspace to not damage original,
-        tmpdir = tempfile.mkdtemp()
-        tmp_workspace_path = os.path.join(tmpdir,
-                                          os.path.basename(workspace.path))
+        print("Workspace {} is exported to file {}".format(workspace.name,
+                                                           fname))
 
-        try:
-            shutil.copytree(workspace.path, tmp_workspace_path,
-                            symlinks=True)
-            tmp_workspace = Workspace(name=workspace.name,
-                                      path=tmp_workspace_path)
-            tmp_workspace._update_paths(workspace.path,
-                                        workspace.path_placeholder)
-            if copykeys:
-                tmp_workspace._copy_outside_keys()
-            with tarfile.open(fname + '.tgz', "w:gz") as tar:
-                tar.add(tmp_workspace.path, arcname="./")
-        finally:
-            shutil.rmtree(tmpdir)
-
-        print("Workspace {} is exported to file {}.tgz".format(workspace.name,
-                                                               fname))
-
-    def import_workspace(self, workspace_src, workspace_name=None):
-        """Import workspace from gzipped tar file
+    def import_workspace(self, workspace_src, workspace_name=None,
+                         sha256=None):
+        """Import workspace from compressed tar file
 
         Workspace name should be unique
-        Replaces workspace path placeholders with new ones in inventory
+        The archive is extracted while it is read (downloaded), the
+        workspace path placeholders are replaced with new ones in inventory
+        when the inventory files are extracted
 
         :param workspace_src: Path/URL to a workspace tgz file
         :param workspace_name: Workspace name (same as the tgz file basename
         if not given)
+        :param sha256: the expected sha256 checksum of the archive
         """
-        original_src = workspace_src
-        try:
-            if not os.path.exists(workspace_src):
-                http = urllib3.PoolManager()
-                urllib_ret = http.request('GET', workspace_src)
-                if urllib_ret.status != 200:
-                    raise exceptions.IRFailedToImportWorkspace(
-                        'Got unexpected returned code ({}) from workspace '
-                        'URL ({})'.format(urllib_ret.status, workspace_src))
-                tmp_dir = tempfile.mkdtemp()
-                workspace_src = \
-                    os.path.join(tmp_dir, workspace_src.split('/')[-1])
-                with open(workspace_src, 'wb') as f:
-                    f.write(urllib_ret.data)
+        import urllib3
+        from infrared.core.services import workspace_archive
 
-            if workspace_name is None:
-                basename = os.path.basename(workspace_src)
-                workspace_name = ".".join(basename.split(".")[:-1])
-
-            new_workspace = self.create(name=workspace_name)
-
-            LOG.debug("Importing workspace from '{}' to '{}'".format(
-                original_src, new_workspace.path))
-
-            with tarfile.open(workspace_src) as tar:
-                tar.extractall(path=new_workspace.path)
-
-        except urllib3.exceptions.HTTPError:
-            raise exceptions.IRFailedToImportWorkspace(
-                'Workspace URL not found - ({}) '.format(workspace_src))
-        except tarfile.ReadError as e:
-            raise exceptions.IRFailedToImportWorkspace(
-                "{} tar{}".format(workspace_src, e.message))
-        except ValueError as e:
-            err_msg = "Workspace file not found"
-            if 'unknown url' in e.message:
-                err_msg += ' - If you entered a remote URL,' \
-                           ' please make sure to provide its type'
-            raise exceptions.IRFailedToImportWorkspace(err_msg)
-        finally:
-            if 'tmp_dir' in locals():
-                shutil.rmtree(tmp_dir)
-
-        new_workspace._update_paths(new_workspace.path_placeholder,
-                                    new_workspace.path)
+        if workspace_name is None:
+            workspace_name = workspace_archive.get_archive_name(workspace_src)
+        if self.has_workspace(workspace_name):
+            raise exceptions.IRWorkspaceExists(workspace=workspace_name)
+
+        new_workspace = None
+        source = None
+        try:
+            try:
+                if os.path.exists(workspace_src):
+                    source = open(workspace_src, 'rb')
+                else:
+                    source = workspace_archive.ResumableDownload(
+                        workspace_src)
+                reader = workspace_archive.HashingReader(source) if sha256 \
+                    else source
+
+                new_workspace = self.create(name=workspace_name)
+                LOG.debug("Importing workspace from '{}' to '{}'".format(
+                    workspace_src, new_workspace.path))
+                rewritten = workspace_archive.extract(
+                    reader, new_workspace.path,
+                    new_workspace.path_placeholder, new_workspace.path)
+
+                if sha256:
+                    reader.drain()
+                    if reader.hexdigest() != sha256.lower():
+                        raise exceptions.IRFailedToImportWorkspace(
+                            "sha256 checksum of {} is {}, expected "
+                            "{}".format(workspace_src, reader.hexdigest(),
+                                        sha256))
+            except urllib3.exceptions.HTTPError:
+                raise exceptions.IRFailedToImportWorkspace(
+                    'Workspace URL not found - ({}) '.format(workspace_src))
+            except tarfile.TarError as e:
+                raise exceptions.IRFailedToImportWorkspace(
+                    "{} tar {}".format(workspace_src, e))
+            except ValueError as e:
+                err_msg = "Workspace file not found"
+                if 'unknown url' in str(e):
+                    err_msg += ' - If you entered a remote URL,' \
+                               ' please make sure to provide its type'
+                raise exceptions.IRFailedToImportWorkspace(err_msg)
+            finally:
+                if source is not None:
+                    source.close()
+        except BaseException:
+            # the partially imported workspace
+            if new_workspace is not None:
+                self.delete(new_workspace.name)
+            raise
+
+        # the inventory files preceding the inventory link in the archive
+        new_workspace._update_paths(
+            new_workspace.path_placeholder, new_workspace.path,
+            exclude=rewritten)
         self.activate(new_workspace.name)
 
     def is_active(self, name):
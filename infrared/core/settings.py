@@ -1,7 +1,26 @@
-import yaml
+import contextlib
 
 from infrared.core.utils import dict_utils
 from infrared.core.utils import exceptions
+from infrared.core.utils import yaml_io
+
+
+@contextlib.contextmanager
+def _private_settings_check():
+    """Explains the missing key of the private settings to the user.
+
+    :raise IRPrivateSettingsMissingException: the ``private.`` key is missing
+    """
+    try:
+        yield
+
+    # handle errors here and provide more output for user if required
+    except exceptions.IRKeyNotFoundException as key_exception:
+        if key_exception and key_exception.key.startswith("private."):
+            raise exceptions.IRPrivateSettingsMissingException(
+                key_exception.key)
+        else:
+            raise
 
 
 class VarsDictManager(object):
@@ -30,21 +49,9 @@ class VarsDictManager(object):
         {'entry_point': {'foo': {'bar': 'value1', 'another':\
  {'bar': 'value3'}}, 'foo2': 'value2'}}
         """
-        vars_dict = {entry_point: {}}
-        try:
-            for _name, argument in nested_args.items():
-                dict_utils.dict_insert(vars_dict[entry_point],
-                                       argument,
-                                       *_name.split(delimiter))
-
-        # handle errors here and provide more output for user if required
-        except exceptions.IRKeyNotFoundException as key_exception:
-            if key_exception and key_exception.key.startswith("private."):
-                raise exceptions.IRPrivateSettingsMissingException(
-                    key_exception.key)
-            else:
-                raise
-        return vars_dict
+        layered_vars = LayeredVars()
+        layered_vars.add_args(entry_point, nested_args, delimiter=delimiter)
+        return layered_vars.materialize()
 
     @staticmethod
     def merge_extra_vars(vars_dict, extra_vars=None):
@@ -53,33 +60,264 @@ class VarsDictManager(object):
         :param vars_dict: Dictionary to merge extra-vars into
         :param extra_vars: List of extra-vars
         """
-        for extra_var in extra_vars or []:
-            if extra_var.startswith('@'):
-                with open(extra_var[1:]) as f_obj:
-                    loaded_yml = yaml.safe_load(f_obj)
+        layered_vars = LayeredVars()
+        layered_vars.add_extra_vars(extra_vars)
+        layered_vars.materialize(vars_dict)
+
 
-                dict_utils.dict_merge(
-                    vars_dict,
-                    loaded_yml,
-                    conflict_resolver=dict_utils.ConflictResolver.
-                    unique_append_list_resolver)
+def _expand_sources(sources, key, value):
+    """Gets the sources of the dict value items.
 
+    The sources of the dict assigned as a whole are expanded to its items
+    only when the dict is merged with another layer.
+
+    :param sources: the sources of the parent dict items
+    :param key: the key of the dict value in the parent dict
+    :param value: the dict value
+    :return: dict of the value items sources
+    """
+    node = sources.get(key)
+    if not isinstance(node, dict):
+        node = dict((item_key, list(node or []))
+                    for item_key in value)
+        sources[key] = node
+    return node
+
+
+def _collect_sources(node):
+    """Gets the sources of all the values under the sources node. """
+    if not isinstance(node, dict):
+        return list(node or [])
+    collected = []
+    for child in node.values():
+        collected.extend(source for source in _collect_sources(child)
+                         if source not in collected)
+    return collected
+
+
+def _tracked_merge(first, first_sources, second, source, conflict_resolver):
+    """Merges the dicts like ``dict_merge`` and records the values sources.
+
+    :param first: Modified dict
+    :param first_sources: the sources of the first dict items
+    :param second: Modifier dict
+    :param source: the source of the second dict values
+    :param conflict_resolver: Function that resolves a merge between 2 values
+        when one of them isn't a dict
+    """
+    stack = [(first, first_sources, second, iter(second))]
+    while stack:
+        first, sources, second, keys = stack[-1]
+        for key in keys:
+            if key not in first:
+                first[key] = second[key]
+                sources[key] = [source]
+                continue
+            if isinstance(first[key], dict) and isinstance(second[key], dict):
+                stack.append((first[key],
+                              _expand_sources(sources, key, first[key]),
+                              second[key], iter(second[key])))
+                break
+            appended = conflict_resolver is dict_utils.ConflictResolver.\
+                unique_append_list_resolver and \
+                isinstance(first[key], list) and \
+                isinstance(second[key], list)
+            conflict_resolver(first, second, key)
+            if appended:
+                collected = _collect_sources(sources.get(key))
+                sources[key] = collected + (
+                    [source] if source not in collected else [])
             else:
-                if '=' not in extra_var:
-                    raise exceptions.IRExtraVarsException(extra_var)
-                key, value = extra_var.split("=", 1)
-                if value.startswith('@'):
-                    with open(value[1:]) as f_obj:
-                        loaded_yml = yaml.safe_load(f_obj)
-
-                    tmp_dict = {}
-                    dict_utils.dict_insert(tmp_dict, loaded_yml, *key.split("."))
-
-                    dict_utils.dict_merge(
-                        vars_dict,
-                        tmp_dict,
-                        conflict_resolver=dict_utils.ConflictResolver.
-                        unique_append_list_resolver)
-
-                else:
-                    dict_utils.dict_insert(vars_dict, value, *key.split("."))
+                sources[key] = [source]
+        else:
+            stack.pop()
+
+
+def _tracked_insert(dic, sources, val, source, *keys):
+    """Inserts the value like ``dict_insert`` and records its source.
+
+    :param dic: a dictionary object to insert the nested key value into
+    :param sources: the sources of the dictionary items
+    :param val: a value to insert to the given dictionary
+    :param source: the source of the value
+    :param keys: the chain of keys that will store the value
+    """
+    for key in keys[:-1]:
+        dic = dic.setdefault(key, {})
+        sources = _expand_sources(sources, key, dic)
+
+    key = keys[-1]
+    if isinstance(dic.get(key, None), dict) and isinstance(val, dict):
+        _tracked_merge(dic[key], _expand_sources(sources, key, dic[key]),
+                       val, source, dict_utils.ConflictResolver.greedy_resolver)
+    else:
+        dic[key] = val
+        sources[key] = [source] if source else []
+
+
+class LayeredVars(object):
+    """The vars dict built from the layers of the plugin input.
+
+    The layers (the arguments, the custom variables and every extra-vars
+    input) are kept as they are given and merged in their order once, when
+    the vars dict is requested, so the big trees loaded from the files are
+    walked only by that merge. Since the merge reuses the layers values, the
+    vars dict is materialized only once.
+
+    When the sources are tracked, the merge records the layer every value
+    comes from, so the value can be explained later.
+    """
+
+    # the layers kinds
+    INSERT = 'insert'
+    UPDATE = 'update'
+    MERGE = 'merge'
+
+    SOURCE_SPEC_DEFAULTS = 'spec defaults'
+    SOURCE_ANSWERS_FILE = 'answers file'
+    SOURCE_CLI = 'cli'
+
+    def __init__(self, track_sources=False):
+        """Initializes the empty vars.
+
+        :param track_sources: whether to record the sources of the values
+        """
+        self.track_sources = track_sources
+        # list of the (kind, data, source) tuples
+        self.layers = []
+        self._vars = None
+        self._sources = None
+
+    def _add_layer(self, kind, data, source=None):
+        if self._vars is not None:
+            raise exceptions.IRException(
+                "The layer can't be added to the materialized vars")
+        self.layers.append((kind, data, source))
+
+    def add_args(self, entry_point, nested_args, args_sources=None,
+                 delimiter='-'):
+        """Adds the nested arguments layer.
+
+        :param entry_point: All input will be nested under this key
+        :param nested_args: dict of the arguments names and values
+        :param args_sources: dict of the arguments sources (cli, answers
+            file or spec defaults)
+        :param delimiter: character to split keys by.
+        """
+        args_sources = args_sources or {}
+        items = [((entry_point,), {}, None)]
+        items.extend(((entry_point,) + tuple(name.split(delimiter)), value,
+                      args_sources.get(name, self.SOURCE_CLI))
+                     for name, value in nested_args.items())
+        self._add_layer(self.INSERT, items)
+
+    def add_vars(self, variables, args_sources=None):
+        """Adds the layer replacing the top level variables.
+
+        :param variables: dict of the variables (e.g. the custom ansible
+            variables of the arguments)
+        :param args_sources: dict of the variables sources
+        """
+        args_sources = args_sources or {}
+        self._add_layer(self.UPDATE, [
+            (name, value, args_sources.get(name, self.SOURCE_CLI))
+            for name, value in variables.items()])
+
+    def add_extra_vars(self, extra_vars=None):
+        """Adds the layers of the ``extra-vars``
+
+        :param extra_vars: List of extra-vars
+        :raise IRPrivateSettingsMissingException: the private settings
+            referenced by the extra-vars are not passed
+        """
+        with _private_settings_check():
+            for extra_var in extra_vars or []:
+                self._add_extra_var(extra_var)
+
+    def _add_extra_var(self, extra_var):
+        if extra_var.startswith('@'):
+            loaded_yml = yaml_io.load_file(extra_var[1:])
+            self._add_layer(self.MERGE, loaded_yml,
+                            "extra-vars file {}".format(extra_var[1:]))
+
+        else:
+            if '=' not in extra_var:
+                raise exceptions.IRExtraVarsException(extra_var)
+            key, value = extra_var.split("=", 1)
+            if value.startswith('@'):
+                loaded_yml = yaml_io.load_file(value[1:])
+
+                tmp_dict = {}
+                dict_utils.dict_insert(tmp_dict, loaded_yml,
+                                       *key.split("."))
+                self._add_layer(self.MERGE, tmp_dict,
+                                "extra-vars file {} ({})".format(
+                                    value[1:], key))
+
+            else:
+                self._add_layer(
+                    self.INSERT, [(tuple(key.split(".")), value,
+                                   "extra-vars {}".format(key))])
+
+    def materialize(self, vars_dict=None):
+        """Merges the layers into the vars dict.
+
+        :param vars_dict: the dict to merge the layers into, a new dict is
+            created if not set
+        :return: the vars dict
+        :raise IRPrivateSettingsMissingException: the private settings
+            referenced by the input are not passed
+        """
+        if self._vars is not None:
+            return self._vars
+
+        with _private_settings_check():
+            return self._materialize(vars_dict)
+
+    def _materialize(self, vars_dict=None):
+        vars_dict = {} if vars_dict is None else vars_dict
+        sources = {} if self.track_sources else None
+        resolver = dict_utils.ConflictResolver.unique_append_list_resolver
+        for kind, data, source in self.layers:
+            if kind == self.INSERT:
+                for keys, value, item_source in data:
+                    if sources is None:
+                        dict_utils.dict_insert(vars_dict, value, *keys)
+                    else:
+                        _tracked_insert(vars_dict, sources, value,
+                                        item_source, *keys)
+            elif kind == self.UPDATE:
+                for name, value, item_source in data:
+                    vars_dict[name] = value
+                    if sources is not None:
+                        sources[name] = [item_source]
+            elif sources is None:
+                dict_utils.dict_merge(vars_dict, data,
+                                      conflict_resolver=resolver)
+            else:
+                _tracked_merge(vars_dict, sources, data, source, resolver)
+
+        self._vars = vars_dict
+        self._sources = sources
+        return vars_dict
+
+    def explain(self, path):
+        """Gets the value of the variable and the layers it comes from.
+
+        :param path: the dot separated path of the variable
+        :return: (value, list of the sources) tuple, the sources of all the
+            nested values are listed for a dict value
+        :raise IRKeyNotFoundException: the variable isn't set
+        """
+        if not self.track_sources:
+            raise exceptions.IRException(
+                "The sources of the vars are not tracked")
+        value = self.materialize()
+        sources = self._sources
+        for key in path.split('.'):
+            if not isinstance(value, dict) or key not in value:
+                raise exceptions.IRKeyNotFoundException(path, "the vars dict")
+            value = value[key]
+            if isinstance(sources, dict):
+                sources = sources.get(key)
+        return value, _collect_sources(sources)
@@ -0,0 +1,155 @@
+"""The SSH connections warm-up of the playbook hosts.
+
+The SSH master connections to all the hosts targeted by the playbook are
+opened concurrently before the playbook starts. The ssh command of every
+host is built by the Ansible ssh connection plugin, so the inventory
+connection vars (``ansible_ssh_common_args`` with the jump hosts included)
+are honored and the ControlPersist sockets are left exactly where Ansible
+looks for them. The unreachable hosts are reported before the first play.
+"""
+import os
+import tempfile
+import time
+
+from multiprocessing.pool import ThreadPool
+
+from infrared.core.utils import logger
+
+LOG = logger.LOG
+
+# max number of the hosts connected at the same time
+DEFAULT_WORKERS = 50
+# seconds to wait for the connection to the host
+DEFAULT_TIMEOUT = 60
+# the command executed on the hosts
+WARMUP_COMMAND = 'true'
+
+
+def get_workers():
+    """Gets the number of the concurrent connections.
+
+    :return: the ``IR_SSH_WARMUP_WORKERS`` variable value or the default
+    """
+    return int(os.environ.get('IR_SSH_WARMUP_WORKERS', DEFAULT_WORKERS))
+
+
+def get_timeout():
+    """Gets the connection timeout.
+
+    :return: the ``IR_SSH_WARMUP_TIMEOUT`` variable value or the default
+    """
+    return int(os.environ.get('IR_SSH_WARMUP_TIMEOUT', DEFAULT_TIMEOUT))
+
+
+def get_ssh_command(host, variables, loader, play_context):
+    """Gets the command opening the SSH connection to the host.
+
+    :param host: the Ansible Host object
+    :param variables: dict, the host vars
+    :param loader: the Ansible DataLoader object
+    :param play_context: the PlayContext object with the cli options
+    :return: the command args list, None if the host isn't connected with
+        the ssh plugin or needs a password
+    """
+    from ansible.playbook.task import Task
+    from ansible.plugins.loader import connection_loader
+    from ansible.template import Templar
+
+    templar = Templar(loader=loader, variables=variables)
+    host_context = play_context.set_task_and_variable_override(
+        task=Task(), variables=variables, templar=templar)
+    host_context.post_validate(templar=templar)
+    if not host_context.remote_addr:
+        host_context.remote_addr = host.address
+
+    if host_context.connection != 'ssh':
+        LOG.debug("SSH warm-up: skipping '{}' host with '{}' "
+                  "connection".format(host.name, host_context.connection))
+        return None
+    if host_context.password:
+        LOG.debug("SSH warm-up: skipping '{}' host with the password "
+                  "authentication".format(host.name))
+        return None
+
+    connection = connection_loader.get('ssh', host_context, os.devnull)
+    # BatchMode makes ssh fail instead of asking for a host key confirmation
+    return [arg.decode('utf-8') for arg in connection._build_command(
+        host_context.ssh_executable, '-o', 'BatchMode=yes',
+        host_context.remote_addr, WARMUP_COMMAND)]
+
+
+def _connect(command, timeout):
+    """Runs the ssh command.
+
+    The master connection started by the command is left in the background
+    (ControlPersist) and keeps the command output open, so the output goes
+    to the temporary file instead of a pipe.
+
+    :return: the error message, None if connected
+    """
+    import subprocess
+
+    with open(os.devnull) as devnull, tempfile.TemporaryFile() as output:
+        try:
+            process = subprocess.Popen(command, stdin=devnull,
+                                       stdout=output, stderr=output)
+        except OSError as ex:
+            return str(ex)
+
+        deadline = time.time() + timeout
+        while process.poll() is None:
+            if time.time() > deadline:
+                process.kill()
+                process.wait()
+                return "Timed out after {} seconds".format(timeout)
+            time.sleep(0.05)
+
+        if not process.returncode:
+            return None
+        output.seek(0)
+        message = output.read().decode('utf-8', 'replace').strip()
+        return message or "ssh exited with code {}".format(
+            process.returncode)
+
+
+def warm_up(hosts, variable_manager, loader, play_context, workers=None,
+            timeout=None):
+    """Opens the SSH connections to the hosts concurrently.
+
+    :param hosts: list of the Ansible Host objects
+    :param variable_manager: the Ansible VariableManager object
+    :param loader: the Ansible DataLoader object
+    :param play_context: the PlayContext object with the cli options
+    :param workers: max number of the concurrent connections
+    :param timeout: seconds to wait for the connection to every host
+    :return: dict of the unreachable hosts names and the errors
+    """
+    workers = workers or get_workers()
+    timeout = timeout or get_timeout()
+
+    commands = {}
+    for host in hosts:
+        command = get_ssh_command(
+            host, variable_manager.get_vars(host=host), loader, play_context)
+        if command is not None:
+            commands[host.name] = command
+    if not commands:
+        return {}
+
+    LOG.info("SSH warm-up: connecting to {} hosts".format(len(commands)))
+    started = time.time()
+    pool = ThreadPool(min(workers, len(commands)))
+    try:
+        names = sorted(commands)
+        errors = pool.map(
+            lambda name: _connect(commands[name], timeout), names)
+    finally:
+        pool.close()
+        pool.join()
+
+    unreachable = dict((name, error)
+                       for name, error in zip(names, errors) if error)
+    LOG.info("SSH warm-up: {} of {} hosts connected in {:.2f}s".format(
+        len(commands) - len(unreachable), len(commands),
+        time.time() - started))
+    return unreachable
@@ -32,6 +32,74 @@ def dict_insert(dic, val, key, *keys):
     dict_insert(dic.setdefault(key, {}), val, *keys)
 
 
+# tags of the unhashable values converted to the hashable keys
+_LIST_KEY = object()
+_TUPLE_KEY = object()
+_DICT_KEY = object()
+
+
+def _hashable_key(value):
+    """Converts the value to the hashable key.
+
+    The keys of two values are equal only when the values are equal, so the
+    keys can replace the values in the sets.
+
+    :param value: the value to convert
+    :return: the value itself if it's hashable, its hashable form otherwise
+    :raise TypeError: when the value can't be converted (the subclasses of
+        the builtin containers may compare differently, so they aren't)
+    """
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        pass
+    value_type = type(value)
+    if value_type is list:
+        return _LIST_KEY, tuple(_hashable_key(item) for item in value)
+    if value_type is tuple:
+        return _TUPLE_KEY, tuple(_hashable_key(item) for item in value)
+    if value_type is dict:
+        return _DICT_KEY, frozenset(
+            (key, _hashable_key(item)) for key, item in value.items())
+    if value_type is set:
+        return frozenset(value)
+    raise TypeError("unhashable type: '{}'".format(value_type.__name__))
+
+
+def unique_extend(first, second):
+    """Appends the items of second list missing in first list.
+
+    The items are looked up by their hashable keys, so the lists are merged
+    in linear time. The items which can't be converted to the keys are
+    compared one by one.
+
+    :param first: the list to extend
+    :param second: the list with the items to append
+    """
+    keys = None
+    # the items without the keys
+    others = []
+    for item in second:
+        if keys is None:
+            keys = set()
+            for first_item in first:
+                try:
+                    keys.add(_hashable_key(first_item))
+                except TypeError:
+                    others.append(first_item)
+        try:
+            key = _hashable_key(item)
+        except TypeError:
+            if item not in first:
+                first.append(item)
+                others.append(item)
+            continue
+        if key not in keys and item not in others:
+            keys.add(key)
+            first.append(item)
+
+
 class ConflictResolver(object):
     """Resolves conflicts while merging dicts. """
 
@@ -61,9 +129,7 @@ class ConflictResolver(object):
     def unique_append_list_resolver(first, second, key):
         """Merges first and second lists """
         if isinstance(first[key], list) and isinstance(second[key], list):
-            for item in second[key]:
-                if item not in first[key]:
-                    first[key].append(item)
+            unique_extend(first[key], second[key])
         else:
             return ConflictResolver.greedy_resolver(first, second, key)
 
@@ -72,22 +138,32 @@ def dict_merge(first, second,
                conflict_resolver=ConflictResolver.greedy_resolver):
     """Merge `second` dict into `first`.
 
+    The nested dicts are merged iteratively (in the same order a recursive
+    merge would do it), so the merge depth isn't limited by the recursion.
+
     :param first: Modified dict
     :param second: Modifier dict
     :param conflict_resolver: Function that resolves a merge between 2 values
         when one of them isn't a dict
     """
-    for key in second:
-        if key in first:
-            if isinstance(first[key], dict) and isinstance(second[key], dict):
-                dict_merge(first[key], second[key],
-                           conflict_resolver=conflict_resolver)
-            else:
+    stack = [(first, second, iter(second))]
+    while stack:
+        first, second, keys = stack[-1]
+        for key in keys:
+            if key in first:
+                if isinstance(first[key], dict) and \
+                        isinstance(second[key], dict):
+                    stack.append((first[key], second[key],
+                                  iter(second[key])))
+                    break
                 # replace first value with the value from second
                 conflict_resolver(first, second, key)
+            else:
+                try:
+                    first[key] = second[key]
+                except TypeError as e:
+                    LOG.error("dict_merge(%s, %s) failed on: %s" % (
+                        first, second, key))
+                    raise e
         else:
-            try:
-                first[key] = second[key]
-            except TypeError as e:
-                LOG.error("dict_merge(%s, %s) failed on: %s" % (first, second, key))
-                raise e
+            stack.pop()
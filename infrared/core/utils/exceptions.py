@@ -84,6 +84,15 @@ class IRInvalidMinMaxRangeException(IRException):
         super(self.__class__, self).__init__(message)
 
 
+class IRArgsValidationException(IRException):
+    def __init__(self, errors):
+        self.errors = errors
+        message = "The arguments are not valid:"
+        for error in errors:
+            message += "\n" + error.message
+        super(self.__class__, self).__init__(message)
+
+
 class SpecParserException(Exception):
     """The spec parser specific exception.  """
     def __init__(self, message, errors):
@@ -251,3 +260,18 @@ class IRAnswersFileEnvVarNotDefined(IRException):
     def __init__(self, env_var):
         message = "Environment variable {} not defined".format(env_var)
         super(self.__class__, self).__init__(message)
+
+
+class IRDaemonException(IRException):
+    def __init__(self, reason_str):
+        super(self.__class__, self).__init__(reason_str)
+
+
+class IRPipelineException(IRException):
+    def __init__(self, reason_str):
+        super(self.__class__, self).__init__(reason_str)
+
+
+class IRCheckpointException(IRException):
+    def __init__(self, reason_str):
+        super(self.__class__, self).__init__(reason_str)
@@ -0,0 +1,144 @@
+"""Named phase timers to find out where the time of infrared run is spent.
+
+Profiling is enabled with the ``--profile`` infrared option or with the
+``IR_PROFILE`` environment variable. When the ``IR_PROFILE_PSTATS`` variable
+points to a file, the whole run is also profiled with ``cProfile`` and the
+collected statistics are dumped into it (to be loaded with ``pstats``).
+"""
+from __future__ import print_function
+
+import contextlib
+import datetime
+import errno
+import json
+import os
+import sys
+import time
+
+from infrared.core.utils import logger
+
+LOG = logger.LOG
+
+PROFILES_DIR = 'profiles'
+
+
+class Profiler(object):
+    """Records the duration of the named (and possibly nested) phases. """
+
+    def __init__(self):
+        self.enabled = False
+        self.phases = []
+        self.started = None
+        self.pstats_file = None
+        self._depth = 0
+        self._cprofile = None
+
+    def enable(self, pstats_file=None):
+        """Starts the profiling.
+
+        :param pstats_file: path to the file to dump the cProfile statistics
+            into, cProfile is not used if not specified.
+        """
+        self.enabled = True
+        self.phases = []
+        self.started = time.time()
+        self.pstats_file = pstats_file
+        if pstats_file:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Measures the time spent in the managed block.
+
+        :param name: the phase name
+        """
+        if not self.enabled:
+            yield
+            return
+
+        record = dict(name=name, depth=self._depth,
+                      start=time.time() - self.started, duration=None)
+        self.phases.append(record)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            record['duration'] = \
+                time.time() - self.started - record['start']
+
+    def get_table(self):
+        """Gets the phases table, nested phases are indented. """
+        from infrared.core.utils.print_formats import fancy_table
+
+        total = time.time() - self.started
+        rows = [("  " * record['depth'] + record['name'],
+                 "{:.3f}".format(record['start']),
+                 "{:.3f}".format(record['duration'] or 0))
+                for record in self.phases]
+        rows.append(("Total", "", "{:.3f}".format(total)))
+        return fancy_table(("Phase", "Start (s)", "Duration (s)"), *rows)
+
+    def dump(self, file_path):
+        """Writes the recorded phases into a JSON file.
+
+        :param file_path: path to the JSON file
+        """
+        data = dict(
+            started=datetime.datetime.utcfromtimestamp(
+                self.started).isoformat(),
+            total=time.time() - self.started,
+            argv=sys.argv,
+            phases=self.phases)
+        with open(file_path, 'w') as fp:
+            json.dump(data, fp, indent=4)
+
+    def finish(self, workspace=None, command=None):
+        """Stops the profiling and reports the results.
+
+        The phases table is printed to stderr, so it doesn't mess the command
+        output (vars dict, for example).
+
+        :param workspace: Workspace object to store the JSON report in
+        :param command: name of the invoked command used in the report name
+        """
+        if not self.enabled:
+            return
+
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.pstats_file)
+            self._cprofile = None
+            LOG.info("cProfile stats saved: {}".format(self.pstats_file))
+
+        print(self.get_table(), file=sys.stderr)
+
+        if workspace is not None:
+            profiles_dir = os.path.join(workspace.path, PROFILES_DIR)
+            try:
+                os.makedirs(profiles_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            filename = "ir_{timestamp}_{command}.json".format(
+                timestamp=datetime.datetime.utcnow().strftime(
+                    "%Y-%m-%d_%H-%M-%S.%f"),
+                command=command or 'infrared')
+            file_path = os.path.join(profiles_dir, filename)
+            self.dump(file_path)
+            LOG.info("Profile saved: {}".format(file_path))
+
+        self.enabled = False
+
+
+PROFILER = Profiler()
+
+
+def phase(name):
+    """Measures the time of the named phase with the global profiler.
+
+    :param name: the phase name
+    """
+    return PROFILER.phase(name)
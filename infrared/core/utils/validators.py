@@ -1,10 +1,9 @@
-import jsonschema
 import os
 from six.moves import configparser
-import yaml
 
 from infrared.core.utils.exceptions import IRValidatorException
 from infrared.core.utils.logger import LOG as logger
+from infrared.core.utils import yaml_io
 
 
 class Validator(object):
@@ -102,11 +101,13 @@ class SpecValidator(Validator):
         is missing in spec file
         :return: Dictionary with data loaded from a spec (YAML) file
         """
+        import jsonschema
+
         if spec_content is None:
             raise IRValidatorException(
                 "Plugin spec content is missing")
 
-        spec_dict = yaml.safe_load(spec_content)
+        spec_dict = yaml_io.load(spec_content)
 
         if not isinstance(spec_dict, dict):
             raise IRValidatorException(
@@ -164,11 +165,13 @@ class RegistryValidator(Validator):
         :raise IRValidatorException: when mandatory data is missing in Registry
         :return: Dictionary with data loaded from a Registry YAML file
         """
+        import jsonschema
+
         if file_content is None:
             raise IRValidatorException(
                 "Registry YAML content is missing")
 
-        registry_dict = yaml.safe_load(file_content)
+        registry_dict = yaml_io.load(file_content)
 
         if not isinstance(registry_dict, dict):
             raise IRValidatorException(
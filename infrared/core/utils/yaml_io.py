@@ -0,0 +1,101 @@
+"""The YAML loading and dumping used by the core.
+
+The LibYAML based ``CSafeLoader`` & ``CSafeDumper`` are used when PyYAML is
+built with LibYAML, the pure Python ones otherwise (or when the
+``IR_YAML_LIBYAML`` environment variable is set to 'false'). Both load the
+same data and dump the same YAML documents, the only differences of the
+dumped text are the line breaks of the long escaped (double quoted)
+strings.
+
+The files loaded by ``load_file`` are cached for the process lifetime (the
+daemon runs several commands), the cached file is loaded again only when
+its modification time or size is changed.
+"""
+import os
+import pickle
+
+import yaml
+
+from infrared.core.utils import logger
+
+LOG = logger.LOG
+
+# the (mtime, size) of the loaded files and the pickled content, the content
+# is unpickled for every caller, so the callers can modify it
+_FILES_CACHE = {}
+
+
+def _use_libyaml():
+    """Checks whether the LibYAML loader & dumper should be used. """
+    from distutils.util import strtobool
+
+    return hasattr(yaml, 'CSafeLoader') and \
+        strtobool(os.environ.get('IR_YAML_LIBYAML', 'yes'))
+
+
+def get_loader():
+    """Gets the safe loader class. """
+    return yaml.CSafeLoader if _use_libyaml() else yaml.SafeLoader
+
+
+def get_dumper(data=None):
+    """Gets the safe dumper class.
+
+    :param data: the data to dump, the LibYAML dumper ends the documents of
+        the plain scalars differently, so they are dumped by the pure Python
+        dumper.
+    """
+    if _use_libyaml() and isinstance(data, (dict, list)):
+        return yaml.CSafeDumper
+    return yaml.SafeDumper
+
+
+def load(stream):
+    """Loads the YAML document (the same as ``yaml.safe_load``)
+
+    :param stream: the YAML string or the file object
+    :return: the loaded data
+    """
+    return yaml.load(stream, Loader=get_loader())
+
+
+def dump(data, stream=None, **kwargs):
+    """Dumps the data (the same as ``yaml.safe_dump``)
+
+    :param data: the data to dump
+    :param stream: the file object to write into, the YAML string is
+        returned if not set
+    :param kwargs: the ``yaml.dump`` options, e.g. ``default_flow_style``
+    """
+    return yaml.dump(data, stream, Dumper=get_dumper(data), **kwargs)
+
+
+def load_file(path):
+    """Loads the YAML file.
+
+    The file content is cached while the file isn't changed.
+
+    :param path: path to the YAML file
+    :return: the loaded data, the callers get their own copy
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    file_stamp = (getattr(stat, 'st_mtime_ns', stat.st_mtime), stat.st_size)
+
+    cached = _FILES_CACHE.get(path)
+    if cached is not None and cached[0] == file_stamp:
+        return pickle.loads(cached[1])
+
+    with open(path) as stream:
+        data = load(stream)
+    try:
+        _FILES_CACHE[path] = (
+            file_stamp, pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    except (pickle.PicklingError, TypeError):
+        LOG.debug("YAML file can't be cached: {}".format(path))
+    return data
+
+
+def clear_cache():
+    """Drops the loaded files cache. """
+    _FILES_CACHE.clear()
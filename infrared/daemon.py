@@ -0,0 +1,539 @@
+"""Resident infrared daemon and the thin client for it.
+
+The daemon keeps the infrared modules, core services, plugins and ansible
+modules loaded and listens on a unix socket in the infrared home directory.
+The client passes its command line, environment, working directory and
+standard streams (the file descriptors themselves) to the daemon, which runs
+the command in a forked worker process. The worker writes directly to the
+client's streams and sends the exit code back.
+
+Only the standard library is imported on the module level, so the client
+stays cheap when the daemon isn't running and the command is executed
+in-process.
+"""
+from __future__ import print_function
+
+import array
+import errno
+import importlib
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import time
+
+SOCKET_NAME = '.daemon.sock'
+LOG_FILE_NAME = 'daemon.log'
+# stdin, stdout & stderr of the client
+STREAMS_FDS = (0, 1, 2)
+# the commands which are always executed in-process
+NO_FORWARD_COMMANDS = ('daemon', 'ssh')
+# heavy modules imported by the daemon in advance
+PRELOAD_MODULES = (
+    'ansible.cli.playbook',
+    'ansible.inventory.manager',
+    'ansible.parsing.dataloader',
+)
+START_TIMEOUT = 60
+ACCEPT_TIMEOUT = 1.0
+REQUEST_TIMEOUT = 10.0
+
+
+def get_infrared_home():
+    """Gets infrared home directory (the same way CoreSettings does). """
+    return os.path.abspath(os.environ.get(
+        "IR_HOME", os.path.join(os.path.expanduser("~"), '.infrared')))
+
+
+def get_socket_path():
+    """Gets the path of the daemon socket. """
+    return os.path.join(get_infrared_home(), SOCKET_NAME)
+
+
+def is_supported():
+    """Checks whether file descriptors can be passed over unix sockets. """
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket.socket, 'sendmsg')
+
+
+def _is_true(value):
+    return value.lower() in ('y', 'yes', 't', 'true', 'on', '1')
+
+
+def _send_message(sock, message):
+    sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+
+def _read_message(reader):
+    """Reads a single message.
+
+    :return: message dict, None when connection is closed
+    """
+    line = reader.readline()
+    if not line:
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+def _send_request(sock, request, fds=()):
+    """Sends request with the file descriptors attached to it. """
+    ancdata = []
+    if fds:
+        ancdata.append((socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                        array.array('i', fds)))
+    sock.sendmsg([b'\0'], ancdata)
+    _send_message(sock, request)
+
+
+def _recv_request(sock):
+    """Receives request and the file descriptors attached to it.
+
+    :return: tuple of request dict, list of file descriptors and the
+        reader to read the following messages with
+    """
+    fds = array.array('i')
+    _, ancdata, _, _ = sock.recvmsg(
+        1, socket.CMSG_SPACE(len(STREAMS_FDS) * fds.itemsize))
+    for level, msg_type, data in ancdata:
+        if level == socket.SOL_SOCKET and msg_type == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    reader = sock.makefile('rb')
+    return _read_message(reader), list(fds), reader
+
+
+class DaemonClient(object):
+    """Forwards infrared commands to the daemon. """
+
+    def __init__(self, socket_path=None):
+        """Constructor.
+
+        :param socket_path: the daemon socket, by default the socket in
+            the infrared home directory
+        """
+        self.socket_path = socket_path or get_socket_path()
+
+    def _connect(self):
+        """Connects to the daemon.
+
+        :return: the connected socket, None if the daemon isn't running
+        """
+        if not is_supported() or not os.path.exists(self.socket_path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except socket.error:
+            sock.close()
+            return None
+        return sock
+
+    def _request(self, command):
+        """Sends a control command to the daemon.
+
+        :return: the daemon response dict, None if the daemon isn't running
+        """
+        sock = self._connect()
+        if sock is None:
+            return None
+        try:
+            _send_request(sock, dict(command=command))
+            return _read_message(sock.makefile('rb'))
+        except (socket.error, ValueError):
+            return None
+        finally:
+            sock.close()
+
+    def status(self):
+        """Gets the daemon status.
+
+        :return: dict with the daemon details, None if it isn't running
+        """
+        return self._request('status')
+
+    def stop(self):
+        """Stops the daemon.
+
+        :return: dict with the daemon details, None if it isn't running
+        """
+        return self._request('stop')
+
+    def run(self, args):
+        """Runs the infrared command in the daemon.
+
+        :param args: the list of infrared cli arguments
+        :return: the command exit code, None if the daemon can't run it and
+            it should be executed in-process
+        """
+        sock = self._connect()
+        if sock is None:
+            return None
+
+        worker_pid = None
+        try:
+            _send_request(
+                sock,
+                dict(command='run',
+                     prog=sys.argv[0],
+                     argv=list(args),
+                     env=dict(os.environ),
+                     cwd=os.getcwd()),
+                fds=STREAMS_FDS)
+            reader = sock.makefile('rb')
+            while True:
+                try:
+                    response = _read_message(reader)
+                except KeyboardInterrupt:
+                    # let the worker handle the interruption
+                    if worker_pid is not None:
+                        os.kill(worker_pid, signal.SIGINT)
+                    continue
+                if response is None:
+                    break
+                if 'pid' in response:
+                    worker_pid = response['pid']
+                elif 'fallback' in response:
+                    return None
+                elif 'rc' in response:
+                    return response['rc']
+        except (OSError, socket.error, ValueError):
+            if worker_pid is None:
+                return None
+        finally:
+            sock.close()
+
+        if worker_pid is None:
+            # the command wasn't started, so it's safe to run it in-process
+            return None
+        print("infrared daemon closed the connection unexpectedly",
+              file=sys.stderr)
+        return 1
+
+
+class InfraredDaemon(object):
+    """Keeps infrared loaded and runs the forwarded commands. """
+
+    def __init__(self, socket_path=None):
+        """Constructor.
+
+        :param socket_path: the socket to listen on, by default the socket in
+            the infrared home directory
+        """
+        self.socket_path = socket_path or get_socket_path()
+        self.started = None
+        self._server = None
+        self._stopped = False
+        self._workers = set()
+        self._stamp = None
+        self._environ = None
+
+    @staticmethod
+    def _get_environ():
+        """Gets the environment which affects the loaded ansible modules. """
+        return dict((key, value) for key, value in os.environ.items()
+                    if key.startswith('ANSIBLE_'))
+
+    @staticmethod
+    def _get_plugins_stamp():
+        """Gets the modification times of plugins config and specs. """
+        from infrared.core.services import CoreServices
+
+        plugins_manager = CoreServices.plugins_manager()
+        files = [plugins_manager.config_file] + [
+            plugin.spec for plugin in plugins_manager.PLUGINS_DICT.values()]
+
+        stamp = []
+        for file_path in files:
+            try:
+                stamp.append((file_path, os.stat(file_path).st_mtime))
+            except OSError:
+                stamp.append((file_path, None))
+        return stamp
+
+    def load_plugins(self):
+        """Loads the installed plugins and their specs.
+
+        The loaded specs are kept in memory by the spec cache, so the forked
+        workers inherit them.
+        """
+        from infrared import api
+        from infrared.core.services import CoreServices
+        from infrared.core.services import ServiceName
+
+        CoreServices.spec_cache_manager().keep_resident()
+        CoreServices.reset(ServiceName.PLUGINS_MANAGER)
+        for plugin in CoreServices.plugins_manager().PLUGINS_DICT.values():
+            api.InfraredPluginsSpec(plugin).load_spec_dict()
+        self._stamp = self._get_plugins_stamp()
+
+    def preload(self):
+        """Imports heavy modules and loads plugins. """
+        from infrared.core.utils import logger
+
+        for module in PRELOAD_MODULES:
+            try:
+                importlib.import_module(module)
+            except ImportError as ex:
+                logger.LOG.debug("Unable to preload '{}': {}".format(
+                    module, ex))
+        self.load_plugins()
+        self._environ = self._get_environ()
+
+    def start(self, foreground=False):
+        """Starts the daemon.
+
+        :param foreground: whether to serve in the current process, otherwise
+            the daemon is started in background.
+        :return: the daemon pid
+        """
+        from infrared.core.utils import exceptions
+
+        if not is_supported():
+            raise exceptions.IRDaemonException(
+                "Daemon is not supported on this platform")
+        if DaemonClient(self.socket_path).status() is not None:
+            raise exceptions.IRDaemonException(
+                "Daemon is already running ({})".format(self.socket_path))
+
+        if foreground:
+            self.serve()
+            return os.getpid()
+
+        log_file = os.path.join(os.path.dirname(self.socket_path),
+                                LOG_FILE_NAME)
+        pid = os.fork()
+        if pid == 0:
+            # detach from the terminal
+            os.setsid()
+            with open(os.devnull, 'rb') as devnull:
+                os.dup2(devnull.fileno(), 0)
+            with open(log_file, 'ab') as log:
+                os.dup2(log.fileno(), 1)
+                os.dup2(log.fileno(), 2)
+            try:
+                self.serve()
+            except Exception:
+                sys.excepthook(*sys.exc_info())
+            finally:
+                os._exit(0)
+
+        deadline = time.time() + START_TIMEOUT
+        while time.time() < deadline:
+            if DaemonClient(self.socket_path).status() is not None:
+                return pid
+            if os.waitpid(pid, os.WNOHANG)[0]:
+                break
+            time.sleep(0.1)
+        raise exceptions.IRDaemonException(
+            "Failed to start daemon, check the log: {}".format(log_file))
+
+    def serve(self):
+        """Runs the daemon loop until it's stopped. """
+        from infrared.core.utils import logger
+
+        if os.path.exists(self.socket_path):
+            # left by a daemon which wasn't stopped properly
+            os.remove(self.socket_path)
+
+        self.preload()
+
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            self._server.bind(self.socket_path)
+        finally:
+            os.umask(old_umask)
+        self._server.listen(16)
+        self._server.settimeout(ACCEPT_TIMEOUT)
+        self.started = time.time()
+
+        def _stop(signum, frame):
+            self._stopped = True
+        signal.signal(signal.SIGTERM, _stop)
+
+        logger.LOG.warning("Daemon {} is listening on {}".format(
+            os.getpid(), self.socket_path))
+        try:
+            while not self._stopped:
+                self._reap_workers()
+                try:
+                    conn, _ = self._server.accept()
+                except socket.timeout:
+                    continue
+                except socket.error as ex:
+                    if ex.errno == errno.EINTR:
+                        continue
+                    raise
+                try:
+                    self._handle_connection(conn)
+                except Exception as ex:
+                    logger.LOG.error("Failed to handle request: {}".format(
+                        ex))
+                finally:
+                    conn.close()
+        finally:
+            self._server.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            logger.LOG.warning("Daemon {} stopped".format(os.getpid()))
+
+    def _reap_workers(self):
+        for pid in list(self._workers):
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    self._workers.discard(pid)
+            except OSError:
+                self._workers.discard(pid)
+
+    @staticmethod
+    def _is_same_user(conn):
+        """Checks the client is run by the daemon user (where supported). """
+        if not hasattr(socket, 'SO_PEERCRED'):
+            return True
+        creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', creds)
+        return uid == os.getuid()
+
+    def _handle_connection(self, conn):
+        from infrared.core.services import CoreServices
+        from infrared.core.utils import logger
+
+        if not self._is_same_user(conn):
+            logger.LOG.warning("Rejected request from another user")
+            return
+
+        conn.settimeout(REQUEST_TIMEOUT)
+        request, fds, reader = _recv_request(conn)
+        try:
+            command = (request or {}).get('command')
+            if command in ('status', 'stop'):
+                _send_message(conn, dict(
+                    pid=os.getpid(),
+                    started=self.started,
+                    workers=len(self._workers),
+                    plugins=list(
+                        CoreServices.plugins_manager().PLUGINS_DICT)))
+                self._stopped = command == 'stop'
+            elif command == 'run':
+                if self._get_plugins_stamp() != self._stamp:
+                    logger.LOG.warning("Plugins have changed, reloading")
+                    self.load_plugins()
+                pid = os.fork()
+                if pid == 0:
+                    self._run_worker(conn, request, fds)
+                self._workers.add(pid)
+        finally:
+            reader.close()
+            for fd in fds:
+                os.close(fd)
+
+    def _run_worker(self, conn, request, fds):
+        """Runs the forwarded command in the forked worker process. """
+        rc = 1
+        try:
+            self._server.close()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            conn.settimeout(None)
+
+            for target_fd, fd in zip(STREAMS_FDS, fds):
+                os.dup2(fd, target_fd)
+            for stream in (sys.stdout, sys.stderr):
+                if hasattr(stream, 'reconfigure'):
+                    stream.reconfigure(
+                        line_buffering=stream is sys.stderr or
+                        stream.isatty())
+
+            if not self._prepare_environ(request):
+                _send_message(conn, dict(fallback="environment mismatch"))
+                return
+
+            _send_message(conn, dict(pid=os.getpid()))
+            rc = self._run_command(request['argv'])
+        except Exception:
+            sys.excepthook(*sys.exc_info())
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                _send_message(conn, dict(rc=rc))
+            finally:
+                os._exit(0)
+
+    def _prepare_environ(self, request):
+        """Applies the client environment to the worker process.
+
+        :return: False when the client environment is incompatible with the
+            ansible modules loaded by the daemon, True otherwise
+        """
+        import logging
+
+        from infrared import main as ir_main
+        from infrared.core.services import CoreServices
+        from infrared.core.services import ServiceName
+        from infrared.core.utils import logger
+
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = [request['prog']] + request['argv']
+
+        # repeat what infrared does on start with the client environment
+        ir_main.inject_common_paths()
+        CoreServices.reset(ServiceName.ANSIBLE_CONFIG_MANAGER)
+        CoreServices.ansible_config_manager().inject_config()
+        logger.LOG.setLevel(
+            logging.DEBUG if os.environ.get('IR_DEBUG') else logging.WARN)
+
+        return self._get_environ() == self._environ
+
+    @staticmethod
+    def _run_command(args):
+        """Runs infrared command.
+
+        :return: the command exit code
+        """
+        from infrared.main import main as ir_main
+
+        try:
+            return int(ir_main(args) or 0)
+        except SystemExit as ex:
+            if ex.code is None or isinstance(ex.code, int):
+                return ex.code or 0
+            print(ex.code, file=sys.stderr)
+            return 1
+        except KeyboardInterrupt:
+            return 130
+        except Exception:
+            sys.excepthook(*sys.exc_info())
+            return 1
+
+
+def _should_forward(args):
+    """Checks whether the command can be forwarded to the daemon. """
+    if not is_supported() or os.environ.get('_ARGCOMPLETE'):
+        return False
+    if _is_true(os.environ.get('IR_NO_DAEMON', 'no')):
+        return False
+    for arg in args:
+        if not arg.startswith('-'):
+            return arg not in NO_FORWARD_COMMANDS
+    return True
+
+
+def main(args=None):
+    """The infrared entry point.
+
+    Runs the command in the infrared daemon when it is running, in-process
+    otherwise.
+
+    :param args: the list of cli arguments, sys.argv[1:] if None
+    """
+    cli_args = sys.argv[1:] if args is None else args
+    if _should_forward(cli_args):
+        rc = DaemonClient().run(cli_args)
+        if rc is not None:
+            return rc
+
+    from infrared.main import main as ir_main
+    return ir_main(args)
@@ -1,11 +1,12 @@
 from __future__ import print_function
 
 import argcomplete
+import argparse
+import datetime
 import json
 import os
-from pbr import version
-import pkg_resources as pkg
 import sys
+import time
 
 
 def inject_common_paths():
@@ -19,10 +20,10 @@ def inject_common_paths():
             full_conf_path = additional_conf_path
         os.environ[envvar] = full_conf_path
 
-    version_info = version.VersionInfo('infrared')
-
-    common_path = pkg.resource_filename(version_info.package,
-                                        'common')
+    # resolve the path relatively to the package instead of using
+    # pkg_resources, which is very slow to import
+    common_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'common')
     override_conf_path(common_path, 'ANSIBLE_ROLES_PATH', 'roles')
     override_conf_path(common_path, 'ANSIBLE_FILTER_PLUGINS', 'filter_plugins')
     override_conf_path(common_path, 'ANSIBLE_CALLBACK_PLUGINS',
@@ -38,23 +39,68 @@ def inject_common_paths():
 inject_common_paths()
 
 from infrared import api  # noqa
+from infrared import daemon  # noqa
+from infrared import pipeline  # noqa
+from infrared import validation  # noqa
 import infrared.bash_completers as completers  # noqa
 from infrared.core.services import CoreServices  # noqa
 from infrared.core.services.plugins import PLUGINS_REGISTRY  # noqa
 from infrared.core.utils import exceptions  # noqa
 from infrared.core.utils import interactive_ssh  # noqa
 from infrared.core.utils import logger  # noqa
+from infrared.core.utils import profiler  # noqa
 from infrared.core.utils.print_formats import fancy_table  # noqa
 
 LOG = logger.LOG
 
 
+def _history_time(value):
+    """Converts the 'workspace history' time argument to timestamp. """
+    from infrared.core.history import parse_time
+
+    try:
+        return parse_time(value)
+    except ValueError as ex:
+        raise argparse.ArgumentTypeError(str(ex))
+
+
+def _format_time(timestamp):
+    """Formats the timestamp of the 'workspace list --details' output. """
+    if timestamp is None:
+        return ''
+    return datetime.datetime.fromtimestamp(timestamp).strftime(
+        "%Y-%m-%d %H:%M:%S")
+
+
+def _print_progress(done, total):
+    """Prints the archived bytes of the 'workspace export' command. """
+    sys.stderr.write("\rExporting: {}% ({} of {}){}".format(
+        done * 100 // total if total else 100, _format_size(done),
+        _format_size(total), "\n" if done >= total else ""))
+    sys.stderr.flush()
+
+
+def _format_size(size):
+    """Formats the size in bytes as the human readable size. """
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            break
+        size /= 1024.0
+    else:
+        unit = 'TiB'
+    return "{:.1f} {}".format(size, unit) if unit != 'B' else \
+        "{} B".format(size)
+
+
 class WorkspaceManagerSpec(api.SpecObject):
     """The workspace manager CLI. """
 
     def __init__(self, name, *args, **kwargs):
         super(WorkspaceManagerSpec, self).__init__(name, **kwargs)
-        self.workspace_manager = CoreServices.workspace_manager()
+
+    @property
+    def workspace_manager(self):
+        return CoreServices.workspace_manager()
 
     def extend_cli(self, root_subparsers):
         workspace_plugin = root_subparsers.add_parser(
@@ -94,6 +140,10 @@ class WorkspaceManagerSpec(api.SpecObject):
         wrkspc_list_parser.add_argument(
             "--active", action='store_true', dest='print_active',
             help="Prints the active workspace only")
+        wrkspc_list_parser.add_argument(
+            "--details", action='store_true',
+            help="Prints the workspaces creation & last usage time and size "
+                 "(kept in the workspaces index)")
 
         # delete
         delete_parser = workspace_subparsers.add_parser(
@@ -117,6 +167,11 @@ class WorkspaceManagerSpec(api.SpecObject):
             "-n", "--name", dest="workspacename",
             help="Workspace name to import with. "
             "If not specified - file name will be used.")
+        importer_parser.add_argument(
+            "--sha256",
+            help="The expected sha256 checksum of the archive. The archive is "
+                 "verified while it is imported, the workspace is removed "
+                 "if the checksum doesn't match.")
 
         # export settings
         exporter_parser = workspace_subparsers.add_parser(
@@ -132,6 +187,24 @@ class WorkspaceManagerSpec(api.SpecObject):
                                      action="store_true",
                                      help="Silently copy ssh keys "
                                      "to workspace.")
+        exporter_parser.add_argument(
+            "-e", "--exclude", dest="excludes", action='append',
+            help="Glob pattern of the files to skip, can be used several "
+                 "times. The patterns ending with '/' match the directories "
+                 "(e.g. 'ansible_outputs/'), the patterns without '/' match "
+                 "the files names (e.g. '*.qcow2'), the rest match the paths "
+                 "relative to the workspace")
+        exporter_parser.add_argument(
+            "-c", "--compression", choices=['gz', 'zst', 'none'],
+            default='gz',
+            help="The archive compression, 'zst' requires the 'zstd' command")
+        exporter_parser.add_argument(
+            "--level", type=int,
+            help="The compression level (6 for gz and 3 for zst by default)")
+        exporter_parser.add_argument(
+            "--threads", type=int,
+            help="Number of the compressing threads (the number of the CPUs "
+                 "by default)")
         # node list
         nodelist_parser = workspace_subparsers.add_parser(
             'node-list',
@@ -155,13 +228,62 @@ class WorkspaceManagerSpec(api.SpecObject):
             "-n", "--name",
             help="Workspace name").completer = completers.workspace_list
 
+        # history
+        history_parser = workspace_subparsers.add_parser(
+            'history',
+            help='Shows the plugins runs recorded in workspace')
+        history_parser.add_argument(
+            "-n", "--name",
+            help="Workspace name").completer = completers.workspace_list
+        history_parser.add_argument(
+            "-p", "--plugin", help="Show runs of the plugin only")
+        history_parser.add_argument(
+            "-s", "--status",
+            choices=['running', 'passed', 'failed', 'error'],
+            help="Show runs with the status only")
+        history_parser.add_argument(
+            "--since", type=_history_time,
+            help="Show runs started since the date ('2020-01-31'), the time "
+                 "('2020-01-31 13:30') or the time ago ('30m', '12h', '7d')")
+        history_parser.add_argument(
+            "--until", type=_history_time,
+            help="Show runs started before the date, the time or the time "
+                 "ago")
+        history_parser.add_argument(
+            "-l", "--limit", type=int, default=20,
+            help="Max number of runs to show (0 shows all runs)")
+        history_parser.add_argument(
+            "--summary", action='store_true',
+            help="Show runs statistics of every plugin instead of the runs")
+        history_parser.add_argument(
+            "-f", "--format", choices=['fancy', 'json'], default='fancy',
+            help="Output format")
+
+        # facts
+        facts_parser = workspace_subparsers.add_parser(
+            'facts',
+            help='Shows or purges the Ansible facts cached in workspace')
+        facts_parser.add_argument(
+            "-n", "--name",
+            help="Workspace name").completer = completers.workspace_list
+        facts_parser.add_argument(
+            "--host", action='append',
+            help="Show (or purge) the facts of the host only, can be used "
+                 "several times")
+        facts_parser.add_argument(
+            "--purge", action='store_true',
+            help="Remove the cached facts")
+        facts_parser.add_argument(
+            "-f", "--format", choices=['fancy', 'json'], default='fancy',
+            help="Output format")
+
     def spec_handler(self, parser, args):
         """Handles all the plugin manager commands
 
         :param parser: the infrared parser object.
-        :param args: the list of arguments received from cli.
+        :param args: the arguments received from cli.
         """
-        pargs = parser.parse_args(args)
+        pargs = self.get_parsed_args(parser, args)
         subcommand = pargs.command0
 
         if subcommand == 'create':
@@ -174,15 +296,25 @@ class WorkspaceManagerSpec(api.SpecObject):
             if pargs.print_active:
                 print(self.workspace_manager.get_active_workspace().name)
             else:
-                workspaces = self.workspace_manager.list()
                 headers = ("Name", "Active")
-                workspaces = sorted([workspace.name for workspace in
-                                     self.workspace_manager.list()])
-                print(fancy_table(
-                    headers,
-                    *[(workspace, ' ' * (len(headers[-1]) // 2) + "*" if
-                        self.workspace_manager.is_active(workspace) else "")
-                      for workspace in workspaces]))
+                if pargs.details:
+                    headers += ("Created", "Last used", "Size")
+                    details = self.workspace_manager.get_details()
+                    workspaces = sorted(details)
+                else:
+                    workspaces = sorted([workspace.name for workspace in
+                                         self.workspace_manager.list()])
+                rows = []
+                for workspace in workspaces:
+                    row = (workspace, ' ' * (len("Active") // 2) + "*" if
+                           self.workspace_manager.is_active(workspace) else "")
+                    if pargs.details:
+                        row += (
+                            _format_time(details[workspace]['created']),
+                            _format_time(details[workspace]['last_used']),
+                            _format_size(details[workspace]['size']))
+                    rows.append(row)
+                print(fancy_table(headers, *rows))
         elif subcommand == 'delete':
             for workspace_name in pargs.name:
                 self.workspace_manager.delete(workspace_name)
@@ -190,11 +322,15 @@ class WorkspaceManagerSpec(api.SpecObject):
         elif subcommand == 'cleanup':
             self.workspace_manager.cleanup(pargs.name)
         elif subcommand == 'export':
+            progress = _print_progress if sys.stderr.isatty() else None
             self.workspace_manager.export_workspace(
-                pargs.workspacename, pargs.filename, pargs.copykeys)
+                pargs.workspacename, pargs.filename, pargs.copykeys,
+                excludes=pargs.excludes, compression=pargs.compression,
+                level=pargs.level, threads=pargs.threads,
+                progress_callback=progress)
         elif subcommand == 'import':
             self.workspace_manager.import_workspace(
-                pargs.filename, pargs.workspacename)
+                pargs.filename, pargs.workspacename, sha256=pargs.sha256)
         elif subcommand == 'node-list':
             nodes = self.workspace_manager.node_list(pargs.name, pargs.group)
             if pargs.format == 'json':
@@ -210,6 +346,10 @@ class WorkspaceManagerSpec(api.SpecObject):
             groups = self.workspace_manager.group_list(pargs.name)
             print(fancy_table(
                 ("Name", "Nodes"), *[group_name for group_name in groups]))
+        elif subcommand == 'history':
+            self._show_history(pargs)
+        elif subcommand == 'facts':
+            self._workspace_facts(pargs)
 
     def _create_workspace(self, name):
         """Creates a workspace
@@ -244,12 +384,112 @@ class WorkspaceManagerSpec(api.SpecObject):
             raise exceptions.IRNoActiveWorkspaceFound()
         print(wkspc.inventory)
 
+    def _get_workspace(self, name=None):
+        """Gets the workspace by name or the active workspace.
+
+        :param name: the workspace name, the active workspace if not set
+        """
+        if name:
+            wkspc = self.workspace_manager.get(name)
+            if not wkspc:
+                raise exceptions.IRWorkspaceMissing(workspace=name)
+        else:
+            wkspc = self.workspace_manager.get_active_workspace()
+            if not wkspc:
+                raise exceptions.IRNoActiveWorkspaceFound()
+        return wkspc
+
+    def _workspace_facts(self, pargs):
+        """Shows or purges the Ansible facts cache of the workspace.
+
+        :param pargs: the parsed 'workspace facts' arguments
+        """
+        from infrared.core import fact_cache
+
+        cache = fact_cache.FactCache(self._get_workspace(pargs.name),
+                                     fact_cache.get_timeout())
+        if pargs.purge:
+            removed = cache.purge(pargs.host)
+            print("Removed cached facts of {} host(s)".format(len(removed)))
+            return
+
+        if pargs.host:
+            facts = dict((host, cache.get(host)) for host in pargs.host)
+            print(json.dumps(facts, indent=4, sort_keys=True))
+            return
+
+        hosts = cache.list()
+        if pargs.format == 'json':
+            print(json.dumps({'hosts': hosts}))
+            return
+        print(fancy_table(
+            ("Host", "Age", "Expired", "Facts"),
+            *[(host['host'], datetime.timedelta(seconds=int(host['age'])),
+               "yes" if host['expired'] else "", host['facts'])
+              for host in hosts]))
+
+    def _show_history(self, pargs):
+        """Prints the plugins runs history of the workspace.
+
+        :param pargs: the parsed 'workspace history' arguments
+        """
+        wkspc = self._get_workspace(pargs.name)
+        if pargs.summary:
+            stats = wkspc.history.summary(
+                plugin=pargs.plugin, since=pargs.since, until=pargs.until)
+            if pargs.format == 'json':
+                print(json.dumps({'plugins': stats}))
+                return
+
+            def _duration(seconds):
+                if seconds is None:
+                    return ''
+                return str(datetime.timedelta(seconds=int(seconds)))
+
+            print(fancy_table(
+                ("Plugin", "Runs", "Passed", "Failed", "Average", "Min",
+                 "Max"),
+                *[(stat['plugin'], stat['runs'], stat['passed'],
+                   stat['failed'], _duration(stat['average']),
+                   _duration(stat['minimum']), _duration(stat['maximum']))
+                  for stat in stats]))
+            return
+
+        runs = wkspc.history.list(
+            plugin=pargs.plugin, status=pargs.status, since=pargs.since,
+            until=pargs.until, limit=pargs.limit)
+        if pargs.format == 'json':
+            print(json.dumps({'runs': runs}))
+            return
+
+        rows = []
+        for run in runs:
+            duration = ''
+            if run['duration'] is not None:
+                duration = str(datetime.timedelta(
+                    seconds=int(run['duration'])))
+            rows.append((
+                run['id'], run['plugin'],
+                datetime.datetime.fromtimestamp(
+                    run['started']).strftime("%Y-%m-%d %H:%M:%S"),
+                duration, run['status'],
+                '' if run['rc'] is None else run['rc'],
+                ', '.join(run['failed_hosts']),
+                (run['vars_hash'] or '')[:12],
+                run['output_files'].get('log_file', '')))
+        print(fancy_table(
+            ("ID", "Plugin", "Started", "Duration", "Status", "RC",
+             "Failed hosts", "Vars hash", "Log file"), *rows))
+
 
 class PluginManagerSpec(api.SpecObject):
 
     def __init__(self, name, *args, **kwargs):
         super(PluginManagerSpec, self).__init__(name, *args, **kwargs)
-        self.plugin_manager = CoreServices.plugins_manager()
+
+    @property
+    def plugin_manager(self):
+        return CoreServices.plugins_manager()
 
     def extend_cli(self, root_subparsers):
         plugin_parser = root_subparsers.add_parser(
@@ -340,13 +580,21 @@ class PluginManagerSpec(api.SpecObject):
         import_parser.add_argument("src",
                                    help="The registry YML file Source")
 
+        # plugins spec cache
+        cache_parser = plugin_subparsers.add_parser(
+            'cache', help="Manage the cache of parsed plugins specs")
+        cache_subparsers = cache_parser.add_subparsers(dest="command1")
+        cache_subparsers.add_parser(
+            'rebuild', help="Drop the cached specs and cache the specs of "
+                            "all installed plugins again")
+
     def spec_handler(self, parser, args):
         """Handles all the plugin manager commands
 
         :param parser: the infrared parser object.
-        :param args: the list of arguments received from cli.
+        :param args: the arguments received from cli.
         """
-        pargs = parser.parse_args(args)
+        pargs = self.get_parsed_args(parser, args)
         subcommand = pargs.command0
 
         if subcommand == 'list':
@@ -381,6 +629,9 @@ class PluginManagerSpec(api.SpecObject):
             self._search_plugins()
         elif subcommand == 'import':
             self.plugin_manager.import_plugins(pargs.src)
+        elif subcommand == 'cache':
+            if pargs.command1 == 'rebuild':
+                self._rebuild_spec_cache()
 
     def _list_plugins(self, print_available=False, print_version=False):
         """Print a list of installed & available plugins"""
@@ -444,6 +695,14 @@ class PluginManagerSpec(api.SpecObject):
 
         print(fancy_table(table_headers, *table_rows))
 
+    def _rebuild_spec_cache(self):
+        """Rebuild the spec cache of all the installed plugins """
+        self.plugin_manager.rebuild_spec_cache()
+        for plugin in self.plugin_manager.PLUGINS_DICT.values():
+            api.InfraredPluginsSpec(plugin).load_spec_dict()
+        print("Spec cache rebuilt for {} plugin(s)".format(
+            len(self.plugin_manager.PLUGINS_DICT)))
+
     def _search_plugins(self):
         """Search git organizations and print a list of available plugins """
 
@@ -498,20 +757,236 @@ class SSHSpec(api.SpecObject):
         """Handles the ssh command
 
         :param parser: the infrared parser object.
-        :param args: the list of arguments received from cli.
+        :param args: the arguments received from cli.
         """
-        pargs = parser.parse_args(args)
+        pargs = self.get_parsed_args(parser, args)
         return interactive_ssh.ssh_to_host(
             pargs.node_name, remote_command=pargs.remote_command)
 
 
+class DaemonSpec(api.SpecObject):
+    """The infrared daemon CLI. """
+
+    def extend_cli(self, root_subparsers):
+        daemon_parser = root_subparsers.add_parser(
+            self.name,
+            help=self.kwargs["description"],
+            **self.kwargs)
+        daemon_subparsers = daemon_parser.add_subparsers(dest="command0")
+
+        # start
+        start_parser = daemon_subparsers.add_parser(
+            'start', help='Starts the daemon in background')
+        start_parser.add_argument(
+            "-f", "--foreground", action='store_true',
+            help="Runs the daemon in the foreground")
+
+        # stop
+        daemon_subparsers.add_parser('stop', help='Stops the daemon')
+
+        # status
+        daemon_subparsers.add_parser(
+            'status', help='Shows whether the daemon is running')
+
+    def spec_handler(self, parser, args):
+        """Handles the daemon commands
+
+        :param parser: the infrared parser object.
+        :param args: the arguments received from cli.
+        """
+        pargs = self.get_parsed_args(parser, args)
+        subcommand = pargs.command0
+
+        if subcommand == 'start':
+            pid = daemon.InfraredDaemon().start(pargs.foreground)
+            if not pargs.foreground:
+                print("Daemon started (pid: {})".format(pid))
+        elif subcommand == 'stop':
+            status = daemon.DaemonClient().stop()
+            if status is None:
+                raise exceptions.IRDaemonException("Daemon is not running")
+            print("Daemon stopped (pid: {})".format(status['pid']))
+        elif subcommand == 'status':
+            status = daemon.DaemonClient().status()
+            if status is None:
+                print("Daemon is not running")
+                return 1
+            print(fancy_table(
+                ("Pid", "Uptime", "Running commands", "Plugins"),
+                (status['pid'],
+                 datetime.timedelta(
+                     seconds=int(time.time() - status['started'])),
+                 status['workers'],
+                 len(status['plugins']))))
+
+
+class PipelineSpec(api.SpecObject):
+    """The CLI to run several plugins in one infrared process. """
+
+    def extend_cli(self, root_subparsers):
+        pipeline_parser = root_subparsers.add_parser(
+            self.name,
+            help=self.kwargs["description"],
+            **self.kwargs)
+        pipeline_parser.add_argument(
+            "pipeline_file", help="YAML file with the pipeline stages")
+        pipeline_parser.add_argument(
+            "--from-stage", dest="from_stage",
+            help="Name (or number) of the stage to start the pipeline from. "
+                 "The previous stages are skipped")
+        pipeline_parser.add_argument(
+            "--keep-going", dest="keep_going", action='store_true',
+            help="Runs the remaining stages after a stage fails")
+        pipeline_parser.add_argument(
+            "--validate-only", dest="validate_only", action='store_true',
+            help="Only validates the arguments of the stages")
+        pipeline_parser.add_argument(
+            "--incremental", action='store_true',
+            help="Skips the stages which have passed in the workspace with "
+                 "the same settings, plugin files and inventory (passes "
+                 "'--incremental' to every stage)")
+
+    def spec_handler(self, parser, args):
+        """Handles the pipeline command
+
+        :param parser: the infrared parser object.
+        :param args: the arguments received from cli.
+        """
+        pargs = self.get_parsed_args(parser, args)
+        ir_pipeline = pipeline.Pipeline.from_file(pargs.pipeline_file)
+        if pargs.incremental:
+            ir_pipeline.extra_args.append('--incremental')
+
+        # the plugins arguments are stored in the workspace while validated
+        workspace_manager = CoreServices.workspace_manager()
+        workspace = workspace_manager.get_active_workspace()
+        if not workspace:
+            workspace = workspace_manager.create()
+            workspace_manager.activate(workspace.name)
+            LOG.warning("There are no workspaces. New workspace added: %s",
+                        workspace.name)
+
+        if pargs.validate_only:
+            ir_pipeline.validate(ir_pipeline.get_stages(pargs.from_stage))
+            print("Pipeline '{}' is valid".format(pargs.pipeline_file))
+            return
+
+        rc = ir_pipeline.run(workspace, from_stage=pargs.from_stage,
+                             keep_going=pargs.keep_going)
+
+        print(fancy_table(
+            ("Stage", "Plugin", "Status", "Duration"),
+            *[(stage.name, stage.plugin_name,
+               stage.status if not stage.rc else "{} (rc: {})".format(
+                   stage.status, stage.rc),
+               datetime.timedelta(seconds=int(stage.duration))
+               if stage.duration is not None else "")
+              for stage in ir_pipeline.stages]))
+        return rc
+
+
+class ValidateSpec(api.SpecObject):
+    """The CLI to validate many answers and pipeline files at once. """
+
+    def extend_cli(self, root_subparsers):
+        validate_parser = root_subparsers.add_parser(
+            self.name,
+            help=self.kwargs["description"],
+            **self.kwargs)
+        validate_parser.add_argument(
+            "paths", nargs='+', metavar="PATH",
+            help="Answers (.ini) and pipeline (.yml) files, or directories "
+                 "to search for them")
+        validate_parser.add_argument(
+            "-p", "--plugin",
+            help="Validates only the section of the given plugin in the "
+                 "answers files (by default every section named after an "
+                 "installed plugin is validated)")
+        validate_parser.add_argument(
+            "-j", "--jobs", type=int,
+            help="Number of the processes validating the files in "
+                 "parallel (defaults to the number of the CPUs)")
+        validate_parser.add_argument(
+            "-f", "--format", choices=['fancy', 'json'], default='json',
+            help="Output format")
+
+    def spec_handler(self, parser, args):
+        """Handles the validate command
+
+        :param parser: the infrared parser object.
+        :param args: the arguments received from cli.
+        :return: 1 if any of the files is not valid, 0 otherwise
+        """
+        pargs = self.get_parsed_args(parser, args)
+
+        # the files are only read, no workspace is created or changed
+        batch = validation.BatchValidation(
+            validation.collect_files(pargs.paths), plugin_name=pargs.plugin)
+        report = batch.validate_all(jobs=pargs.jobs)
+        invalid = [entry for entry in report if not entry['valid']]
+
+        if pargs.format == 'json':
+            print(json.dumps({'files': report,
+                              'summary': {'total': len(report),
+                                          'invalid': len(invalid)}},
+                             indent=4, sort_keys=True))
+        else:
+            print(fancy_table(
+                ("File", "Stage", "Valid", "Errors"),
+                *[(entry['file'], entry['stage'] or "", entry['valid'],
+                   "\n".join(error['message'] for error in entry['errors']))
+                  for entry in report]))
+        return 1 if invalid else 0
+
+
+def _is_profile_enabled(args=None):
+    """Checks whether the run should be profiled.
+
+    :param args: list of cli arguments, sys.argv[1:] if None
+    """
+    args = sys.argv[1:] if args is None else args
+    for word in args:
+        if not word.startswith('-'):
+            break
+        if word == '--profile':
+            return True
+    if os.environ.get('IR_PROFILE'):
+        from distutils.util import strtobool
+        return bool(strtobool(os.environ['IR_PROFILE']))
+    return False
+
+
 def main(args=None):
-    CoreServices.setup()
+    if _is_profile_enabled(args):
+        profiler.PROFILER.enable(os.environ.get('IR_PROFILE_PSTATS'))
+
+    specs_manager = None
+    try:
+        with profiler.phase("main"):
+            specs_manager = _create_specs_manager(args)
+            argcomplete.autocomplete(specs_manager.build_parser(args))
+            return specs_manager.run_specs(args) or 0
+    finally:
+        if profiler.PROFILER.enabled:
+            command = specs_manager and specs_manager.get_subcommand(args)
+            profiler.PROFILER.finish(
+                workspace=CoreServices.workspace_manager(
+                ).get_active_workspace(),
+                command=command)
+
 
-    # inject ansible config file
-    CoreServices.ansible_config_manager().inject_config()
+def _create_specs_manager(args=None):
+    """Creates the spec manager with all the specs relevant for the run.
 
-    specs_manager = api.SpecManager()
+    :param args: list of cli arguments, sys.argv[1:] if None
+    """
+    with profiler.phase("services setup"):
+        CoreServices.setup()
+
+        # inject ansible config file
+        CoreServices.ansible_config_manager().inject_config()
+
+    specs_manager = api.SpecManager(lazy=True)
 
     # Init Managers
     specs_manager.register_spec(
@@ -529,12 +1004,32 @@ def main(args=None):
             'ssh',
             description="Interactive ssh session to node from inventory."))
 
-    # register all plugins
-    for plugin in CoreServices.plugins_manager().PLUGINS_DICT.values():
-        specs_manager.register_spec(api.InfraredPluginsSpec(plugin))
+    specs_manager.register_spec(
+        DaemonSpec(
+            'daemon',
+            description="Resident infrared process which runs the infrared "
+                        "commands without the startup overhead."))
+
+    specs_manager.register_spec(
+        PipelineSpec(
+            'pipeline',
+            description="Runs several plugins one by one in a single "
+                        "infrared process."))
 
-    argcomplete.autocomplete(specs_manager.parser)
-    return specs_manager.run_specs(args) or 0
+    specs_manager.register_spec(
+        ValidateSpec(
+            'validate',
+            description="Validates the plugins arguments of many answers "
+                        "and pipeline files at once."))
+
+    # register all plugins, unless one of the core specs is invoked, so the
+    # plugins are not loaded for the commands which don't need them
+    if specs_manager.get_subcommand(args) is None:
+        with profiler.phase("plugins loading"):
+            for plugin in CoreServices.plugins_manager().PLUGINS_DICT.values():
+                specs_manager.register_spec(api.InfraredPluginsSpec(plugin))
+
+    return specs_manager
 
 
 if __name__ == '__main__':
@@ -0,0 +1,257 @@
+"""Runs several plugins one by one in a single infrared process.
+
+The pipeline file lists the stages, every stage invokes a plugin with the
+given arguments::
+
+    stages:
+      - name: provision
+        plugin: virsh
+        args:
+          host-address: example.redhat.com
+          host-key: ~/.ssh/id_rsa
+          topology-nodes: undercloud:1,controller:1,compute:1
+      - plugin: tempest
+        args: ['--tests', 'sanity']
+
+The arguments are given either in the answers file style (option name to
+value mapping) or as the list of cli arguments. The arguments of all the
+stages are validated before the first stage is started.
+"""
+import argparse
+import os
+import time
+
+from infrared import api
+from infrared.core import execute
+from infrared.core.services import CoreServices
+from infrared.core.utils import exceptions
+from infrared.core.utils import logger
+from infrared.core.utils import profiler
+from infrared.core.utils import yaml_io
+
+LOG = logger.LOG
+
+STATUS_PASSED = 'passed'
+STATUS_FAILED = 'failed'
+STATUS_SKIPPED = 'skipped'
+
+
+class Stage(object):
+    """The plugin invocation in the pipeline. """
+
+    def __init__(self, name, plugin_name, args=None):
+        """Initializes the stage.
+
+        :param name: the stage name
+        :param plugin_name: the name of the plugin to invoke
+        :param args: dict of the plugin options and their values, or the
+            list of cli arguments
+        """
+        self.name = name
+        self.plugin_name = plugin_name
+        self.args = args or {}
+        self.spec = None
+        self.status = None
+        self.rc = None
+        self.duration = None
+
+    def get_cli_args(self):
+        """Gets the stage arguments as the list of cli arguments. """
+        if isinstance(self.args, (list, tuple)):
+            return [self.plugin_name] + [str(arg) for arg in self.args]
+
+        options = dict(
+            (option['name'], option) for _, option in
+            self.spec.specification.spec_helper.iterate_option_specs())
+
+        cli_args = [self.plugin_name]
+        for name, value in self.args.items():
+            option = options.get(name, {})
+            action = option.get('action')
+            if option.get('type') == 'Flag' or action == 'store_true':
+                if value:
+                    cli_args.append('--' + name)
+            elif action == 'count':
+                cli_args.extend(['--' + name] * int(value))
+            elif action == 'append':
+                if isinstance(value, dict):
+                    value = ['{}={}'.format(*item) for item in value.items()]
+                elif not isinstance(value, list):
+                    value = [value]
+                cli_args.extend('--{}={}'.format(name, item)
+                                for item in value)
+            else:
+                if isinstance(value, dict):
+                    value = ','.join(
+                        '{}:{}'.format(*item) for item in value.items())
+                elif isinstance(value, list):
+                    value = ','.join(str(item) for item in value)
+                cli_args.append('--{}={}'.format(name, value))
+        return cli_args
+
+
+class Pipeline(object):
+    """Runs the plugins stages in the same workspace. """
+
+    parser_class = argparse.ArgumentParser
+
+    def __init__(self, stages):
+        """Initializes the pipeline.
+
+        :param stages: list of Stage objects
+        """
+        self.stages = stages
+        # cli arguments added to the arguments of every stage
+        self.extra_args = []
+        self.parser = self.parser_class(prog='infrared')
+        self.subparsers = self.parser.add_subparsers(dest="subcommand")
+        self._specs = {}
+
+    @classmethod
+    def from_file(cls, pipeline_file):
+        """Loads the pipeline from the YAML file.
+
+        :param pipeline_file: path to the pipeline file
+        :return: Pipeline object
+        """
+        if not os.path.isfile(pipeline_file):
+            raise exceptions.IRFileNotFoundException(pipeline_file)
+        content = yaml_io.load_file(pipeline_file) or {}
+
+        if isinstance(content, dict):
+            content = content.get('stages')
+        if not content or not isinstance(content, list):
+            raise exceptions.IRPipelineException(
+                "No stages found in the pipeline file: {}".format(
+                    pipeline_file))
+
+        stages = []
+        for index, stage_dict in enumerate(content, 1):
+            if not isinstance(stage_dict, dict) or \
+                    'plugin' not in stage_dict:
+                raise exceptions.IRPipelineException(
+                    "Stage #{} doesn't define the plugin".format(index))
+            args = stage_dict.get('args') or {}
+            if not isinstance(args, (dict, list)):
+                raise exceptions.IRPipelineException(
+                    "Stage #{} arguments should be a dict or a list".format(
+                        index))
+            stages.append(Stage(stage_dict.get('name', stage_dict['plugin']),
+                                stage_dict['plugin'], args))
+
+        names = [stage.name for stage in stages]
+        duplicated = sorted(set(
+            name for name in names if names.count(name) > 1))
+        if duplicated:
+            raise exceptions.IRPipelineException(
+                "Stage names should be unique: {}".format(duplicated))
+        return cls(stages)
+
+    def get_stages(self, from_stage=None):
+        """Gets the stages to run.
+
+        :param from_stage: name (or number) of the stage to start from,
+            the previous stages are skipped.
+        :return: list of Stage objects
+        """
+        if from_stage is None:
+            return list(self.stages)
+
+        for index, stage in enumerate(self.stages, 1):
+            if from_stage in (stage.name, str(index)):
+                return self.stages[index - 1:]
+        raise exceptions.IRPipelineException(
+            "Stage '{}' not found in the pipeline".format(from_stage))
+
+    def _get_spec(self, plugin_name):
+        """Gets the plugin spec, each plugin is loaded once. """
+        if plugin_name not in self._specs:
+            plugins_manager = CoreServices.plugins_manager()
+            if plugin_name not in plugins_manager.PLUGINS_DICT:
+                raise exceptions.IRPipelineException(
+                    "Plugin '{}' is not installed".format(plugin_name))
+            spec = api.InfraredPluginsSpec(
+                plugins_manager.get_plugin(plugin_name))
+            spec.extend_cli(self.subparsers)
+            self._specs[plugin_name] = spec
+        return self._specs[plugin_name]
+
+    def _parse_args(self, stage):
+        """Parses the stage cli arguments. """
+        try:
+            return self.parser.parse_args(
+                stage.get_cli_args() + self.extra_args)
+        except SystemExit:
+            # argparse has already printed the error
+            raise exceptions.IRPipelineException("Invalid stage arguments")
+
+    def validate_stage(self, stage):
+        """Validates the arguments of the stage.
+
+        :param stage: the Stage object to validate
+        :raise IRException: when the stage arguments are not valid
+        """
+        stage.spec = self._get_spec(stage.plugin_name)
+        stage.spec.specification.parse_args(
+            self.parser, self._parse_args(stage), validate_only=True)
+
+    def validate(self, stages):
+        """Validates the arguments of all the stages.
+
+        :param stages: list of Stage objects to validate
+        """
+        invalid_stages = []
+        for stage in stages:
+            try:
+                self.validate_stage(stage)
+            except exceptions.IRException as ex:
+                LOG.error("[{}] {}".format(stage.name, ex))
+                invalid_stages.append(stage.name)
+        if invalid_stages:
+            raise exceptions.IRPipelineException(
+                "Pipeline validation failed for the stages: {}".format(
+                    ', '.join(invalid_stages)))
+
+    def run(self, workspace, from_stage=None, keep_going=False):
+        """Runs the stages one by one.
+
+        The plugins share the ansible inventory, which is parsed again only
+        when the workspace inventory is changed (by a previous stage or by
+        the stage's own arguments).
+
+        :param workspace: the Workspace object to run the stages in
+        :param from_stage: name (or number) of the stage to start from
+        :param keep_going: whether to run the remaining stages after a stage
+            fails
+        :return: rc of the first failed stage, 0 if all stages passed
+        """
+        stages = self.get_stages(from_stage)
+        with profiler.phase("pipeline validation"):
+            self.validate(stages)
+
+        runner = execute.AnsibleRunner(workspace.inventory)
+        rc = 0
+        for stage in self.stages:
+            if stage not in stages or (rc and not keep_going):
+                stage.status = STATUS_SKIPPED
+                continue
+
+            LOG.info("Running stage '{}' ({})".format(
+                stage.name, stage.plugin_name))
+            stage.spec.ansible_runner = runner
+            started = time.time()
+            try:
+                with profiler.phase("stage: {}".format(stage.name)):
+                    stage.rc = stage.spec.spec_handler(
+                        self.parser, args=self._parse_args(stage)) or 0
+            except exceptions.IRException as ex:
+                LOG.error("[{}] {}".format(stage.name, ex))
+                stage.rc = 1
+            finally:
+                stage.duration = time.time() - started
+                stage.spec.ansible_runner = None
+
+            stage.status = STATUS_FAILED if stage.rc else STATUS_PASSED
+            if stage.rc and not rc:
+                rc = stage.rc
+        return rc
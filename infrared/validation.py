@@ -0,0 +1,217 @@
+"""Validates many answers files and pipeline files in one infrared process.
+
+Every answers file section named after an installed plugin and every stage
+of a pipeline file is validated by the plugin spec parser, exactly like the
+plugin run would do it (required options, choices, length, minimum/maximum
+and the complex types resolution). The validation is read-only: the
+workspaces are not touched, so the types changing the workspace (the
+inventory) are not resolved. The plugins specs are loaded once, then the
+files are validated in parallel by the forked worker processes.
+"""
+import argparse
+import os
+import sys
+
+from six.moves import configparser
+
+from infrared import pipeline
+from infrared.core.services import CoreServices
+from infrared.core.utils import exceptions
+from infrared.core.utils import logger
+
+LOG = logger.LOG
+
+ANSWERS_FILE_EXTENSIONS = ('.ini',)
+PIPELINE_FILE_EXTENSIONS = ('.yml', '.yaml')
+
+# the batch validated by the worker processes, inherited from the parent
+_BATCH = None
+
+
+class _ArgumentParser(argparse.ArgumentParser):
+    """Raises the argparse errors instead of printing them and exiting. """
+
+    def error(self, message):
+        raise exceptions.IRPipelineException(message)
+
+
+def collect_files(paths):
+    """Gets the files to validate.
+
+    :param paths: list of the files and directories, the directories are
+        searched (recursively) for the answers and pipeline files
+    :return: sorted list of the files paths
+    """
+    files = set()
+    for path in paths:
+        if not os.path.isdir(path):
+            files.add(path)
+            continue
+        for root, _, names in os.walk(path):
+            files.update(
+                os.path.join(root, name) for name in names
+                if name.endswith(
+                    ANSWERS_FILE_EXTENSIONS + PIPELINE_FILE_EXTENSIONS))
+    return sorted(files)
+
+
+def _get_errors(ex):
+    """Gets the report of the exception.
+
+    :return: list of dicts with the error 'type' & 'message'
+    """
+    if isinstance(ex, exceptions.IRArgsValidationException):
+        return [error for sub_ex in ex.errors for error in _get_errors(sub_ex)]
+    return [dict(type=type(ex).__name__,
+                 message=getattr(ex, 'message', None) or str(ex))]
+
+
+class Entry(object):
+    """The validated answers file section or pipeline stage. """
+
+    def __init__(self, path, stage=None, errors=None):
+        """Initializes the entry.
+
+        :param path: the answers or pipeline file
+        :param stage: the Stage object to validate, None if the file can't
+            be validated
+        :param errors: list of the file errors (see _get_errors)
+        """
+        self.path = path
+        self.stage = stage
+        self.errors = errors or []
+
+    def to_dict(self):
+        return dict(file=self.path,
+                    stage=self.stage.name if self.stage else None,
+                    plugin=self.stage.plugin_name if self.stage else None,
+                    valid=not self.errors,
+                    errors=self.errors)
+
+
+class BatchValidation(pipeline.Pipeline):
+    """Validates the answers and pipeline files. """
+
+    parser_class = _ArgumentParser
+
+    def __init__(self, files, plugin_name=None):
+        """Loads the files.
+
+        :param files: list of the answers and pipeline files
+        :param plugin_name: the plugin the answers files are validated for,
+            by default every section named after a plugin is validated
+        """
+        self.entries = []
+        for path in files:
+            try:
+                if path.endswith(PIPELINE_FILE_EXTENSIONS):
+                    stages = pipeline.Pipeline.from_file(path).stages
+                else:
+                    stages = self._get_answers_file_stages(path, plugin_name)
+            except (exceptions.IRException, EnvironmentError,
+                    configparser.Error, ValueError) as ex:
+                self.entries.append(Entry(path, errors=_get_errors(ex)))
+                continue
+            self.entries.extend(Entry(path, stage) for stage in stages)
+
+        super(BatchValidation, self).__init__(
+            [entry.stage for entry in self.entries if entry.stage])
+
+    @staticmethod
+    def _get_answers_file_stages(path, plugin_name=None):
+        """Gets the stages reading the answers file sections.
+
+        :param path: the answers file
+        :param plugin_name: the only plugin section to validate
+        :return: list of the Stage objects
+        """
+        if not os.path.isfile(path):
+            raise exceptions.IRFileNotFoundException(path)
+        config = configparser.ConfigParser()
+        with open(path) as fd:
+            if (sys.version_info > (3, 2)):
+                config.read_file(fd)
+            else:
+                config.readfp(fd)
+
+        plugins = CoreServices.plugins_manager().PLUGINS_DICT
+        if plugin_name:
+            sections = [plugin_name] if config.has_section(
+                plugin_name) else []
+        else:
+            sections = [section for section in config.sections()
+                        if section in plugins]
+        if not sections:
+            raise exceptions.IRPipelineException(
+                "No section of {} found in the answers file".format(
+                    "the '{}' plugin".format(plugin_name) if plugin_name
+                    else "an installed plugin"))
+        return [pipeline.Stage(section, section, ['--from-file', path])
+                for section in sections]
+
+    def _validate_entry(self, index):
+        """Validates the entry.
+
+        :param index: the index of the entry
+        :return: list of the entry errors
+        """
+        entry = self.entries[index]
+        try:
+            self.validate_stage(entry.stage)
+        except Exception as ex:
+            return _get_errors(ex)
+        return []
+
+    def validate_all(self, jobs=None):
+        """Validates all the entries.
+
+        The plugins specs are loaded before the worker processes are
+        forked, so every plugin is loaded once.
+
+        :param jobs: number of the worker processes, the number of the CPUs
+            by default
+        :return: list of the entries reports (dicts)
+        """
+        import multiprocessing
+        global _BATCH
+
+        indexes = [index for index, entry in enumerate(self.entries)
+                   if entry.stage]
+        for plugin_name in set(self.entries[index].stage.plugin_name
+                               for index in indexes):
+            try:
+                self._get_spec(plugin_name)
+            except exceptions.IRException:
+                # reported by every stage of the plugin
+                pass
+
+        jobs = min(jobs or multiprocessing.cpu_count(), len(indexes))
+        if jobs > 1 and hasattr(os, 'fork'):
+            LOG.debug("Validating {} entries in {} processes".format(
+                len(indexes), jobs))
+            _BATCH = self
+            try:
+                # the workers inherit the loaded specs from the parent
+                pool = (multiprocessing.get_context('fork').Pool(jobs)
+                        if hasattr(multiprocessing, 'get_context')
+                        else multiprocessing.Pool(jobs))
+                try:
+                    results = pool.map(_validate_entry, indexes,
+                                       chunksize=max(
+                                           1, len(indexes) // (jobs * 4)))
+                finally:
+                    pool.close()
+                    pool.join()
+            finally:
+                _BATCH = None
+        else:
+            results = [self._validate_entry(index) for index in indexes]
+
+        for index, errors in zip(indexes, results):
+            self.entries[index].errors = errors
+        return [entry.to_dict() for entry in self.entries]
+
+
+def _validate_entry(index):
+    """Validates the entry of the batch in the worker process. """
+    return _BATCH._validate_entry(index)
@@ -1,6 +1,6 @@
 import os
 import pytest
-from infrared.core.services import CoreServices, CoreSettings
+from infrared.core.services import CoreServices, CoreSettings, ServiceName
 
 
 @pytest.fixture
@@ -9,6 +9,8 @@ def infrared_home(tmpdir):
     os.environ['IR_HOME'] = new_home
     yield new_home
     del os.environ['IR_HOME']
+    # drop the settings pointing to the temporary home
+    CoreServices.setup()
 
 
 def test_infrared_home_dir(infrared_home):
@@ -17,11 +19,6 @@ def test_infrared_home_dir(infrared_home):
     test_settings.install_plugin_at_start = False
     CoreServices.setup(test_settings)
 
-    assert os.path.isdir(infrared_home)
-    assert os.path.isdir(os.path.join(infrared_home, '.workspaces'))
-    assert os.path.isfile(os.path.join(infrared_home, '.plugins.ini'))
-    assert os.path.isdir(os.path.join(infrared_home, 'plugins'))
-    assert os.path.isfile(os.path.join(infrared_home, 'ansible.cfg'))
     assert CoreServices.workspace_manager().workspace_dir == os.path.join(
         infrared_home, '.workspaces')
     assert CoreServices.plugins_manager().config_file == os.path.join(
@@ -30,3 +27,30 @@ def test_infrared_home_dir(infrared_home):
         infrared_home, 'plugins')
     assert CoreServices.ansible_config_manager().ansible_config_path == os.path.join(
         infrared_home, 'ansible.cfg')
+
+    assert os.path.isdir(infrared_home)
+    assert os.path.isdir(os.path.join(infrared_home, '.workspaces'))
+    assert os.path.isfile(os.path.join(infrared_home, '.plugins.ini'))
+    assert os.path.isdir(os.path.join(infrared_home, 'plugins'))
+    assert os.path.isfile(os.path.join(infrared_home, 'ansible.cfg'))
+
+
+def test_services_created_on_access(infrared_home, mocker):
+    """Verify services are created only when they are accessed. """
+    mocker.patch.dict(CoreServices._SERVICES, clear=True)
+    test_settings = CoreSettings()
+    test_settings.install_plugin_at_start = False
+    CoreServices.setup(test_settings)
+
+    assert not CoreServices._SERVICES
+    assert not os.listdir(infrared_home)
+
+    workspace_manager = CoreServices.workspace_manager()
+    assert CoreServices.workspace_manager() is workspace_manager
+    assert list(CoreServices._SERVICES) == [ServiceName.WORKSPACE_MANAGER]
+    assert not os.path.exists(os.path.join(infrared_home, '.plugins.ini'))
+    assert not os.path.exists(os.path.join(infrared_home, 'ansible.cfg'))
+
+    CoreServices.execution_logger_manager()
+    assert ServiceName.ANSIBLE_CONFIG_MANAGER not in CoreServices._SERVICES
+    assert not os.path.exists(os.path.join(infrared_home, 'ansible.cfg'))
@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from infrared import daemon
+import tests
+
+EXAMPLE_PLUGIN_DIR = os.path.join(
+    os.path.abspath(os.path.dirname(tests.__file__)), 'example')
+
+PLUGINS_INI = """[supported_types]
+provision = Provisioning plugins
+install = Installing plugins
+test = Testing plugins
+other = Other type plugins
+"""
+
+pytestmark = pytest.mark.skipif(not daemon.is_supported(),
+                                reason="daemon is not supported")
+
+
+@pytest.fixture
+def daemon_fixture(tmpdir, monkeypatch):
+    """Runs infrared daemon with a temporary infrared home.
+
+    :return: the infrared home directory
+    """
+    ir_home = tmpdir.mkdir("ir_home")
+    ir_home.join('.plugins.ini').write(PLUGINS_INI)
+    monkeypatch.setenv('IR_HOME', str(ir_home))
+
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'infrared', 'daemon', 'start', '--foreground'],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    client = daemon.DaemonClient()
+    deadline = time.time() + daemon.START_TIMEOUT
+    while client.status() is None:
+        assert proc.poll() is None, proc.stdout.read()
+        assert time.time() < deadline, "Daemon failed to start"
+        time.sleep(0.1)
+
+    yield ir_home
+
+    client.stop()
+    proc.communicate()
+
+
+@pytest.mark.parametrize("args, env, forward", [
+    (['workspace', 'list'], {}, True),
+    (['--no-log-commands', 'virsh', '--help'], {}, True),
+    (['daemon', 'status'], {}, False),
+    (['ssh', 'controller-0'], {}, False),
+    (['workspace', 'list'], {'IR_NO_DAEMON': 'yes'}, False),
+    (['workspace', 'list'], {'_ARGCOMPLETE': '1'}, False),
+])
+def test_should_forward(monkeypatch, args, env, forward):
+    monkeypatch.delenv('IR_NO_DAEMON', raising=False)
+    monkeypatch.delenv('_ARGCOMPLETE', raising=False)
+    for key, value in env.items():
+        monkeypatch.setenv(key, value)
+
+    assert daemon._should_forward(args) == forward
+
+
+def test_daemon_not_running(tmpdir):
+    """Verify client asks to run commands in-process without daemon. """
+    client = daemon.DaemonClient(str(tmpdir.join(daemon.SOCKET_NAME)))
+
+    assert client.status() is None
+    assert client.run(['workspace', 'list']) is None
+
+
+def test_daemon_run_command(daemon_fixture, capfd):
+    """Verify commands run in daemon get client streams & exit code. """
+    client = daemon.DaemonClient()
+
+    assert client.run(['workspace', 'create', 'daemon_ws']) == 0
+    assert client.run(['workspace', 'list']) == 0
+    out, _ = capfd.readouterr()
+    assert 'daemon_ws' in out
+
+    assert client.run(['workspace', 'checkout', 'missing_ws']) == 1
+    _, err = capfd.readouterr()
+    assert 'missing_ws' in err
+
+    assert client.status()['workers'] <= 3
+
+
+def test_daemon_environ_mismatch(daemon_fixture, monkeypatch):
+    """Verify command runs in-process when ansible environment differs. """
+    monkeypatch.setenv('ANSIBLE_FORKS', '7')
+
+    assert daemon.DaemonClient().run(['workspace', 'list']) is None
+
+
+def test_daemon_reloads_plugins(daemon_fixture):
+    """Verify daemon reloads plugins when plugins config is changed. """
+    client = daemon.DaemonClient()
+    assert client.status()['plugins'] == []
+
+    daemon_fixture.join('.plugins.ini').write(
+        PLUGINS_INI + "\n[provision]\nexample = {}\n".format(
+            EXAMPLE_PLUGIN_DIR))
+    assert client.run(['workspace', 'list']) == 0
+
+    assert client.status()['plugins'] == ['example']
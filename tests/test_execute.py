@@ -1,12 +1,14 @@
 from six.moves import configparser
 from os import environ
 from os import path
+import time
 
 import pytest
 import yaml
 
 from infrared import api
 from infrared.core.services import plugins
+from infrared.core.utils import exceptions
 import tests
 from tests.test_workspace import workspace_manager_fixture, test_workspace  # noqa
 
@@ -155,6 +157,33 @@ def test_execute_main_role_path(spec_fixture, workspace_manager_fixture, # noqa
     assert out_file.read() == expected_resp
 
 
+@pytest.mark.parametrize("input_value", [None, "/path/to/role"])  # noqa
+def test_execute_role_path_restored(spec_fixture,  # noqa
+                                    workspace_manager_fixture,  # noqa
+                                    test_workspace, mocker, monkeypatch,
+                                    input_value):
+    """Verify ANSIBLE_ROLES_PATH is restored when the playbook run fails. """
+    role_path_plugin = 'example/plugins/plugin_with_role_path/infrared/plugin'
+    plugin_dir = path.join(path.abspath(path.dirname(tests.__file__)),
+                           role_path_plugin)
+    from infrared.api import InfraredPluginsSpec
+    spec = InfraredPluginsSpec(plugins.InfraredPlugin(plugin_dir=plugin_dir))
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec)
+    workspace_manager_fixture.activate(test_workspace.name)
+
+    if input_value is None:
+        monkeypatch.delenv('ANSIBLE_ROLES_PATH', raising=False)
+    else:
+        monkeypatch.setenv('ANSIBLE_ROLES_PATH', input_value)
+    mocker.patch.object(api.execute, 'ansible_playbook',
+                        side_effect=RuntimeError('crashed'))
+
+    with pytest.raises(RuntimeError):
+        spec_manager.run_specs(args=['example'])
+    assert environ.get('ANSIBLE_ROLES_PATH') == input_value
+
+
 def test_fake_inventory(spec_fixture, workspace_manager_fixture,          # noqa
                         test_workspace):
     """Verify "--inventory" updates workspace's inventory. """
@@ -377,6 +406,100 @@ def test_extra_vars_with_file(spec_fixture,
                                                      output_dict)
 
 
+def test_explain_var(spec_fixture, workspace_manager_fixture,  # noqa
+                     test_workspace, tmpdir, capsys):
+    """Verify the sources of the vars are explained. """
+    answers_file = tmpdir.join("answers.ini")
+    answers_file.write("[example]\nflag = True\n")
+    extra_vars_file = tmpdir.join("extra_vars.yml")
+    extra_vars_file.write("provision:\n  foo:\n    list: [1, 2]\n")
+
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec_fixture)
+    workspace_manager_fixture.activate(test_workspace.name)
+    spec_manager.run_specs(args=[
+        'example', '--dry-run', '--from-file', str(answers_file),
+        '-e', '@' + str(extra_vars_file), '-e', 'provision.foo.list=3',
+        '--explain-var', 'provision.flag',
+        '--explain-var', 'provision.foo',
+        '--explain-var', 'provision.foo.list',
+        '--explain-var', 'provision.missing'])
+
+    out, _ = capsys.readouterr()
+    explained = yaml.safe_load(out[out.index('provision.flag:'):])
+    assert explained['provision.flag'] == dict(
+        value=True, sources=['answers file'])
+    # the list of the extra-vars file is replaced
+    assert explained['provision.foo']['sources'] == [
+        'spec defaults', 'extra-vars provision.foo.list']
+    assert explained['provision.foo.list'] == dict(
+        value='3', sources=['extra-vars provision.foo.list'])
+    assert 'provision.missing' not in explained
+
+
+def test_layered_vars(tmpdir):
+    """Verify the tracked layers are merged like the untracked ones. """
+    from infrared.core.settings import LayeredVars
+
+    extra_vars_file = tmpdir.join("extra_vars.yml")
+    extra_vars_file.write("provision:\n  nodes: [b, c]\n"
+                          "  images: {tag: new}\n"
+                          "custom: {nested: {key: val}}\n")
+    extra_vars = ['@' + str(extra_vars_file),
+                  'provision.images=@' + str(extra_vars_file),
+                  'provision.nodes=d']
+
+    results = []
+    for track_sources in (False, True):
+        layered_vars = LayeredVars(track_sources=track_sources)
+        layered_vars.add_args(
+            'provision', {'nodes': ['a', 'b'], 'images-tag': 'old',
+                          'images-name': 'rhel'},
+            args_sources={'nodes': 'answers file'})
+        layered_vars.add_vars({'custom': {'other': 1}})
+        layered_vars.add_extra_vars(extra_vars)
+        results.append(layered_vars.materialize())
+
+    assert results[0] == results[1]
+    assert results[1]['provision']['nodes'] == 'd'
+    assert layered_vars.explain('provision.images.name') == (
+        'rhel', ['cli'])
+    assert layered_vars.explain('provision.images.tag') == (
+        'new', ['extra-vars file ' + str(extra_vars_file)])
+    assert layered_vars.explain('custom.other') == (1, ['cli'])
+    with pytest.raises(exceptions.IRKeyNotFoundException):
+        layered_vars.explain('custom.missing')
+
+
+@pytest.mark.parametrize("key, extra_vars", [  # noqa
+    ('private.password', []),
+    ('private.password', ['provision.password=@missing.yml']),
+    ('provision.missing', []),
+])
+def test_private_settings_missing(spec_fixture,  # noqa
+                                  workspace_manager_fixture,  # noqa
+                                  test_workspace, mocker, key, extra_vars):
+    """Verify the missing private settings key is explained to the user. """
+    from infrared.core import settings
+
+    # the key is missing while loading the extra-vars or merging the vars
+    mocker.patch.object(
+        settings.LayeredVars,
+        '_add_extra_var' if extra_vars else '_materialize',
+        side_effect=exceptions.IRKeyNotFoundException(key, 'settings'))
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec_fixture)
+    workspace_manager_fixture.activate(test_workspace.name)
+
+    expected = exceptions.IRPrivateSettingsMissingException if \
+        key.startswith('private.') else exceptions.IRKeyNotFoundException
+    args = ['example', '--dry-run']
+    for extra_var in extra_vars:
+        args.extend(['-e', extra_var])
+    with pytest.raises(expected):
+        spec_manager.run_specs(args=args)
+
+
 @pytest.mark.parametrize("input_value, expected_output_dict", [  # noqa
     # DEFAULT style
     [
@@ -838,3 +961,815 @@ def test_deprecation(spec_fixture, workspace_manager_fixture,  # noqa
 
     assert deprecated_yml.get('new', None).get('way', None) == 'TestingValue'
     assert new_yml.get('new', None).get('way', None) == 'TestingValue'
+
+
+class DummySpec(api.SpecObject):
+    """Spec which only adds an option to its subparser. """
+
+    def extend_cli(self, root_subparsers):
+        dummy_parser = root_subparsers.add_parser(self.name)
+        dummy_parser.add_argument("--dummy-option")
+
+    def spec_handler(self, parser, args):
+        return 0
+
+
+def test_lazy_spec_manager(spec_fixture, workspace_manager_fixture,  # noqa
+                           test_workspace, tmpdir, mocker):
+    """Verify lazy mode builds the cli of the selected spec only. """
+
+    dummy_spec = DummySpec('dummy', description="Dummy spec")
+    extend_cli = mocker.spy(dummy_spec, 'extend_cli')
+    extend_cli_stub = mocker.spy(dummy_spec, 'extend_cli_stub')
+    plugin_extend_cli = mocker.spy(spec_fixture, 'extend_cli')
+
+    spec_manager = api.SpecManager(lazy=True)
+    spec_manager.register_spec(spec_fixture)
+    spec_manager.register_spec(dummy_spec)
+    assert not extend_cli_stub.called
+    assert not plugin_extend_cli.called
+
+    parse_known_args = mocker.spy(spec_manager.parser, 'parse_known_args')
+    output = tmpdir.join("output.yml")
+    workspace_manager_fixture.activate(test_workspace.name)
+    spec_manager.run_specs(args=['example', '--foo-bar', 'lazy',
+                                 '--dry-run', '-o', str(output)])
+
+    assert plugin_extend_cli.call_count == 1
+    assert extend_cli_stub.call_count == 1
+    assert not extend_cli.called
+    # cli arguments are parsed once
+    assert parse_known_args.call_count == 1
+
+    with open(output.strpath) as fp:
+        assert yaml.safe_load(fp)["provision"]["foo"]["bar"] == "lazy"
+
+
+@pytest.mark.parametrize("args, comp_line, subcommand", [
+    (['example', '--foo-bar', 'val'], None, 'example'),
+    (['--no-log-commands', 'example'], None, 'example'),
+    (['--help'], None, None),
+    (['unknown', 'example'], None, None),
+    (['workspace', 'list'], 'infrared example --foo', 'example'),
+    (None, 'infrared exam', None),
+    (None, 'infrared example ', 'example'),
+])
+def test_lazy_spec_manager_subcommand(spec_fixture, monkeypatch,  # noqa
+                                      args, comp_line, subcommand):
+    """Verify the selected spec is found in cli & argcomplete input. """
+
+    if comp_line is not None:
+        monkeypatch.setenv('_ARGCOMPLETE', '1')
+        monkeypatch.setenv('COMP_LINE', comp_line)
+        monkeypatch.setenv('COMP_POINT', str(len(comp_line)))
+    else:
+        monkeypatch.delenv('_ARGCOMPLETE', raising=False)
+
+    spec_manager = api.SpecManager(lazy=True)
+    spec_manager.register_spec(spec_fixture)
+    spec_manager.register_spec(DummySpec('workspace', description="Dummy"))
+
+    assert spec_manager.get_subcommand(args) == subcommand
+
+
+def test_profiled_run(spec_fixture, workspace_manager_fixture,  # noqa
+                      test_workspace, tmpdir, capsys):
+    """Verify the profiled run reports phases to table, JSON & pstats. """
+    from infrared.core.utils import profiler
+    import json
+    import os
+    import pstats
+
+    workspace_manager_fixture.activate(test_workspace.name)
+    pstats_file = str(tmpdir.join("ir.pstats"))
+    profiler.PROFILER.enable(pstats_file)
+
+    spec_manager = api.SpecManager(lazy=True)
+    spec_manager.register_spec(spec_fixture)
+    with profiler.phase("main"):
+        spec_manager.run_specs(
+            args=['--profile', 'example', '--dry-run', '--foo-bar', 'val'])
+    profiler.PROFILER.finish(workspace=test_workspace, command='example')
+
+    assert not profiler.PROFILER.enabled
+    _, err = capsys.readouterr()
+    assert "settings generation" in err
+
+    profiles_dir = path.join(test_workspace.path, profiler.PROFILES_DIR)
+    reports = os.listdir(profiles_dir)
+    assert len(reports) == 1
+    assert reports[0].endswith("_example.json")
+    with open(path.join(profiles_dir, reports[0])) as fp:
+        phases = json.load(fp)['phases']
+    assert [(phase['name'], phase['depth']) for phase in phases] == [
+        ("main", 0),
+        ("argparse building", 1),
+        ("spec parsing: example", 2),
+        ("parser creation: example", 2),
+        ("arguments parsing", 1),
+        ("example handler", 1),
+        ("arguments resolution", 2),
+        ("answers file resolution", 3),
+        ("settings generation", 2),
+        ("vars merge", 2),
+        ("vars dump", 2),
+    ]
+    assert all(phase['duration'] >= 0 for phase in phases)
+
+    assert pstats.Stats(pstats_file).total_calls
+
+
+def test_ansible_runner(spec_fixture, test_workspace):  # noqa
+    """Verify runner shares the inventory & returns structured results. """
+    from infrared.core import execute
+
+    runner = execute.AnsibleRunner(test_workspace.inventory)
+    playbook = spec_fixture.plugin.playbook
+
+    result = runner.run(playbook,
+                        vars_dict={'provision': {'foo': {'bar': 'fail'}}})
+    inventory = runner.inventory
+
+    assert result.rc == 2
+    assert result.failed_hosts == ['localhost']
+    assert result.hosts['localhost']['failures'] == 1
+    assert [(task['host'], task['task'], task['status'])
+            for task in result.failed_tasks] == [
+        ('localhost', 'fail if input calls for it', 'failed')]
+
+    result = runner.run(playbook,
+                        vars_dict={'provision': {'foo': {'bar': 'pass'}}},
+                        ansible_args=['--tags', 'only_this'])
+
+    assert runner.inventory is inventory
+    assert result.rc == 0
+    assert not result.failed_hosts
+    assert not result.failed_tasks
+    assert result.hosts['localhost']['ok']
+
+
+class RecordingSink(object):
+    """File sink recording the written chunks. """
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+def test_no_ansi_file_split_sequences():
+    """Verify escape sequences split between writes are stripped. """
+    from infrared.core import execute
+
+    sink = RecordingSink()
+    no_ansi = execute.NoAnsiFile(sink)
+    for chunk in ["ok: ", "\x1b[0", ";32mlocal", "host\x1b", "[0m\n", "\x1b"]:
+        no_ansi.write(chunk)
+    no_ansi.close()
+
+    assert sink.getvalue() == "ok: localhost\n\x1b"
+    assert sink.closed
+
+
+def test_std_fd_manager_per_run_sinks(capfd):
+    """Verify output is batched to the sinks of the current run only. """
+    import sys
+    from infrared.core import execute
+
+    org_stdout = sys.stdout
+    first_sink, second_sink = RecordingSink(), RecordingSink()
+
+    with execute.IRSTDFDManager(stdout=False, stderr=False) as fd_manager:
+        fd_manager.add(first_sink)
+        for line in range(1000):
+            print("line {}".format(line))
+        sys.stderr.write("error\n")
+        fd_manager.flush()
+        assert first_sink.getvalue().count("line") == 1000
+        assert "error\n" in first_sink.getvalue()
+        assert len(first_sink.chunks) < 1000
+
+    assert sys.stdout is org_stdout
+    assert first_sink.closed
+    assert not fd_manager.fds
+
+    with execute.IRSTDFDManager(stdout=True, stderr=False) as fd_manager:
+        fd_manager.add(second_sink)
+        print("second run")
+
+    assert first_sink.getvalue().count("line") == 1000
+    assert "second run" not in first_sink.getvalue()
+    assert second_sink.getvalue() == "second run\n"
+    assert "second run" in capfd.readouterr()[0]
+
+
+def test_std_fd_manager_forked_output(tmpdir):
+    """Verify the output of the forked processes reaches the sinks. """
+    import os
+    import sys
+    from infrared.core import execute
+
+    log_file = tmpdir.join('ansible.log')
+    with execute.IRSTDFDManager(stdout=False, stderr=False) as fd_manager:
+        fd_manager.add(open(str(log_file), 'w'))
+        print("parent before fork")
+        pid = os.fork()
+        if not pid:
+            # the Ansible workers exit without the cleanup
+            print("child output")
+            sys.stderr.write("child warning\n")
+            os._exit(0)
+        os.waitpid(pid, 0)
+        print("parent after fork")
+
+    assert log_file.read().splitlines() == [
+        "parent before fork", "child output", "child warning",
+        "parent after fork"]
+
+
+def test_profile_tasks_callback(spec_fixture, test_workspace,  # noqa
+                                tmpdir, monkeypatch):
+    """Verify the profiling callback writes the tasks timing reports. """
+    import csv
+    import json
+    import os
+    from ansible.plugins.loader import callback_loader
+    from infrared.core import execute
+    import infrared.main
+
+    callback_loader.add_directory(os.path.join(
+        os.path.dirname(infrared.main.__file__), 'common', 'callback_plugins'))
+    monkeypatch.setenv('IR_PROFILE_TASKS', 'yes')
+    monkeypatch.setenv('IR_PROFILE_TASKS_DIR', str(tmpdir))
+
+    result = execute.AnsibleRunner(test_workspace.inventory).run(
+        spec_fixture.plugin.playbook,
+        vars_dict={'provision': {'foo': {'bar': 'val'}}})
+    assert result.rc == 0
+
+    reports = sorted(os.listdir(str(tmpdir)))
+    assert [os.path.splitext(report)[1] for report in reports] == [
+        '.csv', '.folded', '.json']
+
+    with open(str(tmpdir.join(reports[2]))) as fp:
+        profile = json.load(fp)
+    tasks = dict((task['task'], task) for task in profile['tasks'])
+    assert tasks['Test output']['hosts']['localhost']['status'] == 'ok'
+    assert tasks['fail if no vars dict']['hosts']['localhost'][
+        'status'] == 'skipped'
+    assert list(profile['roles']) == ['example_role']
+
+    with open(str(tmpdir.join(reports[0]))) as fp:
+        rows = list(csv.DictReader(fp))
+    assert len(rows) == len(profile['tasks'])
+
+    with open(str(tmpdir.join(reports[1]))) as fp:
+        stacks = [line.rsplit(' ', 1) for line in fp.read().splitlines()]
+    assert ['main.yml', 'Main Play', 'example_role',
+            'roles/example_role/tasks/main.yml', 'Test role output'] in [
+        stack.split(';') for stack, _ in stacks]
+    assert all(duration.isdigit() for _, duration in stacks)
+
+
+PROFILE_SERIAL_PLAYBOOK = """
+- hosts: all
+  gather_facts: no
+  serial: 1
+  tasks:
+    - name: wait
+      command: sleep 0.5
+"""
+
+
+def test_profile_tasks_serial(tmpdir, monkeypatch):
+    """Verify the timings of all the serial batches are kept. """
+    import json
+    import os
+    from ansible.plugins.loader import callback_loader
+    from infrared.core import execute
+    import infrared.main
+
+    callback_loader.add_directory(os.path.join(
+        os.path.dirname(infrared.main.__file__), 'common', 'callback_plugins'))
+    reports_dir = tmpdir.mkdir('reports')
+    monkeypatch.setenv('IR_PROFILE_TASKS', 'yes')
+    monkeypatch.setenv('IR_PROFILE_TASKS_DIR', str(reports_dir))
+    inventory = tmpdir.join('hosts')
+    inventory.write(CHECKPOINT_INVENTORY)
+    playbook = tmpdir.join('main.yml')
+    playbook.write(PROFILE_SERIAL_PLAYBOOK)
+
+    assert execute.AnsibleRunner(str(inventory)).run(str(playbook)).rc == 0
+
+    report = [name for name in os.listdir(str(reports_dir))
+              if name.endswith('.json')][0]
+    with open(str(reports_dir.join(report))) as fp:
+        task = json.load(fp)['tasks'][0]
+    assert list(task['hosts']) == ['node1', 'node2']
+    for record in task['hosts'].values():
+        assert record['status'] == 'ok'
+        assert 0.5 <= record['duration'] < task['duration']
+    assert task['duration'] >= 1
+    assert task['hosts']['node1']['start'] < task['hosts']['node2']['start']
+
+
+def test_run_history(spec_fixture, workspace_manager_fixture,  # noqa
+                     test_workspace, monkeypatch):
+    """Verify the plugin runs are recorded in the workspace history. """
+    from infrared.core import history
+
+    monkeypatch.setenv('IR_ANSIBLE_LOG_OUTPUT', 'yes')
+
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec_fixture)
+    workspace_manager_fixture.activate(test_workspace.name)
+
+    assert spec_manager.run_specs(args=['example', '--foo-bar', 'fail'])
+    assert spec_manager.run_specs(args=['example', '--incremental']) == 0
+
+    passed, failed = test_workspace.history.list()
+    assert passed['plugin'] == failed['plugin'] == 'example'
+    assert (passed['status'], passed['rc']) == ('passed', 0)
+    assert failed['status'] == 'failed' and failed['rc']
+    assert failed['failed_hosts'] == ['localhost']
+    assert passed['failed_hosts'] == []
+    assert passed['vars_hash'] != failed['vars_hash']
+    # the plugin files are hashed only for the incremental runs
+    assert passed['playbook_hash'] and failed['playbook_hash'] is None
+    # while the plugin revision is recorded for every run
+    assert passed['plugin_revision'] == failed['plugin_revision'] == \
+        history.get_git_revision(spec_fixture.plugin.path)
+    assert passed['plugin_revision']
+    assert passed['duration'] >= 0
+    assert path.isfile(passed['output_files']['log_file'])
+
+    assert test_workspace.history.list(status='failed') == [failed]
+
+
+def test_incremental_run(spec_fixture, workspace_manager_fixture,  # noqa
+                         test_workspace, mocker):
+    """Verify --incremental skips the playbook when nothing changed. """
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec_fixture)
+    workspace_manager_fixture.activate(test_workspace.name)
+    playbook = mocker.spy(api.execute, 'ansible_playbook')
+
+    assert spec_manager.run_specs(args=['example', '--incremental']) == 0
+    assert spec_manager.run_specs(args=['example', '--incremental']) == 0
+    assert playbook.call_count == 1
+
+    # settings are changed
+    assert spec_manager.run_specs(
+        args=['example', '--incremental', '-e', 'foo=bar']) == 0
+    assert playbook.call_count == 2
+
+    # inventory is changed
+    with open(test_workspace.inventory, 'a') as inventory:
+        inventory.write('\n')
+    assert spec_manager.run_specs(
+        args=['example', '--incremental', '-e', 'foo=bar']) == 0
+    assert playbook.call_count == 3
+
+    assert spec_manager.run_specs(
+        args=['example', '--incremental', '--force', '-e', 'foo=bar']) == 0
+    assert spec_manager.run_specs(args=['example', '-e', 'foo=bar']) == 0
+    assert playbook.call_count == 5
+    assert len(test_workspace.history.list()) == 5
+
+
+def test_incremental_partial_run(spec_fixture,  # noqa
+                                 workspace_manager_fixture,  # noqa
+                                 test_workspace, mocker):
+    """Verify the passed partial run doesn't skip the full run. """
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec_fixture)
+    workspace_manager_fixture.activate(test_workspace.name)
+    playbook = mocker.spy(api.execute, 'ansible_playbook')
+
+    assert spec_manager.run_specs(args=[
+        'example', '--incremental', '--ansible-args', 'tags=none']) == 0
+    assert spec_manager.run_specs(args=[
+        'example', '--incremental', '--ansible-args', 'tags=none']) == 0
+    assert playbook.call_count == 1
+
+    assert spec_manager.run_specs(args=['example', '--incremental']) == 0
+    assert playbook.call_count == 2
+    assert spec_manager.run_specs(args=['example', '--incremental']) == 0
+    assert playbook.call_count == 2
+
+
+CHECKPOINT_INVENTORY = """
+node1 ansible_connection=local
+node2 ansible_connection=local
+"""
+
+CHECKPOINT_PLAYBOOK = """
+- name: Checkpoint play
+  hosts: all
+  gather_facts: no
+  tasks:
+    - name: set the fact
+      set_fact:
+        first_fact: "{{ inventory_hostname }} {{ fact_value }}"
+    - name: register the result
+      command: echo registered
+      register: echo_result
+    - name: fail on demand
+      fail:
+      when: should_fail | bool
+    - name: use the facts
+      copy:
+        content: "{{ first_fact }} {{ echo_result.stdout }}"
+        dest: "{{ output }}.{{ inventory_hostname }}"
+      delegate_to: localhost
+"""
+
+CHECKPOINT_PLAYBOOK_SAME_NAME = """
+- name: Setup play
+  hosts: all
+  gather_facts: no
+  tasks:
+    - name: fail on demand
+      debug:
+        msg: not the failed task
+""" + CHECKPOINT_PLAYBOOK
+
+
+def test_checkpoint_callback(test_workspace, tmpdir, monkeypatch):  # noqa
+    """Verify the failed playbook is resumed with the saved facts. """
+    import os
+    from ansible.plugins.loader import callback_loader
+    from infrared.core import checkpoint
+    from infrared.core import execute
+    import infrared.main
+
+    callback_loader.add_directory(os.path.join(
+        os.path.dirname(infrared.main.__file__), 'common', 'callback_plugins'))
+    inventory = tmpdir.join('hosts')
+    inventory.write(CHECKPOINT_INVENTORY)
+    playbook = tmpdir.join('main.yml')
+    playbook.write(CHECKPOINT_PLAYBOOK)
+    output = tmpdir.join('output')
+    ir_checkpoint = checkpoint.Checkpoint(test_workspace, 'checkpoint')
+    ir_checkpoint.enable()
+    runner = execute.AnsibleRunner(str(inventory))
+
+    try:
+        result = runner.run(str(playbook), vars_dict=dict(
+            fact_value='saved', should_fail=True, output=str(output)))
+        assert result.rc
+
+        saved = ir_checkpoint.load()
+        assert saved['status'] == 'failed'
+        assert saved['plays'] == [dict(name='Checkpoint play',
+                                       path=str(playbook) + ':2',
+                                       completed_task='register the result')]
+        assert saved['task']['name'] == 'register the result'
+        resume_task = ir_checkpoint.get_resume_task()
+        assert resume_task['name'] == 'fail on demand'
+        assert resume_task['play_path'] == str(playbook) + ':2'
+        facts = ir_checkpoint.load_facts()
+        # the facts with different values on the hosts are kept
+        assert facts['node1']['first_fact'] == 'node1 saved'
+        assert facts['node2']['first_fact'] == 'node2 saved'
+        assert facts['node1']['echo_result']['stdout'] == 'registered'
+
+        result = runner.run(str(playbook), vars_dict=dict(
+            should_fail=False, output=str(output)),
+            resume=dict(task=resume_task, facts=facts))
+        assert result.rc == 0
+        assert tmpdir.join('output.node1').read() == \
+            'node1 saved registered'
+        assert tmpdir.join('output.node2').read() == \
+            'node2 saved registered'
+        assert ir_checkpoint.load()['status'] == 'passed'
+        # the facts of the resumed run are kept
+        assert ir_checkpoint.load_facts()['node2']['first_fact'] == \
+            'node2 saved'
+    finally:
+        ir_checkpoint.disable()
+
+    with pytest.raises(exceptions.IRCheckpointException):
+        ir_checkpoint.get_resume_task()
+    ir_checkpoint.reset()
+    with pytest.raises(exceptions.IRCheckpointException):
+        ir_checkpoint.get_resume_task()
+
+
+def test_checkpoint_same_task_name(test_workspace, tmpdir):  # noqa
+    """Verify the run isn't resumed at an earlier task of the same name. """
+    import os
+    from ansible.plugins.loader import callback_loader
+    from infrared.core import checkpoint
+    from infrared.core import execute
+    import infrared.main
+
+    callback_loader.add_directory(os.path.join(
+        os.path.dirname(infrared.main.__file__), 'common', 'callback_plugins'))
+    inventory = tmpdir.join('hosts')
+    inventory.write(CHECKPOINT_INVENTORY)
+    playbook = tmpdir.join('main.yml')
+    playbook.write(CHECKPOINT_PLAYBOOK_SAME_NAME)
+    output = tmpdir.join('output')
+    ir_checkpoint = checkpoint.Checkpoint(test_workspace, 'checkpoint')
+    ir_checkpoint.enable()
+    runner = execute.AnsibleRunner(str(inventory))
+
+    try:
+        assert runner.run(str(playbook), vars_dict=dict(
+            fact_value='saved', should_fail=True, output=str(output))).rc
+        resume_task = ir_checkpoint.get_resume_task()
+        assert resume_task['play'] == 'Checkpoint play'
+
+        with pytest.raises(exceptions.IRCheckpointException) as ex:
+            runner.run(str(playbook), vars_dict=dict(
+                should_fail=False, output=str(output)),
+                resume=dict(task=resume_task,
+                            facts=ir_checkpoint.load_facts()))
+        assert "of play 'Setup play'" in ex.value.message
+        assert not tmpdir.join('output.node1').check()
+    finally:
+        ir_checkpoint.disable()
+
+
+def test_resume(spec_fixture, workspace_manager_fixture,  # noqa
+                test_workspace, mocker, monkeypatch):
+    """Verify --resume starts the playbook from the failed task. """
+    import os
+    from ansible.plugins.loader import callback_loader
+    import infrared.main
+
+    callback_loader.add_directory(os.path.join(
+        os.path.dirname(infrared.main.__file__), 'common', 'callback_plugins'))
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec_fixture)
+    workspace_manager_fixture.activate(test_workspace.name)
+    playbook = mocker.spy(api.execute, 'ansible_playbook')
+
+    # the checkpoints can be disabled
+    monkeypatch.setenv('IR_CHECKPOINT', 'no')
+    assert spec_manager.run_specs(args=['example', '--foo-bar', 'fail'])
+    with pytest.raises(exceptions.IRCheckpointException):
+        spec_manager.run_specs(
+            args=['example', '--foo-bar', 'val', '--resume'])
+
+    monkeypatch.delenv('IR_CHECKPOINT')
+    assert spec_manager.run_specs(args=['example', '--foo-bar', 'fail'])
+    assert not path.exists(path.join(test_workspace.path, "output.example"))
+    os.remove(path.join(test_workspace.path, "role_output.example"))
+
+    assert spec_manager.run_specs(
+        args=['example', '--foo-bar', 'val', '--resume']) == 0
+    assert playbook.call_args[1]['resume']['task']['name'] == \
+        'fail if input calls for it'
+    assert path.exists(path.join(test_workspace.path, "output.example"))
+    # the role tasks are before the failed task
+    assert not path.exists(
+        path.join(test_workspace.path, "role_output.example"))
+    assert 'IR_CHECKPOINT_FILE' not in os.environ
+
+    # nothing to resume after the passed run
+    with pytest.raises(exceptions.IRCheckpointException):
+        spec_manager.run_specs(
+            args=['example', '--foo-bar', 'val', '--resume'])
+
+
+FACT_CACHE_PLAYBOOK = """
+- name: Facts play
+  hosts: localhost
+  gather_facts: yes
+  tasks:
+    - include_role:
+        name: collect-ansible-facts
+      vars:
+        ansible_facts_dir_dest: "{{ facts_dest }}"
+"""
+
+
+def test_fact_cache(test_workspace, tmpdir, monkeypatch):  # noqa
+    """Verify the facts are cached in the workspace between the runs. """
+    import os
+    from infrared.core import execute
+    from infrared.core import fact_cache
+    from infrared.core.services.ansible_config import AnsibleConfigManager
+    import infrared.main
+
+    for name in ('ANSIBLE_CACHE_PLUGIN', 'ANSIBLE_GATHERING',
+                 'IR_FACT_CACHE'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('ANSIBLE_ROLES_PATH', os.path.join(
+        os.path.dirname(infrared.main.__file__), 'common', 'roles'))
+    monkeypatch.setenv('ANSIBLE_CONFIG', str(tmpdir.join('ansible.cfg')))
+    ansible_config = AnsibleConfigManager(str(tmpdir))
+    playbook = tmpdir.join('main.yml')
+    playbook.write(FACT_CACHE_PLAYBOOK)
+    facts_dest = tmpdir.join('facts')
+    cache = fact_cache.FactCache(test_workspace)
+    cached_file = os.path.join(cache.path, 'localhost')
+
+    def run():
+        with ansible_config.fact_cache(test_workspace):
+            assert os.environ['ANSIBLE_GATHERING'] == 'smart'
+            result = execute.AnsibleRunner(test_workspace.inventory).run(
+                str(playbook), vars_dict=dict(facts_dest=str(facts_dest)))
+        assert result.rc == 0
+        assert 'ANSIBLE_CACHE_PLUGIN' not in os.environ
+
+    run()
+    assert cache.get('localhost')['ansible_hostname']
+    collected = facts_dest.join('infrared-ansible-facts.json').read()
+    assert 'ansible_hostname' in collected
+
+    # the cached facts are not gathered again
+    cached_time = int(time.time()) - 60
+    os.utime(cached_file, (cached_time, cached_time))
+    run()
+    assert os.path.getmtime(cached_file) == cached_time
+
+    # the cache is dropped once the inventory is switched
+    new_inventory = tmpdir.join('new_hosts')
+    new_inventory.write("localhost ansible_connection=local\n")
+    test_workspace.inventory = str(new_inventory)
+    run()
+    assert os.path.getmtime(cached_file) > cached_time
+
+    monkeypatch.setenv('IR_FACT_CACHE', 'no')
+    assert ansible_config.get_fact_cache_env(test_workspace) == {}
+
+
+COLLECT_FACTS_PLAYBOOK = """
+- name: Facts play
+  hosts: all
+  gather_facts: no
+  tasks:
+    - include_role:
+        name: collect-ansible-facts
+      vars:
+        ansible_facts_dir_dest: "{{ facts_dest }}"
+        ansible_facts_filename: "facts_{{ inventory_hostname }}"
+"""
+
+
+def test_collect_ansible_facts(test_workspace, tmpdir, monkeypatch):  # noqa
+    """Verify the facts of every host are saved to its own file. """
+    import json
+    import os
+    from infrared.core import execute
+    import infrared.main
+
+    monkeypatch.setenv('ANSIBLE_ROLES_PATH', os.path.join(
+        os.path.dirname(infrared.main.__file__), 'common', 'roles'))
+    inventory = tmpdir.join('hosts')
+    inventory.write("host-0 ansible_connection=local host_index=0\n"
+                    "host-1 ansible_connection=local host_index=1\n")
+    playbook = tmpdir.join('main.yml')
+    playbook.write(COLLECT_FACTS_PLAYBOOK)
+    facts_dest = tmpdir.join('facts')
+
+    result = execute.AnsibleRunner(str(inventory)).run(
+        str(playbook), vars_dict=dict(facts_dest=str(facts_dest)))
+    assert result.rc == 0
+    for index in range(2):
+        facts = json.loads(facts_dest.join(
+            'facts_host-{}.json'.format(index)).read())
+        assert facts['host_index'] == index
+
+
+SSH_WARMUP_INVENTORY = """
+localhost ansible_connection=local
+[nodes]
+node1 ansible_host=10.0.0.1 ansible_user=stack
+node2 ansible_host=unreachable ansible_port=2222 \
+ansible_ssh_common_args='-o ProxyCommand="ssh -W %h:%p bastion"'
+[nodes:vars]
+ansible_ssh_executable={ssh}
+"""
+
+SSH_WARMUP_SSH = """#!/bin/sh
+echo "$@" >> {calls}
+case "$*" in *unreachable*) echo "Connection refused" >&2; exit 255;; esac
+"""
+
+
+def test_ssh_warmup(tmpdir):
+    """Verify the SSH connections are opened before the playbook starts. """
+    from infrared.core import execute
+
+    calls = tmpdir.join('calls')
+    ssh = tmpdir.join('ssh')
+    ssh.write(SSH_WARMUP_SSH.format(calls=calls))
+    ssh.chmod(0o755)
+    inventory = tmpdir.join('hosts')
+    inventory.write(SSH_WARMUP_INVENTORY.format(ssh=ssh))
+    playbook = tmpdir.join('main.yml')
+    playbook.write("- hosts: localhost\n  gather_facts: no\n"
+                   "  tasks:\n    - debug: msg=ok\n")
+    runner = execute.AnsibleRunner(str(inventory))
+
+    # only the hosts targeted by the plays are connected
+    assert runner.run(str(playbook), ssh_warmup=True).rc == 0
+    assert not calls.check()
+
+    playbook = tmpdir.join('nodes.yml')
+    playbook.write("- hosts: localhost\n  gather_facts: no\n"
+                   "  tasks:\n    - debug: msg=ok\n"
+                   "- hosts: '{{ target }}'\n  gather_facts: no\n"
+                   "  tasks:\n    - debug: msg=ok\n")
+    with pytest.raises(exceptions.IRSshException) as ex:
+        runner.run(str(playbook), vars_dict=dict(target='nodes'),
+                   ssh_warmup=True)
+    assert 'node2' in ex.value.message
+    assert 'node1' not in ex.value.message
+
+    commands = sorted(line for line in calls.read().splitlines()
+                      if line.endswith(' true'))
+    assert len(commands) == 2
+    assert commands[0].endswith('BatchMode=yes 10.0.0.1 true')
+    assert 'User="stack"' in commands[0]
+    assert 'ControlPath=' in commands[0]
+    assert 'ProxyCommand=ssh -W %h:%p bastion' in commands[1]
+    assert 'Port=2222' in commands[1]
+
+    # only the hosts targeted by --limit are connected
+    calls.remove()
+    result = runner.run(str(playbook), vars_dict=dict(target='all'),
+                        ssh_warmup=True,
+                        ansible_args=['--limit', 'localhost,node1'])
+    assert result.rc == 0
+    assert len([line for line in calls.read().splitlines()
+                if line.endswith(' true')]) == 1
+
+
+def test_ansible_autotune(tmpdir, monkeypatch):
+    """Verify the ansible settings are tuned for the inventory run. """
+    import os
+    from ansible import constants as C
+    from infrared.core import execute
+    from infrared.core.services import ansible_config
+
+    get_tuned_env = ansible_config.AnsibleConfigManager.get_tuned_env
+    for name in ('ANSIBLE_FORKS', 'ANSIBLE_SSH_ARGS',
+                 'ANSIBLE_INTERNAL_POLL_INTERVAL',
+                 'ANSIBLE_DISPLAY_SKIPPED_HOSTS'):
+        monkeypatch.delenv(name, raising=False)
+
+    # small controller with a large inventory behind a bastion
+    env = get_tuned_env(200, behind_bastion=True, cpus=4, memory=8192)
+    assert env['ANSIBLE_FORKS'] == '16'
+    assert 'ControlPersist=780s' in env['ANSIBLE_SSH_ARGS']
+    assert env['ANSIBLE_DISPLAY_SKIPPED_HOSTS'] == 'False'
+    # large controller isn't limited by the static defaults
+    env = get_tuned_env(1000, cpus=128, memory=512 * 1024)
+    assert env['ANSIBLE_FORKS'] == '500'
+    assert get_tuned_env(3, cpus=64)['ANSIBLE_FORKS'] == '3'
+    assert get_tuned_env(10, cpus=1, memory=1024)['ANSIBLE_FORKS'] == '5'
+    # the settings set by the user are kept
+    monkeypatch.setenv('ANSIBLE_FORKS', '7')
+    env = get_tuned_env(200, cpus=4, memory=8192,
+                        ssh_args='-o ControlPersist=30s -o Foo=bar')
+    assert 'ANSIBLE_FORKS' not in env
+    assert env['ANSIBLE_SSH_ARGS'] == '-o ControlPersist=420s -o Foo=bar'
+    monkeypatch.delenv('ANSIBLE_FORKS')
+    # the ControlPersist is added when it's not set
+    assert get_tuned_env(200, cpus=4, memory=8192, ssh_args='-o Foo=bar')[
+        'ANSIBLE_SSH_ARGS'] == \
+        '-o Foo=bar -o ControlMaster=auto -o ControlPersist=420s'
+    assert get_tuned_env(200, cpus=4, memory=8192,
+                         ssh_args='-o ControlMaster=no')[
+        'ANSIBLE_SSH_ARGS'] == '-o ControlMaster=no'
+
+    inventory = tmpdir.join('hosts')
+    inventory.write(
+        "[nodes]\n" + "".join("node{}\n".format(i) for i in range(60)) +
+        "[nodes:vars]\nansible_connection=local\n"
+        "ansible_ssh_common_args='-o ProxyCommand=\"ssh -W %h:%p b\"'\n")
+    playbook = tmpdir.join('main.yml')
+    playbook.write("- hosts: node1\n  gather_facts: no\n"
+                   "  tasks:\n    - debug: msg=ok\n")
+    runner = execute.AnsibleRunner(str(inventory))
+    monkeypatch.setattr(ansible_config, 'get_controller_resources',
+                        lambda: (2, 4096))
+    manager = ansible_config.AnsibleConfigManager(str(tmpdir))
+
+    # not tuned by default
+    with manager.autotune(runner.inventory):
+        assert 'ANSIBLE_FORKS' not in os.environ
+
+    monkeypatch.setenv('IR_ANSIBLE_AUTOTUNE', 'yes')
+    with manager.autotune(runner.inventory):
+        assert os.environ['ANSIBLE_FORKS'] == '8'
+        assert 'ControlPersist=600s' in os.environ['ANSIBLE_SSH_ARGS']
+        assert runner.run(str(playbook)).rc == 0
+        assert C.DEFAULT_FORKS == 8
+    assert 'ANSIBLE_FORKS' not in os.environ
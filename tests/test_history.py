@@ -0,0 +1,153 @@
+import time
+
+import pytest
+
+from infrared.core import history
+
+
+@pytest.fixture
+def run_history(tmpdir):
+    return history.RunHistory(str(tmpdir.join(history.HISTORY_FILE_NAME)))
+
+
+def test_history_empty(run_history):
+    """Verify history without database doesn't create it on queries. """
+    assert run_history.list() == []
+    assert run_history.summary() == []
+
+
+def test_history_runs(run_history):
+    """Verify runs are recorded and filtered. """
+    first = run_history.start('virsh', vars_hash='a', playbook_hash='b',
+                              command='infrared virsh')
+    run_history.finish(first, 0, output_files={'log_file': '/tmp/log'})
+    second = run_history.start('tempest')
+    run_history.finish(second, 2, failed_hosts=['tester-0'])
+    third = run_history.start('virsh')
+    run_history.finish(third)
+    fourth = run_history.start('virsh')
+
+    runs = run_history.list()
+    assert [run['id'] for run in runs] == [fourth, third, second, first]
+    assert [run['status'] for run in runs] == [
+        'running', 'error', 'failed', 'passed']
+    assert runs[2]['failed_hosts'] == ['tester-0']
+    assert runs[3]['output_files'] == {'log_file': '/tmp/log'}
+    assert runs[3]['command'] == 'infrared virsh'
+    assert runs[0]['duration'] is None
+
+    assert [run['id'] for run in run_history.list(plugin='virsh',
+                                                  limit=2)] == [fourth, third]
+    assert [run['id'] for run in run_history.list(
+        status='failed')] == [second]
+    assert run_history.list(since=time.time() + 60) == []
+    assert len(run_history.list(until=time.time() + 60)) == 4
+
+    summary = dict((stat['plugin'], stat) for stat in run_history.summary())
+    assert (summary['virsh']['runs'], summary['virsh']['passed'],
+            summary['virsh']['failed']) == (3, 1, 1)
+    assert summary['tempest']['average'] is None
+    assert summary['virsh']['minimum'] == summary['virsh']['maximum']
+
+
+def test_history_not_writable(tmpdir):
+    """Verify run is not failed when history can't be written. """
+    run_history = history.RunHistory(str(tmpdir.join('missing', 'db')))
+
+    run_id = run_history.start('virsh')
+    assert run_id is None
+    run_history.finish(run_id, 0)
+
+
+def test_tree_hash(tmpdir):
+    """Verify tree hash depends on files content & names only. """
+    tmpdir.join('main.yml').write('- hosts: all')
+    tmpdir.mkdir('roles').join('main.yml').write('- debug:')
+    initial = history.get_tree_hash(str(tmpdir))
+
+    tmpdir.mkdir('.git').join('HEAD').write('ref')
+    assert history.get_tree_hash(str(tmpdir)) == initial
+
+    tmpdir.join('roles', 'main.yml').write('- fail:')
+    assert history.get_tree_hash(str(tmpdir)) != initial
+
+
+def test_git_revision(tmpdir):
+    """Verify the git revision marks the changed plugin files. """
+    import git
+
+    plugin_dir = tmpdir.mkdir('plugin')
+    assert history.get_git_revision(str(plugin_dir)) is None
+
+    repo = git.Repo.init(str(tmpdir))
+    plugin_dir.join('main.yml').write('- hosts: all')
+    tmpdir.join('README').write('plugins')
+    repo.index.add([str(plugin_dir.join('main.yml')),
+                    str(tmpdir.join('README'))])
+    author = git.Actor('test', 'test@example.com')
+    commit = repo.index.commit('plugins', author=author, committer=author)
+    assert history.get_git_revision(str(plugin_dir)) == commit.hexsha
+
+    # only the changes of the plugin files count
+    tmpdir.join('README').write('changed')
+    assert history.get_git_revision(str(plugin_dir)) == commit.hexsha
+    plugin_dir.join('roles.yml').write('- debug:')
+    assert history.get_git_revision(str(plugin_dir)) == \
+        commit.hexsha + '-dirty'
+
+
+def test_vars_hash():
+    assert history.get_vars_hash({'a': 1, 'b': {'c': 2}}) == \
+        history.get_vars_hash({'b': {'c': 2}, 'a': 1})
+    assert history.get_vars_hash({'a': 1}) != history.get_vars_hash({'a': 2})
+
+
+@pytest.mark.parametrize("value, expected", [
+    ('2020-01-31', (2020, 1, 31, 0, 0)),
+    ('2020-01-31 13:30', (2020, 1, 31, 13, 30)),
+    ('2020-01-31T13:30:15', (2020, 1, 31, 13, 30)),
+])
+def test_parse_time(value, expected):
+    assert time.localtime(history.parse_time(value))[:5] == expected
+
+
+def test_parse_time_ago():
+    assert abs(history.parse_time('2h') - (time.time() - 7200)) < 5
+    assert abs(history.parse_time('7d') - (time.time() - 604800)) < 5
+    with pytest.raises(ValueError):
+        history.parse_time('yesterday')
+
+
+def test_history_find_passed(run_history):
+    """Verify the latest run with the same hashes is found if passed. """
+    run_id = run_history.start('virsh', vars_hash='a', playbook_hash='b',
+                               inventory_hash='c')
+    run_history.finish(run_id, 0)
+    run_history.finish(run_history.start(
+        'virsh', vars_hash='x', playbook_hash='b', inventory_hash='c'), 2)
+    run_history.start('virsh', vars_hash='a', playbook_hash='b',
+                      inventory_hash='c')
+
+    assert run_history.find_passed('virsh', 'a', 'b', 'c')['id'] == run_id
+    assert run_history.find_passed('virsh', 'a', 'b', 'd') is None
+    assert run_history.find_passed('virsh', 'x', 'b', 'c') is None
+    assert run_history.find_passed('tempest', 'a', 'b', 'c') is None
+
+    run_history.finish(run_history.start(
+        'virsh', vars_hash='a', playbook_hash='b', inventory_hash='c'), 2)
+    assert run_history.find_passed('virsh', 'a', 'b', 'c') is None
+
+
+def test_history_find_passed_args(run_history):
+    """Verify the passed partial run doesn't stand for the full run. """
+    partial_hash = history.get_args_hash(['--tags=install'])
+    run_history.finish(run_history.start(
+        'virsh', vars_hash='a', playbook_hash='b', inventory_hash='c',
+        args_hash=partial_hash), 0)
+
+    full_hash = history.get_args_hash([])
+    assert run_history.find_passed('virsh', 'a', 'b', 'c', full_hash) is None
+    assert run_history.find_passed('virsh', 'a', 'b', 'c', partial_hash)
+    assert full_hash != history.get_args_hash([], resume=True)
+    assert partial_hash == history.get_args_hash(['--tags=install'],
+                                                 resume=False)
@@ -0,0 +1,241 @@
+import os
+
+import pytest
+
+from infrared.core.services import CoreServices
+from infrared.core.utils import exceptions
+from infrared import api
+from infrared import pipeline
+import tests
+from tests.test_workspace import workspace_manager_fixture, test_workspace  # noqa
+
+EXAMPLE_PLUGIN_DIR = os.path.join(
+    os.path.abspath(os.path.dirname(tests.__file__)), 'example')
+
+
+@pytest.fixture
+def plugins_fixture(mocker):
+    """Makes the example plugin the only installed plugin. """
+    from infrared.core.services import plugins
+    example = plugins.InfraredPlugin(plugin_dir=EXAMPLE_PLUGIN_DIR)
+    plugins_manager = mocker.Mock(PLUGINS_DICT={'example': example})
+    plugins_manager.get_plugin.return_value = example
+    mocker.patch.object(CoreServices, 'plugins_manager',
+                        return_value=plugins_manager)
+    yield example
+
+
+@pytest.fixture
+def pipeline_file(tmpdir):
+    """Returns the function writing the pipeline file. """
+    def write(content):
+        pipeline_path = tmpdir.join('pipeline.yml')
+        pipeline_path.write(content)
+        return str(pipeline_path)
+    yield write
+
+
+@pytest.mark.parametrize("content", [
+    "",
+    "stages: []",
+    "- args: {foo-bar: val}",
+    "- plugin: example\n  args: val",
+    "- plugin: example\n- plugin: example",
+])
+def test_pipeline_invalid_file(pipeline_file, content):
+    with pytest.raises(exceptions.IRPipelineException):
+        pipeline.Pipeline.from_file(pipeline_file(content))
+
+
+def test_pipeline_stages(pipeline_file):
+    ir_pipeline = pipeline.Pipeline.from_file(pipeline_file(
+        "stages:\n"
+        "  - plugin: example\n"
+        "  - name: second\n"
+        "    plugin: example\n"))
+
+    assert [stage.name for stage in ir_pipeline.stages] == [
+        'example', 'second']
+    assert ir_pipeline.get_stages('second') == ir_pipeline.stages[1:]
+    assert ir_pipeline.get_stages('1') == ir_pipeline.stages
+    with pytest.raises(exceptions.IRPipelineException):
+        ir_pipeline.get_stages('third')
+
+
+@pytest.mark.parametrize("args, expected", [
+    (['--foo-bar', 'val'], ['--foo-bar', 'val']),
+    ({'foo-bar': 'val', 'flag': True}, ['--foo-bar=val', '--flag']),
+    ({'flag': False, 'verbose': 2}, ['--verbose', '--verbose']),
+    ({'extra-vars': {'key': 'val'}}, ['--extra-vars=key=val']),
+    ({'extra-vars': ['a=1', 'b=2']},
+     ['--extra-vars=a=1', '--extra-vars=b=2']),
+    ({'dictionary-val': {'key': 'val'}}, ['--dictionary-val=key:val']),
+    ({'nestedlist': ['a', 'b']}, ['--nestedlist=a,b']),
+])
+def test_stage_cli_args(plugins_fixture, args, expected):
+    ir_pipeline = pipeline.Pipeline([pipeline.Stage('stage', 'example',
+                                                    args)])
+    stage = ir_pipeline.stages[0]
+    stage.spec = ir_pipeline._get_spec('example')
+
+    assert stage.get_cli_args() == ['example'] + expected
+
+
+def test_pipeline_validate(plugins_fixture, pipeline_file, mocker,  # noqa
+                           workspace_manager_fixture, test_workspace):
+    """Verify all the stages are validated before any stage runs. """
+    workspace_manager_fixture.activate(test_workspace.name)
+    ir_pipeline = pipeline.Pipeline.from_file(pipeline_file(
+        "- name: valid\n"
+        "  plugin: example\n"
+        "  args: {foo-bar: val}\n"
+        "- name: unknown\n"
+        "  plugin: example\n"
+        "  args: {unknown-option: val}\n"
+        "- name: missing\n"
+        "  plugin: missing\n"))
+    run_stage = mocker.patch(
+        "infrared.api.InfraredPluginsSpec.spec_handler")
+
+    with pytest.raises(exceptions.IRPipelineException) as ex:
+        ir_pipeline.run(test_workspace)
+
+    assert "unknown, missing" in str(ex.value)
+    assert not run_stage.called
+
+
+@pytest.mark.parametrize("from_stage, keep_going, rc, statuses", [
+    (None, False, 2, ['passed', 'failed', 'skipped']),
+    (None, True, 2, ['passed', 'failed', 'passed']),
+    ('third', False, 0, ['skipped', 'skipped', 'passed']),
+])
+def test_pipeline_run(plugins_fixture, pipeline_file,  # noqa
+                      workspace_manager_fixture, test_workspace,
+                      from_stage, keep_going, rc, statuses):
+    """Verify the stages are run one by one. """
+    workspace_manager_fixture.activate(test_workspace.name)
+    ir_pipeline = pipeline.Pipeline.from_file(pipeline_file(
+        "- name: first\n"
+        "  plugin: example\n"
+        "  args: {foo-bar: val, dry-run: yes}\n"
+        "- name: second\n"
+        "  plugin: example\n"
+        "  args: [--foo-bar, fail]\n"
+        "- name: third\n"
+        "  plugin: example\n"
+        "  args: {foo-bar: val}\n"))
+
+    assert ir_pipeline.run(test_workspace, from_stage=from_stage,
+                           keep_going=keep_going) == rc
+    assert [stage.status for stage in ir_pipeline.stages] == statuses
+
+
+def test_pipeline_stage_inventory(plugins_fixture, pipeline_file,  # noqa
+                                  mocker, workspace_manager_fixture,
+                                  test_workspace, tmpdir):
+    """Verify every stage runs against the inventory it has selected. """
+    workspace_manager_fixture.activate(test_workspace.name)
+    for name in ('a', 'b'):
+        tmpdir.join('{}_hosts'.format(name)).write(
+            "host{} ansible_connection=local\n".format(name))
+    initial_inventory = os.path.realpath(test_workspace.inventory)
+    used = []
+
+    def ansible_playbook(**kwargs):
+        used.append((sorted(kwargs['runner'].inventory.hosts),
+                     os.path.realpath(test_workspace.inventory)))
+        return mocker.Mock(rc=0, failed_hosts=[], output_files={})
+
+    mocker.patch.object(api.execute, 'ansible_playbook',
+                        side_effect=ansible_playbook)
+    ir_pipeline = pipeline.Pipeline.from_file(pipeline_file(
+        "- {{name: first, plugin: example}}\n"
+        "- {{name: second, plugin: example, args: {{inventory: {a}}}}}\n"
+        "- {{name: third, plugin: example, args: {{inventory: {b}}}}}\n"
+        .format(a=tmpdir.join('a_hosts'), b=tmpdir.join('b_hosts'))))
+
+    assert ir_pipeline.run(test_workspace) == 0
+    # the validation of the stages doesn't switch the inventory
+    assert used[0][1] == initial_inventory
+    assert 'hosta' not in used[0][0] and 'hostb' not in used[0][0]
+    assert used[1][0] == ['hosta'] and used[1][1].endswith('a_hosts')
+    assert used[2][0] == ['hostb'] and used[2][1].endswith('b_hosts')
+
+
+def test_pipeline_incremental(plugins_fixture, pipeline_file,  # noqa
+                              mocker, workspace_manager_fixture,
+                              test_workspace):
+    """Verify the passed stages are skipped by the incremental pipeline. """
+    workspace_manager_fixture.activate(test_workspace.name)
+    playbook = mocker.spy(api.execute, 'ansible_playbook')
+    content = ("- {name: first, plugin: example, args: {foo-bar: val}}\n"
+               "- {name: second, plugin: example, args: [--foo-bar, fail]}\n")
+
+    for _ in range(2):
+        ir_pipeline = pipeline.Pipeline.from_file(pipeline_file(content))
+        ir_pipeline.extra_args.append('--incremental')
+        assert ir_pipeline.run(test_workspace, keep_going=True)
+
+    # the failed stage is run again
+    assert playbook.call_count == 3
+
+
+def test_batch_validation(plugins_fixture, tmpdir,  # noqa
+                          workspace_manager_fixture, test_workspace):
+    """Verify the answers and pipeline files are validated in parallel. """
+    from infrared import validation
+
+    files = tmpdir.mkdir('files')
+    files.join('valid.ini').write("[example]\nfoo-bar = val\n")
+    files.join('required.ini').write("[example]\nreq-arg-a = yes\n")
+    files.join('other.ini').write("[other]\nfoo-bar = val\n")
+    files.join('ignored.txt').write("")
+    files.join('pipeline.yml').write(
+        "- {name: valid, plugin: example, args: {foo-bar: val}}\n"
+        "- {name: unknown, plugin: example, args: {unknown-option: val}}\n"
+        "- {name: missing, plugin: missing}\n")
+
+    batch = validation.BatchValidation(
+        validation.collect_files([str(files)]))
+    report = batch.validate_all(jobs=2)
+
+    assert [(os.path.basename(entry['file']), entry['stage'],
+             entry['valid']) for entry in report] == [
+        ('other.ini', None, False),
+        ('pipeline.yml', 'valid', True),
+        ('pipeline.yml', 'unknown', False),
+        ('pipeline.yml', 'missing', False),
+        ('required.ini', 'example', False),
+        ('valid.ini', 'example', True),
+    ]
+    assert [error['type'] for error in report[4]['errors']] == [
+        'IRRequiredArgsMissingException']
+    assert "unrecognized arguments" in report[2]['errors'][0]['message']
+
+
+def test_batch_validation_read_only(plugins_fixture, tmpdir,  # noqa
+                                    workspace_manager_fixture,
+                                    test_workspace):
+    """Verify the validation doesn't change the workspaces. """
+    from infrared import validation
+
+    workspace_manager_fixture.activate(test_workspace.name)
+    inventory = os.path.realpath(test_workspace.inventory)
+    workspace_files = sorted(os.listdir(test_workspace.path))
+    files = tmpdir.mkdir('files')
+    files.join('hosts').write("host ansible_connection=local\n")
+    files.join('answers.ini').write(
+        "[example]\nfoo-bar = val\ninventory = {}\n".format(
+            files.join('hosts')))
+    files.join('pipeline.yml').write(
+        "- {{name: valid, plugin: example, args: {{inventory: {}}}}}\n"
+        .format(files.join('hosts')))
+
+    report = validation.BatchValidation(
+        validation.collect_files([str(files)])).validate_all(jobs=2)
+
+    assert [entry['valid'] for entry in report] == [True, True]
+    assert os.path.realpath(test_workspace.inventory) == inventory
+    assert sorted(os.listdir(test_workspace.path)) == workspace_files
+    assert [workspace.name for workspace in
+            workspace_manager_fixture.list()] == [test_workspace.name]
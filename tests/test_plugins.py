@@ -18,6 +18,7 @@ from infrared.core.utils.exceptions import IRFailedToRemovePlugin
 from infrared.core.utils.exceptions import IRFailedToUpdatePlugin
 from infrared.core.utils.exceptions import IRUnsupportedSpecOptionType
 from infrared.core.utils.dict_utils import dict_insert
+from infrared.core.utils import yaml_io
 import infrared.core.services.plugins
 from infrared.core.services.plugins import InfraredPluginManager
 from infrared.core.services.plugins import InfraredPlugin
@@ -514,7 +515,7 @@ def test_add_plugin_from_git(plugin_manager_fixture, mocker):
 
     plugin_manager = plugin_manager_fixture()
 
-    mock_git = mocker.patch("infrared.core.services.plugins.git.Repo")
+    mock_git = mocker.patch("git.Repo")
     mock_os = mocker.patch("infrared.core.services.plugins.os")
     mock_os.path.exists.return_value = False
     mock_os.listdir.return_value = ["sample_plugin"]
@@ -560,7 +561,7 @@ def test_add_plugin_from_git_dirname_from_spec(plugin_manager_fixture, mocker):
 
     plugin_manager = plugin_manager_fixture()
 
-    mock_git = mocker.patch("infrared.core.services.plugins.git.Repo")
+    mock_git = mocker.patch("git.Repo")
     # use side effect to use copytree instead of original clone
     mock_git.clone_from.side_effect = clone_from_side_effect
     mock_os_path_exists = mocker.patch(
@@ -602,10 +603,9 @@ def test_add_plugin_from_git_exception(plugin_manager_fixture, mocker):
 
     plugin_manager = plugin_manager_fixture()
 
-    mock_git = mocker.patch("infrared.core.services.plugins.git")
-    mock_git.Repo.clone_from.side_effect = git.exc.GitCommandError(
+    mock_clone_from = mocker.patch("git.Repo.clone_from")
+    mock_clone_from.side_effect = git.exc.GitCommandError(
         "some_git_cmd", 1)
-    mock_git.exc.GitCommandError = git.exc.GitCommandError
     mock_tempfile = mocker.patch("infrared.core.services.plugins.tempfile")
     mock_shutil = mocker.patch("infrared.core.services.plugins.shutil")
     mock_os = mocker.patch("infrared.core.services.plugins.os")
@@ -874,7 +874,7 @@ def test_add_plugin_with_src_path(plugin_manager_fixture, mocker):
 
     plugin_manager = plugin_manager_fixture()
 
-    mock_git = mocker.patch("infrared.core.services.plugins.git.Repo")
+    mock_git = mocker.patch("git.Repo")
     # use side effect to use copytree instead of original clone
     mock_git.clone_from.side_effect = clone_from_side_effect
 
@@ -903,3 +903,144 @@ def test_add_plugin_with_src_path(plugin_manager_fixture, mocker):
         "the original plugin source."
 
 
+
+
+@pytest.fixture()
+def spec_cache_fixture(tmpdir):
+    """Yields a SpecCacheManager object storing specs in a temporary dir """
+    from infrared.core.services.spec_cache import SpecCacheManager
+    yield SpecCacheManager(str(tmpdir.join('spec_cache')))
+
+
+def test_plugin_spec_cache(tmpdir, spec_cache_fixture, mocker):
+    """Validates the plugin spec is parsed only once until it's changed
+
+    :param tmpdir: builtin pytest fixtures to create temporary files & dirs
+    :param spec_cache_fixture: Fixture object which yields SpecCacheManager
+    :param mocker: mocker fixture
+    """
+    plugin_dir = tmpdir.join('plugin')
+    shutil.copytree(os.path.join(SAMPLE_PLUGINS_DIR, 'type1_plugin1'),
+                    str(plugin_dir))
+    plugin_dict = get_plugin_spec_flatten_dict(str(plugin_dir))
+
+    spy = mocker.spy(SpecValidator, 'validate_from_file')
+
+    plugin = InfraredPlugin(str(plugin_dir), spec_cache=spec_cache_fixture)
+    assert plugin.name == plugin_dict['name']
+    assert spy.call_count == 1
+
+    cached_plugin = InfraredPlugin(str(plugin_dir),
+                                   spec_cache=spec_cache_fixture)
+    assert cached_plugin.name == plugin_dict['name']
+    assert cached_plugin.config == plugin.config
+    assert spy.call_count == 1, "Cached plugin spec was parsed again"
+
+    # changing the spec invalidates the cache
+    spec_file = plugin_dir.join(PLUGIN_SPEC)
+    spec_file.write(spec_file.read().replace(
+        plugin_dict['description'], 'New description'))
+    os.utime(str(spec_file), (0, 0))
+
+    changed_plugin = InfraredPlugin(str(plugin_dir),
+                                    spec_cache=spec_cache_fixture)
+    assert spy.call_count == 2
+    assert changed_plugin.description == 'New description'
+
+
+def test_plugin_spec_dict_cache(spec_cache_fixture, mocker):
+    """Validates the flattened spec dict is loaded from the spec cache
+
+    :param spec_cache_fixture: Fixture object which yields SpecCacheManager
+    :param mocker: mocker fixture
+    """
+    from infrared.api import InfraredPluginsSpec
+    plugin = InfraredPlugin('tests/example', spec_cache=spec_cache_fixture)
+
+    spec_dict = InfraredPluginsSpec(plugin).load_spec_dict()
+
+    spy = mocker.spy(yaml_io, 'load_file')
+    cached_spec_dict = InfraredPluginsSpec(plugin).load_spec_dict()
+    assert not spy.called, "Cached plugin spec was parsed again"
+    assert cached_spec_dict == spec_dict
+
+    # include_groups are resolved only once
+    parser_dict = cached_spec_dict['subparsers']['example']
+    assert 'include_groups' not in parser_dict
+    group_titles = [group['title'] for group in parser_dict['groups']]
+    assert len(group_titles) == len(set(group_titles))
+
+
+def test_plugin_spec_dict_resident_cache(tmpdir, spec_cache_fixture,
+                                         mocker):
+    """Validates the resident spec dict is kept in memory until changed
+
+    :param tmpdir: builtin pytest fixtures to create temporary files & dirs
+    :param spec_cache_fixture: Fixture object which yields SpecCacheManager
+    :param mocker: mocker fixture
+    """
+    from infrared.api import InfraredPluginsSpec
+    from infrared.core.services import spec_cache
+
+    plugin_dir = tmpdir.join('plugin')
+    shutil.copytree('tests/example', str(plugin_dir))
+    spec_cache_fixture.keep_resident()
+    plugin = InfraredPlugin(str(plugin_dir), spec_cache=spec_cache_fixture)
+    spec_dict = InfraredPluginsSpec(plugin).load_spec_dict()
+
+    spy = mocker.spy(spec_cache.pickle, 'load')
+    resident_spec_dict = InfraredPluginsSpec(plugin).load_spec_dict()
+    assert resident_spec_dict == spec_dict
+    assert not spy.called, "Resident spec was loaded from disk"
+
+    # the callers get their own copies of the resident spec
+    assert resident_spec_dict is not spec_dict
+    resident_spec_dict['subparsers'].clear()
+    assert InfraredPluginsSpec(plugin).load_spec_dict() == spec_dict
+
+    # changing the spec invalidates the resident spec
+    spec_file = plugin_dir.join(PLUGIN_SPEC)
+    spec_file.write(spec_file.read() + '\n')
+    InfraredPluginsSpec(plugin).load_spec_dict()
+    assert spy.called, "Stale resident spec was used"
+
+
+def test_plugin_spec_dict_cache_shared_groups(spec_cache_fixture, mocker):
+    """Validates the cached spec dict is dropped when shared groups change
+
+    :param spec_cache_fixture: Fixture object which yields SpecCacheManager
+    :param mocker: mocker fixture
+    """
+    from infrared.api import InfraredPluginsSpec
+    plugin = InfraredPlugin('tests/example', spec_cache=spec_cache_fixture)
+    InfraredPluginsSpec(plugin).load_spec_dict()
+
+    mocker.patch('infrared.core.services.spec_cache.SHARED_GROUPS_HASH',
+                 'changed')
+    spy = mocker.spy(yaml_io, 'load_file')
+    InfraredPluginsSpec(plugin).load_spec_dict()
+    assert spy.called, "Stale spec dict was loaded from the cache"
+
+
+def test_rebuild_spec_cache(plugin_manager_fixture, spec_cache_fixture):
+    """Validates the spec cache is dropped and filled again
+
+    :param plugin_manager_fixture: Fixture object which yields
+    InfraredPluginManger object
+    :param spec_cache_fixture: Fixture object which yields SpecCacheManager
+    """
+    plugin_manager = plugin_manager_fixture()
+    plugin_manager.spec_cache = spec_cache_fixture
+    plugin_dict = get_plugin_spec_flatten_dict(
+        os.path.join(SAMPLE_PLUGINS_DIR, 'type1_plugin1'))
+    plugin_manager.add_plugin(plugin_dict['dir'])
+    plugin = plugin_manager.get_plugin(plugin_dict['name'])
+
+    stale_file = os.path.join(spec_cache_fixture.cache_dir, 'stale.pickle')
+    with open(stale_file, 'w') as stream:
+        stream.write('stale')
+
+    plugin_manager.rebuild_spec_cache()
+
+    assert not os.path.exists(stale_file)
+    assert spec_cache_fixture.get(plugin.spec, 'config') == plugin.config
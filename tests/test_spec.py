@@ -178,3 +178,156 @@ def test_min_max_corrupted_spec(spec_fixture, workspace_manager_fixture,
 
     with pytest.raises(IRInvalidMinMaxRangeException):
         spec_manager.run_specs(args=['example', '--' + test_key + '=150'])
+
+
+def test_spec_helper_indexes(mocker):
+    """Verify the options are indexed once and shared by the lookups. """
+    from infrared.core.inspector import helper
+
+    spec_dict = {
+        'shared_groups': [{'title': 'Shared', 'options': {
+            'debug': {'action': 'store_true'}}}],
+        'subparsers': {
+            'first': {
+                'include_groups': ['Shared'],
+                'groups': [{'title': 'Group', 'options': dict(
+                    ('opt-{}'.format(i), {'type': 'Value'})
+                    for i in range(500))}],
+                'options': {'topology': {'type': 'KeyValueList'}},
+            },
+            'second': {
+                'include_groups': ['Shared'],
+                'options': {'opt-1': {'type': 'int'}},
+            },
+        },
+    }
+    collect = mocker.spy(helper.SpecDictHelper, '_get_all_options_spec')
+    spec_helper = helper.SpecDictHelper(spec_dict)
+    # indexed on the first lookup
+    assert collect.call_count == 0
+
+    for i in range(500):
+        assert spec_helper.get_option_spec(
+            'first', 'opt-{}'.format(i))['type'] == 'Value'
+    assert spec_helper.get_option_spec('second', 'opt-1')['type'] == 'int'
+    assert spec_helper.get_option_spec('second', 'opt-2') == {}
+    assert spec_helper.get_option_spec('missing', 'opt-1') == {}
+    assert spec_helper.get_option_spec('first', 'debug')[
+        'is_shared_group_option']
+    assert len(spec_helper.get_parser_option_specs('first')) == 502
+    assert spec_helper.get_parser_option_specs('missing') == ()
+    assert spec_helper.get_option_parsers('opt-1') == {'first', 'second'}
+    assert spec_helper.get_option_parsers('debug') == {'first', 'second'}
+    assert spec_helper.get_option_parsers('topology') == {'first'}
+    assert spec_helper.get_option_parsers('missing') == set()
+    assert [opt['name'] for opt in spec_helper.get_option_specs_by_type(
+        'first', ['KeyValueList', 'int'])] == ['topology']
+    assert len(list(spec_helper.iterate_option_specs())) == 504
+    # the lookups don't walk the spec dict again
+    assert collect.call_count == 2
+
+
+def test_spec_index_built_once(spec_fixture, workspace_manager_fixture,  # noqa
+                               test_workspace, mocker):
+    """Verify the options are indexed once for the repeated runs. """
+    from infrared.core.inspector import helper
+
+    collect = mocker.spy(helper.SpecDictHelper, '_get_all_options_spec')
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec_fixture)
+    workspace_manager_fixture.activate(test_workspace.name)
+
+    for _ in range(3):
+        assert spec_manager.run_specs(args=['example', '--dry-run']) is None
+    assert collect.call_count == 1
+
+
+def test_spec_validator_built_once(spec_fixture,  # noqa
+                                   workspace_manager_fixture,  # noqa
+                                   test_workspace, mocker):
+    """Verify the validation rules are compiled once for the repeated runs. """
+    from infrared.core.inspector import helper
+
+    build = mocker.spy(helper, 'ArgsValidator')
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec_fixture)
+    workspace_manager_fixture.activate(test_workspace.name)
+
+    for _ in range(3):
+        assert spec_manager.run_specs(args=['example', '--dry-run']) is None
+    assert build.call_count == 1
+
+
+def test_loaded_words_bounded(mocker):
+    """Verify the memo of the loaded condition words doesn't grow forever. """
+    from infrared.core.inspector import validator
+
+    mocker.patch.object(validator, '_LOADED_WORDS', {})
+    mocker.patch.object(validator, '_LOADED_WORDS_MAX_SIZE', 3)
+    for idx in range(10):
+        assert validator._load_word('value{}'.format(idx)) == \
+            'value{}'.format(idx)
+        assert len(validator._LOADED_WORDS) <= 3
+    assert validator._load_word('yes') == 'True'
+
+
+def test_all_violations_reported(spec_fixture, workspace_manager_fixture,  # noqa
+                                 test_workspace):
+    """Verify the violations of different kinds are reported together. """
+    from infrared.core.utils.exceptions import IRArgsValidationException
+
+    spec_manager = api.SpecManager()
+    spec_manager.register_spec(spec_fixture)
+    workspace_manager_fixture.activate(test_workspace.name)
+
+    with pytest.raises(IRArgsValidationException) as ex:
+        spec_manager.run_specs(args=['example', '--req-arg-a=yes',
+                                     '--value-len=testing',
+                                     '--value-minmax-int=300'])
+    assert [type(error) for error in ex.value.errors] == [
+        IRRequiredArgsMissingException, IRInvalidLengthException,
+        IRInvalidMinMaxRangeException]
+    assert "'uni-dep'" in ex.value.message
+    assert "value-len" in ex.value.message
+    assert "value-minmax-int" in ex.value.message
+
+
+def test_args_validator(mocker):
+    """Verify the spec is compiled into the validation rules once. """
+    from infrared.core.inspector import helper
+    from infrared.core.inspector import validator
+    from infrared.core.utils.exceptions import IRInvalidChoiceException
+
+    spec_helper = helper.SpecDictHelper({'subparsers': {'cmd': {'options': {
+        'mode': {'choices': ['a', 'b']},
+        'size': {'type': 'int', 'minimum': 1, 'maximum': 10},
+        'name': {'length': 3},
+        'flag': {'action': 'store_true', 'silent': ['target']},
+        'target': {'required_when': ['mode == b and size >= 2']},
+        'other': {'required': True},
+        'help-only': {'help': 'no checks'},
+    }}}})
+    safe_load = mocker.spy(validator.yaml_io, 'load')
+    args_validator = spec_helper.validator
+    assert spec_helper.validator is args_validator
+    assert [rule.name for rule in args_validator.rules['cmd']] == [
+        'mode', 'size', 'name', 'target', 'other']
+
+    errors = args_validator.get_errors({'cmd': dict(
+        mode='b', size=20, name='long', flag=False, other='x')})
+    assert [type(error) for error in errors] == [
+        IRRequiredArgsMissingException, IRInvalidLengthException,
+        IRInvalidMinMaxRangeException]
+    assert errors[0].missing_args == {'cmd': ['target']}
+    assert "Expected maximum should be 10" in errors[2].message
+
+    # the silenced option isn't required, the condition isn't parsed again
+    loads = safe_load.call_count
+    assert not args_validator.get_errors({'cmd': dict(
+        mode='b', size=2, flag=True, other='x')})
+    assert safe_load.call_count == loads
+
+    # a single kind of violations is raised as is
+    with pytest.raises(IRInvalidChoiceException):
+        args_validator.validate({'cmd': dict(mode='c', other='x')})
+    args_validator.validate({'cmd': dict(mode='a', other='x')})
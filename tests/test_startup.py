@@ -0,0 +1,87 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Cumulative import time budget (in seconds) of the infrared entry point.
+# It is very generous to avoid failures on slow machines, but still catches
+# heavy dependencies being imported back on the startup path.
+IMPORT_TIME_BUDGET = 2.0
+
+# modules which are needed by specific commands only
+HEAVY_MODULES = ['git', 'github', 'jsonschema', 'pip', 'pkg_resources',
+                 'tenacity', 'urllib3']
+
+
+@pytest.fixture
+def startup_env(tmpdir):
+    """Prepares environment to run infrared in a separate process.
+
+    Plugins config is created in advance, so no plugins get installed.
+    """
+    ir_home = tmpdir.mkdir("ir_home")
+    ir_home.join('.plugins.ini').write(
+        "[supported_types]\n"
+        "provision = Provisioning plugins\n"
+        "install = Installing plugins\n"
+        "test = Testing plugins\n"
+        "other = Other type plugins\n")
+
+    env = dict(os.environ)
+    env['IR_HOME'] = str(ir_home)
+    env['ANSIBLE_CONFIG'] = str(ir_home.join('ansible.cfg'))
+    yield env
+
+
+def get_imports(cli_args, env):
+    """Runs infrared with the given arguments and collects import times.
+
+    :param cli_args: list of infrared cli arguments
+    :param env: environment variables dict
+    :return: dict of top level imported module names and their cumulative
+        import time in seconds
+    """
+    proc = subprocess.Popen(
+        [sys.executable, '-X', 'importtime', '-m', 'infrared'] + cli_args,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env,
+        universal_newlines=True)
+    _, err = proc.communicate()
+    assert proc.returncode == 0, err
+
+    imports = {}
+    for line in err.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, module = line.split('|')
+        if not cumulative.strip().isdigit():
+            # header line
+            continue
+        imports[module.strip()] = (
+            int(cumulative) / 1000000.0,
+            len(module) - len(module.lstrip()) == 1)
+    return imports
+
+
+def test_version_import_time(startup_env):
+    """Verify the infrared startup doesn't import heavy dependencies. """
+    imports = get_imports(['--version'], startup_env)
+
+    assert 'infrared.main' in imports
+    loaded = [module for module in HEAVY_MODULES if module in imports]
+    assert not loaded, "Unexpected modules imported: {}".format(loaded)
+
+    total = sum(cumulative for cumulative, top_level in imports.values()
+                if top_level)
+    assert total < IMPORT_TIME_BUDGET, \
+        "Import time {:.3f}s exceeds {}s budget".format(
+            total, IMPORT_TIME_BUDGET)
+
+
+def test_workspace_list_imports(startup_env):
+    """Verify ansible isn't imported when it's not used. """
+    imports = get_imports(['workspace', 'list'], startup_env)
+
+    loaded = [module for module in HEAVY_MODULES + ['ansible']
+              if module in imports]
+    assert not loaded, "Unexpected modules imported: {}".format(loaded)
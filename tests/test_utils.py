@@ -61,3 +61,171 @@ def test_dict_merge_none_resolver(first, second, expected):
 
     dict_merge(first, second, conflict_resolver=ConflictResolver.greedy_resolver)
     assert first == expected
+
+
+def _reference_dict_merge(first, second, conflict_resolver):
+    """The recursive merge with the linear lists lookup. """
+    def unique_append_list_resolver(first, second, key):
+        if isinstance(first[key], list) and isinstance(second[key], list):
+            for item in second[key]:
+                if item not in first[key]:
+                    first[key].append(item)
+        else:
+            first[key] = second[key]
+
+    if conflict_resolver.__name__ == 'unique_append_list_resolver':
+        conflict_resolver = unique_append_list_resolver
+    for key in second:
+        if key in first and isinstance(first[key], dict) and \
+                isinstance(second[key], dict):
+            _reference_dict_merge(first[key], second[key], conflict_resolver)
+        elif key in first:
+            conflict_resolver(first, second, key)
+        else:
+            first[key] = second[key]
+
+
+def _random_value(rand, depth=0):
+    kind = rand.choice(['int', 'bool', 'float', 'str', 'none', 'list',
+                        'dict', 'tuple'] if depth < 3 else
+                       ['int', 'bool', 'str'])
+    if kind == 'int':
+        return rand.randint(0, 3)
+    if kind == 'bool':
+        return rand.choice([True, False])
+    if kind == 'float':
+        return rand.choice([0.0, 1.0, 2.5])
+    if kind == 'str':
+        return rand.choice('abc')
+    if kind == 'none':
+        return None
+    if kind == 'list':
+        return [_random_value(rand, depth + 1)
+                for _ in range(rand.randint(0, 6))]
+    if kind == 'tuple':
+        return tuple(_random_value(rand, depth + 1)
+                     for _ in range(rand.randint(0, 2)))
+    return dict((rand.choice('abcd'), _random_value(rand, depth + 1))
+                for _ in range(rand.randint(0, 4)))
+
+
+@pytest.mark.parametrize("resolver", [
+    'greedy_resolver', 'none_resolver', 'unique_append_list_resolver'])
+def test_dict_merge_equivalence(resolver):
+    """Verify the merge matches the recursive merge on random dicts. """
+    import copy
+    import random
+    from infrared.core.utils.dict_utils import dict_merge, ConflictResolver
+
+    rand = random.Random(resolver)
+    conflict_resolver = getattr(ConflictResolver, resolver)
+    for _ in range(500):
+        first = _random_value(rand, depth=2) if rand.random() < 0.1 else \
+            dict((key, _random_value(rand)) for key in 'abcde')
+        first = first if isinstance(first, dict) else {'a': first}
+        second = dict((key, _random_value(rand)) for key in 'abcdf')
+        expected = copy.deepcopy(first)
+        _reference_dict_merge(expected, copy.deepcopy(second),
+                              conflict_resolver)
+
+        dict_merge(first, second, conflict_resolver=conflict_resolver)
+        assert first == expected
+
+
+@pytest.mark.parametrize("first, second, expected", [
+    ([1, 'a', [1], {'a': [1]}], [True, 1.0, [True], {'a': [1.0]}, 'b'],
+     [1, 'a', [1], {'a': [1]}, 'b']),
+    ([[1, 2], (1, 2)], [(1, 2), [1, 2], {1, 2}, {1, 2}, (1, [2])],
+     [[1, 2], (1, 2), {1, 2}, (1, [2])]),
+    ([{'a': 1, 'b': 2}], [{'b': 2, 'a': 1}, {'a': 1}],
+     [{'a': 1, 'b': 2}, {'a': 1}]),
+])
+def test_unique_extend(first, second, expected):
+    from infrared.core.utils.dict_utils import unique_extend
+
+    unique_extend(first, second)
+    assert first == expected
+    assert [type(item) for item in first] == [type(item) for item in expected]
+
+
+def test_dict_merge_large_input():
+    """Merges the synthetic inputs with 100k elements. """
+    import time
+    from infrared.core.utils.dict_utils import dict_merge, ConflictResolver
+
+    size = 100000
+    first = dict(nodes=['node-{}'.format(i) for i in range(size)],
+                 images=[dict(name='image-{}'.format(i), tag=i % 7)
+                         for i in range(size)],
+                 settings=dict(('key-{}'.format(i), {'value': i})
+                               for i in range(size)))
+    second = dict(nodes=['node-{}'.format(i) for i in range(0, size * 2, 2)],
+                  images=[dict(name='image-{}'.format(i), tag=i % 7)
+                          for i in range(0, size * 2, 2)],
+                  settings=dict(('key-{}'.format(i), {'new': i})
+                                for i in range(0, size * 2, 2)))
+
+    started = time.time()
+    dict_merge(first, second,
+               conflict_resolver=ConflictResolver.unique_append_list_resolver)
+    duration = time.time() - started
+
+    assert len(first['nodes']) == len(first['images']) == size * 3 // 2
+    assert len(first['settings']) == size * 3 // 2
+    assert first['settings']['key-2'] == {'value': 2, 'new': 2}
+    # the lists lookup is linear, the quadratic one would take hours
+    assert duration < 30
+
+
+def test_dict_merge_deep_nesting():
+    """Verify the merge depth isn't limited by the recursion limit. """
+    import sys
+    from infrared.core.utils.dict_utils import dict_merge
+
+    depth = sys.getrecursionlimit() * 2
+    first, second = {}, {}
+    first_leaf, second_leaf = first, second
+    for _ in range(depth):
+        first_leaf = first_leaf.setdefault('key', {})
+        second_leaf = second_leaf.setdefault('key', {})
+    first_leaf['a'] = 1
+    second_leaf['b'] = 2
+
+    dict_merge(first, second)
+    assert first_leaf == {'a': 1, 'b': 2}
+
+
+def test_yaml_io_load_file(tmpdir):
+    """Verify the loaded files are cached until they are changed. """
+    from infrared.core.utils import yaml_io
+
+    yaml_file = tmpdir.join('vars.yml')
+    yaml_file.write("key: [1, 2]\n")
+    data = yaml_io.load_file(str(yaml_file))
+    data['key'].append(3)
+
+    # the cached content isn't changed by the callers
+    assert yaml_io.load_file(str(yaml_file)) == {'key': [1, 2]}
+
+    yaml_file.write("key: [1, 2, 3, 4]\n")
+    assert yaml_io.load_file(str(yaml_file)) == {'key': [1, 2, 3, 4]}
+
+
+@pytest.mark.parametrize("libyaml", ['yes', 'no'])
+@pytest.mark.parametrize("data", [
+    {'key': 'val', 'list': [1, 2.5, None, True], 'nested': {'empty': {}}},
+    [{'name': 'node-0', 'tags': ['a', 'b']}, 'text with: colon'],
+    'plain scalar',
+    10,
+])
+def test_yaml_io_dump(monkeypatch, libyaml, data):
+    """Verify the YAML output is the same as the one of safe_dump. """
+    from infrared.core.utils import yaml_io
+
+    monkeypatch.setenv('IR_YAML_LIBYAML', libyaml)
+    if libyaml == 'no':
+        assert yaml_io.get_loader() is yaml.SafeLoader
+
+    assert yaml_io.dump(data, default_flow_style=False) == yaml.safe_dump(
+        data, default_flow_style=False)
+    assert yaml_io.load(yaml_io.dump(data)) == data
@@ -1,4 +1,8 @@
+import json
 import os
+import re
+import shutil
+import time
 
 import py
 import pytest
@@ -353,3 +357,332 @@ def test_workspace_group_list(workspace_manager_fixture, test_workspace):
         workspace_name="test_group_wspc")
     test_groups = [('test_group', 'test_host')]
     assert group_lst_boo == test_groups
+
+
+def test_workspace_fact_cache(test_workspace, tmpdir):
+    """Verify the cached facts are listed and purged. """
+    from infrared.core import fact_cache
+
+    cache = fact_cache.FactCache(test_workspace, timeout=60)
+    cache.prepare()
+    for host, facts in (('controller-0', {'ansible_hostname': 'c0'}),
+                        ('compute-0', {'ansible_hostname': 'cp0',
+                                       'ansible_fqdn': 'cp0.local'})):
+        with open(os.path.join(cache.path, host), 'w') as fp:
+            json.dump(facts, fp)
+    old_time = time.time() - 120
+    os.utime(os.path.join(cache.path, 'compute-0'), (old_time, old_time))
+
+    hosts = cache.list()
+    assert [(host['host'], host['expired'], host['facts'])
+            for host in hosts] == [('compute-0', True, 2),
+                                   ('controller-0', False, 1)]
+    assert cache.get('controller-0') == {'ansible_hostname': 'c0'}
+    assert cache.get('missing') == {}
+
+    assert cache.purge(['compute-0', 'missing']) == ['compute-0']
+    assert [host['host'] for host in cache.list()] == ['controller-0']
+
+    # the inventory is switched
+    new_inventory = tmpdir.join('new_hosts')
+    new_inventory.write("localhost ansible_connection=local\n")
+    test_workspace.inventory = str(new_inventory)
+    cache.prepare()
+    assert cache.list() == []
+    assert os.path.isdir(cache.path)
+
+
+def test_workspace_list_get(tmpdir):
+    """Verify the workspaces are listed and got from the directories. """
+    manager = workspaces.WorkspaceManager(str(tmpdir))
+    manager.create('ws1')
+    manager.create('ws2')
+    manager.activate('ws1')
+    tmpdir.join('not_a_workspace').write('')
+
+    assert sorted(wkspc.name for wkspc in manager.list()) == ['ws1', 'ws2']
+    assert manager.get('ws2').path == str(tmpdir.join('ws2'))
+    for name in ('missing', 'active', 'not_a_workspace', '', None, '.', '..',
+                 os.path.join('ws1', 'ws2')):
+        assert manager.get(name) is None
+
+
+@pytest.mark.parametrize("index_enabled", ['yes', 'no'])
+def test_workspace_index(tmpdir, monkeypatch, index_enabled):
+    """Verify the workspaces index follows the workspaces changes. """
+    monkeypatch.setenv('IR_WORKSPACE_INDEX', index_enabled)
+    manager = workspaces.WorkspaceManager(str(tmpdir))
+    index_path = str(tmpdir.join(workspaces.INDEX_FILE_NAME))
+
+    ws1 = manager.create('ws1')
+    manager.create('ws2')
+    # created by the older infrared
+    tmpdir.mkdir('ws3').join('hosts').write('x' * 10)
+    assert os.path.exists(index_path) == (index_enabled == 'yes')
+    assert sorted(manager.index.load()) == (
+        ['ws1', 'ws2'] if index_enabled == 'yes' else [])
+
+    details = manager.get_details()
+    assert sorted(details) == ['ws1', 'ws2', 'ws3']
+    assert details['ws1']['size'] == 0
+    assert details['ws1']['last_used'] is None
+    assert details['ws3']['size'] == 10
+    assert details['ws3']['created'] == os.path.getmtime(
+        str(tmpdir.join('ws3')))
+
+    # the used workspace is measured again
+    with open(os.path.join(ws1.path, 'hosts'), 'w') as fp:
+        fp.write('x' * 5)
+    manager.activate('ws1')
+    details = manager.get_details()
+    assert details['ws1']['size'] == 5
+    assert (details['ws1']['last_used'] is not None) == (
+        index_enabled == 'yes')
+
+    created = details['ws1']['created']
+    time.sleep(0.01)
+    manager.cleanup('ws1')
+    manager.delete('ws2')
+    shutil.rmtree(str(tmpdir.join('ws3')))
+    details = manager.get_details()
+    assert sorted(details) == ['ws1']
+    assert details['ws1']['size'] == 0
+    assert details['ws1']['created'] > created
+    assert sorted(manager.index.load()) == (
+        ['ws1'] if index_enabled == 'yes' else [])
+
+    # the imported workspace is added
+    cwd = os.getcwd()
+    os.chdir(str(tmpdir))
+    try:
+        manager.export_workspace('ws1', 'exported')
+        manager.import_workspace('exported.tgz', 'ws4')
+    finally:
+        os.chdir(cwd)
+    assert sorted(manager.get_details()) == ['ws1', 'ws4']
+    if index_enabled == 'yes':
+        assert manager.index.load()['ws4']['last_used'] is not None
+
+
+@pytest.mark.parametrize("compression, threads", [
+    ('gz', 1), ('gz', 3), ('zst', None), ('none', None)])
+def test_workspace_export_streaming(tmpdir, monkeypatch, compression,
+                                    threads):
+    """Verify the workspace is streamed into the archive and imported. """
+    from infrared.core.services import workspace_archive
+
+    if compression == 'zst' and not any(
+            os.access(os.path.join(path, 'zstd'), os.X_OK)
+            for path in os.environ.get('PATH', '').split(os.pathsep)):
+        pytest.skip("zstd command isn't available")
+    # many gzip members
+    monkeypatch.setattr(workspace_archive, 'GZIP_BLOCK_SIZE', 4096)
+    manager = workspaces.WorkspaceManager(str(tmpdir.mkdir('workspaces')))
+    workspace = manager.create('exported')
+    inventory = tmpdir.join('hosts-new')
+    inventory.write("host-0 ansible_ssh_private_key_file={}\n".format(
+        os.path.join(workspace.path, 'id_rsa')))
+    workspace.inventory = str(inventory)
+    ws_dir = py.path.local(workspace.path)
+    ws_dir.mkdir('ansible_outputs').join('run.log').write('log')
+    ws_dir.join('image.qcow2').write('image')
+    ws_dir.mkdir('data').join('data.bin').write_binary(os.urandom(50000))
+    ws_dir.mkdir('empty')
+    files_before = sorted(str(path) for path in ws_dir.visit())
+
+    progress = []
+    cwd = os.getcwd()
+    os.chdir(str(tmpdir))
+    try:
+        manager.export_workspace(
+            'exported', 'archive', excludes=['ansible_outputs/', '*.qcow2'],
+            compression=compression, threads=threads,
+            progress_callback=lambda done, total: progress.append(
+                (done, total)))
+        archive = 'archive' + workspace_archive.ARCHIVE_EXTENSIONS[
+            compression]
+        # the exported workspace isn't changed
+        assert sorted(str(path) for path in ws_dir.visit()) == files_before
+        assert workspace.path in ws_dir.join('hosts-new').read()
+
+        manager.import_workspace(archive, None)
+    finally:
+        os.chdir(cwd)
+
+    assert progress[-1][0] == progress[-1][1]
+    imported = manager.get('archive')
+    imported_dir = py.path.local(imported.path)
+    assert sorted(path.relto(imported_dir)
+                  for path in imported_dir.visit()) == [
+        '.registry', 'data', 'data/data.bin', 'empty', 'hosts',
+        'hosts-new']
+    assert imported_dir.join('data', 'data.bin').read_binary() == \
+        ws_dir.join('data', 'data.bin').read_binary()
+    assert imported_dir.join('hosts').read() == \
+        "host-0 ansible_ssh_private_key_file={}\n".format(
+            os.path.join(imported.path, 'id_rsa'))
+
+
+def test_workspace_export_excludes():
+    from infrared.core.services.workspace_archive import is_excluded
+
+    excludes = ['ansible_outputs/', '*.qcow2', 'logs/*.log']
+    assert is_excluded('ansible_outputs', True, excludes)
+    assert is_excluded('nested/ansible_outputs', True, excludes)
+    assert not is_excluded('ansible_outputs', False, excludes)
+    assert is_excluded('images/disk.qcow2', False, excludes)
+    assert is_excluded('logs/run.log', False, excludes)
+    assert not is_excluded('other/logs/run.log', False, excludes)
+    assert not is_excluded('hosts', False, excludes)
+
+
+@pytest.fixture()
+def archive_server(tmpdir):
+    """Serves the files of the directory supporting the Range requests.
+
+    The connection is closed in the middle of the first response of every
+    file listed in the server 'broken' set.
+    """
+    import threading
+
+    from six.moves import BaseHTTPServer
+
+    served_dir = tmpdir.mkdir('served')
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            path = served_dir.join(self.path.lstrip('/'))
+            if not path.check(file=True):
+                self.send_error(404)
+                return
+            data = path.read_binary()
+            start = 0
+            match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+            if match and server.ranges:
+                start = int(match.group(1))
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                    start, len(data) - 1, len(data)))
+            else:
+                self.send_response(200)
+            self.send_header('Content-Length', str(len(data) - start))
+            self.end_headers()
+            server.requests.append((self.path, start))
+            if self.path in server.broken:
+                server.broken.remove(self.path)
+                self.wfile.write(data[start:start + len(data) // 2])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(data[start:])
+
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+    server.served_dir = served_dir
+    server.url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+    server.requests = []
+    server.broken = set()
+    server.ranges = True
+    thread = threading.Thread(target=server.serve_forever,
+                              kwargs=dict(poll_interval=0.05))
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _export_test_workspace(manager, tmpdir, compression='gz'):
+    """Exports the workspace with the inventory and the data file. """
+    from infrared.core.services import workspace_archive
+
+    workspace = manager.create('exported')
+    inventory = tmpdir.join('hosts-new')
+    inventory.write("host-0 ansible_ssh_private_key_file={}\n".format(
+        os.path.join(workspace.path, 'id_rsa')))
+    workspace.inventory = str(inventory)
+    py.path.local(workspace.path).join('data.bin').write_binary(
+        os.urandom(300000))
+    archive = str(tmpdir.join('served', 'exported'))
+    manager.export_workspace('exported', archive, compression=compression)
+    return workspace, archive + workspace_archive.ARCHIVE_EXTENSIONS[
+        compression]
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+@pytest.mark.parametrize("compression", ['gz', 'zst'])
+def test_workspace_import_url_resume(tmpdir, monkeypatch, archive_server,
+                                     ranges, compression):
+    """Verify the broken download is resumed and the archive verified. """
+    import hashlib
+
+    from infrared.core.services import workspace_archive
+
+    if compression == 'zst' and not any(
+            os.access(os.path.join(path, 'zstd'), os.X_OK)
+            for path in os.environ.get('PATH', '').split(os.pathsep)):
+        pytest.skip("zstd command isn't available")
+    monkeypatch.setattr(workspace_archive, 'DOWNLOAD_RETRY_DELAY', 0)
+    monkeypatch.setattr(workspace_archive, 'DOWNLOAD_CHUNK_SIZE', 4096)
+    manager = workspaces.WorkspaceManager(str(tmpdir.mkdir('workspaces')))
+    workspace, archive = _export_test_workspace(manager, tmpdir, compression)
+    with open(archive, 'rb') as stream:
+        sha256 = hashlib.sha256(stream.read()).hexdigest()
+    name = '/' + os.path.basename(archive)
+    archive_server.broken.add(name)
+    archive_server.ranges = ranges
+
+    manager.import_workspace(archive_server.url + name.lstrip('/'), 'new',
+                             sha256=sha256)
+
+    assert len(archive_server.requests) == 2
+    assert archive_server.requests[0] == (name, 0)
+    assert (archive_server.requests[1][1] > 0) == ranges
+    imported = manager.get('new')
+    assert manager.is_active('new')
+    assert py.path.local(imported.path).join('data.bin').read_binary() == \
+        py.path.local(workspace.path).join('data.bin').read_binary()
+    with open(imported.inventory) as stream:
+        assert stream.read() == \
+            "host-0 ansible_ssh_private_key_file={}\n".format(
+                os.path.join(imported.path, 'id_rsa'))
+
+
+def test_workspace_import_checksum_mismatch(tmpdir, archive_server):
+    """Verify the workspace isn't imported if the checksum doesn't match. """
+    manager = workspaces.WorkspaceManager(str(tmpdir.mkdir('workspaces')))
+    _, archive = _export_test_workspace(manager, tmpdir)
+
+    with pytest.raises(exceptions.IRFailedToImportWorkspace) as ex:
+        manager.import_workspace(archive, 'new', sha256='0' * 64)
+    assert 'sha256' in ex.value.message
+    assert manager.get('new') is None
+
+    with pytest.raises(exceptions.IRFailedToImportWorkspace):
+        manager.import_workspace(archive_server.url + 'missing.tgz')
+    assert manager.get('missing') is None
+
+
+def test_workspace_import_inventory_after_files(tmpdir):
+    """Verify the inventory link target preceding the link is updated. """
+    import tarfile
+
+    manager = workspaces.WorkspaceManager(str(tmpdir.mkdir('workspaces')))
+    src = tmpdir.mkdir('src')
+    src.join('local_hosts').write(
+        "localhost ansible_ssh_private_key_file={}/id_rsa\n".format(
+            workspaces.Workspace.path_placeholder))
+    os.symlink('./local_hosts', str(src.join('hosts')))
+    archive = str(tmpdir.join('archive.tgz'))
+    with tarfile.open(archive, 'w:gz') as tar:
+        tar.add(str(src.join('local_hosts')), './local_hosts')
+        tar.add(str(src.join('hosts')), './hosts')
+
+    manager.import_workspace(archive)
+    imported = manager.get('archive')
+    with open(imported.inventory) as stream:
+        assert stream.read() == \
+            "localhost ansible_ssh_private_key_file={}/id_rsa\n".format(
+                imported.path)